@@ -30,6 +30,7 @@ from usda_api import get_usda_api
 from who_immunization import who_api
 from child_identity_qr import register_child_identity_routes
 from mandi_price_api import register_mandi_routes
+from economy_report import register_economy_report_routes
 
 # Translation import (optional)
 try:
@@ -59,6 +60,7 @@ app.secret_key = 'nutrition-advisor-secret-key-2025'
 
 # Register extension routes
 register_mandi_routes(app)
+register_economy_report_routes(app)
 register_child_identity_routes(app)
 
 # Context processor
@@ -577,16 +579,26 @@ def api_chatbot_alternatives():
     """Get AI suggestions for ingredient alternatives"""
     try:
         data = request.get_json()
+        ingredient = data.get('ingredient', '')
+        reason = data.get('reason', 'general')
+        
+        # Same-category ingredients with the best nutrition per rupee
+        from nutrient_density import get_nutrient_density_index
+        alternatives = (get_nutrient_density_index(db.DATABASE_PATH).alternatives(
+            ingredient, k=5, cheaper=reason == 'cost') if ingredient else [])
         
         if not CHATBOT_AVAILABLE or not chatbot:
+            if alternatives:
+                return jsonify({
+                    'success': True,
+                    'suggestions': None,
+                    'alternatives': alternatives
+                })
             return jsonify({
                 'success': False,
                 'error': 'Chatbot not available'
             }), 503
         
-        ingredient = data.get('ingredient', '')
-        reason = data.get('reason', 'general')
-        
         if not ingredient:
             return jsonify({
                 'success': False,
@@ -597,7 +609,8 @@ def api_chatbot_alternatives():
         
         return jsonify({
             'success': True,
-            'suggestions': suggestions
+            'suggestions': suggestions,
+            'alternatives': alternatives
         })
         
     except Exception as e:
@@ -627,7 +640,9 @@ def api_cheapest_foods():
     analyzer = VillageEconomyAnalyzer()
     village = request.args.get('village', '')
     limit = int(request.args.get('limit', 20))
-    foods = analyzer.get_cheapest_nutritious_foods(village, limit)
+    category = request.args.get('category') or None
+    max_price = request.args.get('max_price', type=float)
+    foods = analyzer.get_cheapest_nutritious_foods(village, limit, category, max_price)
     return jsonify(foods)
 
 @app.route('/api/local-crops')
@@ -806,15 +821,17 @@ def ml_recommendations_page():
 
 @app.route('/api/ml/train-models', methods=['POST'])
 def ml_train_models():
-    """Train ML recommendation models"""
+    """Retrain ML recommendation models in the background"""
     try:
-        from ml_recommender import initialize_recommender
-        recommender = initialize_recommender()
+        from recommender_store import get_recommender_service
+        service = get_recommender_service()
+        started = service.retrain_async()
         return jsonify({
             'success': True,
-            'message': 'ML models trained successfully',
-            'models': ['collaborative_filtering', 'content_based_filtering', 'hybrid']
-        })
+            'message': 'ML model training started' if started else 'ML model training already running',
+            'models': ['collaborative_filtering', 'content_based_filtering', 'hybrid'],
+            'details': service.status()
+        }), 202
     except Exception as e:
         return jsonify({'success': False, 'error': str(e)}), 500
 
@@ -822,25 +839,15 @@ def ml_train_models():
 def ml_get_recommendations(child_id):
     """Get ML-based recommendations for a child"""
     try:
-        from ml_recommender import MealRecommendationSystem
-        recommender = MealRecommendationSystem()
-        recommender.train_all_models()
+        from recommender_store import get_recommender_service
+        service = get_recommender_service()
         
         rec_type = request.args.get('type', 'hybrid')
         top_n = int(request.args.get('top_n', 15))
         
-        if rec_type == 'collaborative':
-            recommendations = recommender.get_collaborative_recommendations(child_id, top_n)
-            results = [{'ingredient': name, 'score': float(score), 'source': 'collaborative'} 
-                      for name, score in recommendations]
-        elif rec_type == 'content':
-            recommendations = recommender.get_content_based_recommendations(child_id, top_n)
-            results = [{'ingredient': name, 'score': float(score), 'source': 'content-based'} 
-                      for name, score in recommendations]
-        else:  # hybrid
-            recommendations = recommender.get_hybrid_recommendations(child_id, top_n)
-            results = [{'ingredient': name, 'score': float(score), 'source': source} 
-                      for name, score, source in recommendations]
+        recommendations = service.recommend(child_id=child_id, recommendation_type=rec_type, top_n=top_n)
+        results = [{'ingredient': rec['ingredient_name'], 'score': rec['score'], 'source': rec['source']}
+                  for rec in recommendations]
         
         return jsonify({
             'success': True,
@@ -855,13 +862,12 @@ def ml_get_recommendations(child_id):
 def ml_find_similar_children(child_id):
     """Find children similar to given child"""
     try:
-        from ml_recommender import MealRecommendationSystem
-        recommender = MealRecommendationSystem()
-        recommender.build_child_feature_matrix()
-        recommender.train_collaborative_model()
+        from recommender_store import get_recommender
+        recommender = get_recommender()
         
         n_neighbors = int(request.args.get('n', 5))
-        similar = recommender.find_similar_children(child_id, n_neighbors)
+        similar = recommender.similar_children(child_id, top_n=n_neighbors,
+                                               village=request.args.get('village'))
         
         results = [{'child_id': int(cid), 'similarity_score': float(score)} 
                   for cid, score in similar]
@@ -878,9 +884,8 @@ def ml_find_similar_children(child_id):
 def ml_weekly_variety(child_id):
     """Get optimized weekly meal variety"""
     try:
-        from ml_recommender import MealRecommendationSystem
-        recommender = MealRecommendationSystem()
-        recommender.train_all_models()
+        from recommender_store import get_recommender
+        recommender = get_recommender()
         
         days = int(request.args.get('days', 7))
         weekly_plan = recommender.optimize_weekly_variety(child_id, days)
@@ -898,10 +903,8 @@ def ml_weekly_variety(child_id):
 def ml_predict_acceptance(child_id, ingredient_name):
     """Predict if child will accept an ingredient"""
     try:
-        from ml_recommender import MealRecommendationSystem
-        recommender = MealRecommendationSystem()
-        recommender.build_child_feature_matrix()
-        recommender.train_collaborative_model()
+        from recommender_store import get_recommender
+        recommender = get_recommender()
         
         acceptance = recommender.predict_ingredient_acceptance(child_id, ingredient_name)
         explanation = recommender.get_recommendation_explanation(child_id, ingredient_name)
@@ -921,8 +924,8 @@ def ml_predict_acceptance(child_id, ingredient_name):
 def ml_get_child_profile(child_id):
     """Get ML child profile with nutritional priorities"""
     try:
-        from ml_recommender import MealRecommendationSystem
-        recommender = MealRecommendationSystem()
+        from recommender_store import get_recommender
+        recommender = get_recommender()
         
         profile = recommender.prepare_child_profile(child_id)
         
@@ -17,6 +17,8 @@ from io import BytesIO
 import base64
 import os
 from dotenv import load_dotenv
+from prediction_cache import invalidate_prediction
+from database import notify_growth_measurement
 
 load_dotenv()
 
@@ -589,6 +591,10 @@ class ChildIdentityCard:
             
             conn.commit()
             
+            # A new measurement makes the cached malnutrition prediction stale
+            invalidate_prediction(child_id)
+            notify_growth_measurement(child_id)
+            
             # Update QR card with new data
             self.create_child_identity_card(child_id)
             
@@ -0,0 +1,192 @@
+"""
+Child Similarity Index
+Top-k nearest children by cosine similarity over the precomputed (scaled)
+child feature matrix of the meal recommender.
+
+Rows are L2-normalized once at build time and stored feature-major
+(features x children, contiguous float32), so a query is one streaming
+matrix-vector product plus a sampled-threshold top-k selection. Scoring
+runs in fixed-size row blocks with a running top-k, which keeps temporaries
+small for very large matrices and lets several query children be scored
+with one matrix multiply per block.
+
+An optional village pre-filter restricts scoring to the rows of one
+village (positions are grouped at build time).
+"""
+
+import numpy as np
+import pandas as pd
+
+
+# Rows scored per matrix multiply
+BLOCK_SIZE = 262144
+
+# Sampling stride for the top-k score threshold of a block
+SAMPLE_STRIDE = 64
+
+
+def _top_k(scores, k):
+    """Indices of the k largest scores, sorted descending"""
+    if k >= len(scores):
+        return np.argsort(-scores, kind='stable')
+    candidates = np.argpartition(-scores, k - 1)[:k]
+    return candidates[np.argsort(-scores[candidates], kind='stable')]
+
+
+def _block_top(scores, k):
+    """
+    Indices of (at least) the k largest scores of a block, unordered
+
+    The k-th largest score of a strided sample is a lower bound for the k-th
+    largest overall, so thresholding on it keeps every true top-k row while
+    skipping a full argpartition over the block.
+    """
+    if len(scores) <= k:
+        return np.arange(len(scores))
+    sample = scores[::SAMPLE_STRIDE]
+    if len(sample) > k:
+        threshold = np.partition(sample, len(sample) - k)[len(sample) - k]
+        candidates = np.flatnonzero(scores >= threshold)
+    else:
+        candidates = np.arange(len(scores))
+    if len(candidates) > k:
+        candidates = candidates[np.argpartition(-scores[candidates], k - 1)[:k]]
+    return candidates
+
+
+def _normalize(matrix):
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return matrix / norms
+
+
+class ChildSimilarityIndex:
+    """Cosine top-k index over child feature rows"""
+
+    def __init__(self, block_size=BLOCK_SIZE):
+        self.block_size = block_size
+        self.child_ids = np.empty(0, dtype=np.int64)
+        self.vectors_t = np.empty((0, 0), dtype=np.float32)  # features x children
+        self._positions = pd.Index([], dtype=np.int64)
+        self._codes = np.empty(0, dtype=np.int64)
+        self._villages = []
+        self._village_codes = {}
+        self._village_positions = {}
+
+    def __len__(self):
+        return len(self.child_ids)
+
+    # ==================== BUILD ====================
+
+    def build(self, profiles, villages=None):
+        """
+        Args:
+            profiles: DataFrame of scaled features indexed by child_id
+            villages: optional Series child_id -> village name
+        """
+        self.child_ids = np.asarray(profiles.index, dtype=np.int64)
+        self.vectors_t = np.ascontiguousarray(
+            _normalize(np.asarray(profiles.values, dtype=np.float64)).T, dtype=np.float32)
+        self._positions = pd.Index(self.child_ids)
+
+        self._codes = np.full(len(self.child_ids), -1, dtype=np.int64)
+        self._villages = []
+        self._village_codes = {}
+        self._village_positions = {}
+        if villages is not None:
+            codes, uniques = pd.factorize(villages.reindex(profiles.index))
+            self._codes = codes.astype(np.int64)
+            self._villages = list(uniques)
+            order = np.argsort(codes, kind='stable')
+            bounds = np.searchsorted(codes[order], np.arange(len(uniques) + 1))
+            for code, village in enumerate(uniques):
+                self._village_codes[village] = code
+                self._village_positions[code] = order[bounds[code]:bounds[code + 1]]
+        return self
+
+    # ==================== QUERY ====================
+
+    def position(self, child_id):
+        """Row of a child in the index, or None"""
+        pos = self._positions.get_indexer([int(child_id)])[0]
+        return None if pos < 0 else int(pos)
+
+    def vector(self, child_id):
+        """Normalized feature row of an indexed child, or None"""
+        pos = self.position(child_id)
+        return None if pos is None else self.vectors_t[:, pos]
+
+    def village_of(self, child_id):
+        pos = self.position(child_id)
+        if pos is None or self._codes[pos] < 0:
+            return None
+        return self._villages[self._codes[pos]]
+
+    def _candidates(self, village):
+        """Row positions to score (None = all rows)"""
+        if village is None:
+            return None
+        code = self._village_codes.get(village)
+        if code is None:
+            return np.empty(0, dtype=np.int64)
+        return self._village_positions[code]
+
+    def query(self, vector, k=5, village=None, exclude=None):
+        """
+        Most similar children to a feature vector
+
+        Args:
+            vector: raw scaled feature row (normalized here)
+            k: number of results
+            village: only consider children of this village
+            exclude: child_id to leave out (the query child itself)
+
+        Returns:
+            List of (child_id, cosine similarity), most similar first
+        """
+        return self.query_many(np.asarray(vector).reshape(1, -1), k, village,
+                               None if exclude is None else [exclude])[0]
+
+    def query_many(self, vectors, k=5, village=None, exclude=None):
+        """Top-k for several query rows at once (one matrix multiply per block)"""
+        queries = _normalize(np.asarray(vectors, dtype=np.float64)).astype(np.float32)
+        n_queries = len(queries)
+        excluded = [self.position(child_id) if child_id is not None else None
+                    for child_id in (exclude or [None] * n_queries)]
+
+        candidates = self._candidates(village)
+        n_rows = len(self.child_ids) if candidates is None else len(candidates)
+        # One spare slot per query for its excluded row
+        keep = min(k + 1, n_rows)
+        if keep == 0 or k <= 0:
+            return [[] for _ in range(n_queries)]
+
+        best_scores = [np.empty(0, dtype=np.float32) for _ in range(n_queries)]
+        best_positions = [np.empty(0, dtype=np.int64) for _ in range(n_queries)]
+        for start in range(0, n_rows, self.block_size):
+            if candidates is None:
+                positions = np.arange(start, min(start + self.block_size, n_rows))
+                block = self.vectors_t[:, start:start + self.block_size]
+            else:
+                positions = candidates[start:start + self.block_size]
+                block = self.vectors_t[:, positions]
+            scores = queries @ block
+
+            for row in range(n_queries):
+                top = _block_top(scores[row], keep)
+                merged_scores = np.concatenate([best_scores[row], scores[row, top]])
+                merged_positions = np.concatenate([best_positions[row], positions[top]])
+                if len(merged_scores) > keep:
+                    top = np.argpartition(-merged_scores, keep - 1)[:keep]
+                    merged_scores, merged_positions = merged_scores[top], merged_positions[top]
+                best_scores[row], best_positions[row] = merged_scores, merged_positions
+
+        results = []
+        for row, skip in enumerate(excluded):
+            scores, positions = best_scores[row], best_positions[row]
+            if skip is not None:
+                mask = positions != skip
+                scores, positions = scores[mask], positions[mask]
+            order = _top_k(scores, k)
+            results.append([(int(self.child_ids[positions[i]]), float(scores[i])) for i in order])
+        return results
@@ -3,11 +3,13 @@ Database module for Nutrition Advisor
 Handles SQLite and MySQL database operations for ingredients and meal plans
 """
 
+import json
 import sqlite3
 import pandas as pd
 from datetime import datetime
 import os
 from db_config import DB_TYPE, SQLITE_DB_PATH, MYSQL_CONFIG
+from nutrient_density import install_change_tracking
 
 # Try to import MySQL connector
 try:
@@ -134,9 +136,12 @@ def initialize_database():
             total_cost REAL,
             nutrition_score REAL,
             plan_data TEXT,
+            child_id INTEGER,
+            ingredients TEXT,
             created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
         )
     """)
+    _ensure_meal_plan_columns(conn)
     
     # Create feedback table
     cursor.execute("""
@@ -216,6 +221,12 @@ def initialize_database():
         )
     """)
     
+    # Latest-measurement lookups (prediction endpoint) walk this index
+    cursor.execute("""
+        CREATE INDEX IF NOT EXISTS idx_growth_child_date
+        ON growth_tracking (child_id, measurement_date)
+    """)
+    
     # Create dietary preferences table
     cursor.execute("""
         CREATE TABLE IF NOT EXISTS dietary_preferences (
@@ -291,6 +302,10 @@ def initialize_database():
             iron_level TEXT,
             calcium_level TEXT,
             vitamin_a_level TEXT,
+            measurement_id INTEGER,
+            model_version VARCHAR(64),
+            age_months INTEGER,
+            prediction_json TEXT,
             last_updated TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
             FOREIGN KEY (child_id) REFERENCES children(id)
         )
@@ -323,6 +338,9 @@ def initialize_database():
     if cursor.fetchone()[0] == 0:
         insert_health_information(conn)
     
+    # Lets the nutrient density index notice ingredient changes
+    install_change_tracking(conn)
+    
     conn.close()
     print("SUCCESS: Database initialized successfully!")
 
@@ -441,21 +459,77 @@ def get_ingredients_by_category():
     df = get_all_ingredients()
     return df.groupby('category')['name'].apply(list).to_dict()
 
+# Columns added to meal_plans for per-child plans (recommender acceptance index)
+MEAL_PLAN_COLUMNS = {'child_id': 'INTEGER', 'ingredients': 'TEXT'}
+_meal_plan_schema_checked = False
+
+def _ensure_meal_plan_columns(conn):
+    """Add child_id / ingredients to meal_plans on older databases"""
+    global _meal_plan_schema_checked
+    if _meal_plan_schema_checked:
+        return
+    cursor = conn.cursor()
+    if DB_TYPE == 'mysql':
+        cursor.execute("""
+            SELECT COLUMN_NAME FROM information_schema.COLUMNS
+            WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = 'meal_plans'
+        """)
+        existing = {row[0] for row in cursor.fetchall()}
+    else:
+        cursor.execute("PRAGMA table_info(meal_plans)")
+        existing = {row[1] for row in cursor.fetchall()}
+    
+    for column, sql_type in MEAL_PLAN_COLUMNS.items():
+        if column not in existing:
+            cursor.execute(f"ALTER TABLE meal_plans ADD COLUMN {column} {sql_type}")
+    conn.commit()
+    cursor.close()
+    _meal_plan_schema_checked = True
+
+_meal_plan_listeners = []
+
+def add_meal_plan_listener(callback):
+    """Register a callback for saved meal plans (e.g. the recommender's ingredient index)"""
+    if callback not in _meal_plan_listeners:
+        _meal_plan_listeners.append(callback)
+
+def notify_meal_plan_saved(plan_id, child_id, ingredients, nutrition_score):
+    """Run meal plan listeners; a failing listener never fails the write"""
+    for callback in list(_meal_plan_listeners):
+        try:
+            callback(plan_id, child_id, ingredients, nutrition_score)
+        except Exception as e:
+            print(f"[WARNING] Meal plan listener failed for plan {plan_id}: {e}")
+
 def save_meal_plan(plan_name, budget, num_children, age_group, total_cost, 
-                   nutrition_score, plan_data):
-    """Save a generated meal plan to database"""
+                   nutrition_score, plan_data, child_id=None, ingredients=None):
+    """
+    Save a generated meal plan to database
+    
+    child_id / ingredients (JSON list or dict of ingredient names) are set
+    for plans made for one child; they feed the recommender.
+    """
+    if ingredients is not None and not isinstance(ingredients, str):
+        ingredients = json.dumps(ingredients)
+    
     conn = get_connection()
-    cursor = conn.cursor()
+    _ensure_meal_plan_columns(conn)
+    cursor, placeholder = get_cursor(conn)
+    placeholders = ', '.join([placeholder] * 9)
     
-    cursor.execute("""
+    cursor.execute(f"""
         INSERT INTO meal_plans 
-        (plan_name, budget, num_children, age_group, total_cost, nutrition_score, plan_data)
-        VALUES (?, ?, ?, ?, ?, ?, ?)
-    """, (plan_name, budget, num_children, age_group, total_cost, nutrition_score, plan_data))
+        (plan_name, budget, num_children, age_group, total_cost, nutrition_score, plan_data,
+         child_id, ingredients)
+        VALUES ({placeholders})
+    """, (plan_name, budget, num_children, age_group, total_cost, nutrition_score, plan_data,
+          child_id, ingredients))
     
     plan_id = cursor.lastrowid
     conn.commit()
     conn.close()
+    
+    notify_meal_plan_saved(plan_id, child_id, ingredients, nutrition_score)
     return plan_id
 
 def get_recent_meal_plans(limit=10):
@@ -710,6 +784,23 @@ def search_health_info(search_term):
     return df
 
 # Growth Tracking Functions
+
+# Callbacks run after a growth measurement is written: callback(child_id)
+_growth_listeners = []
+
+def add_growth_listener(callback):
+    """Register a callback for new growth measurements (e.g. recommender updates)"""
+    if callback not in _growth_listeners:
+        _growth_listeners.append(callback)
+
+def notify_growth_measurement(child_id):
+    """Run growth listeners; a failing listener never fails the write"""
+    for callback in list(_growth_listeners):
+        try:
+            callback(child_id)
+        except Exception as e:
+            print(f"[WARNING] Growth listener failed for child {child_id}: {e}")
+
 def add_growth_measurement(child_id, measurement_date, weight_kg, height_cm, 
                           head_circumference_cm=None, muac_cm=None, 
                           notes='', measured_by=''):
@@ -730,7 +821,13 @@ def add_growth_measurement(child_id, measurement_date, weight_kg, height_cm,
     
     conn.commit()
     measurement_id = cursor.lastrowid
+    
+    # A new measurement makes the cached malnutrition prediction stale
+    from prediction_cache import invalidate_prediction
+    invalidate_prediction(child_id, conn)
+    
     conn.close()
+    notify_growth_measurement(child_id)
     return measurement_id
 
 def get_child_growth_history(child_id):
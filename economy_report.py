@@ -0,0 +1,199 @@
+"""
+Village Economy Report
+Economy score, cheapest foods, spending trend, seasonal crops and
+recommendations for every village at once, for district-level exports.
+
+Spending and crops are one set-based query each over the precomputed
+aggregates (village_spending_monthly, crop_availability) on a single
+connection, grouped by village in SQL (window functions) or pandas, and
+cheapest foods come from the nutrient density index, instead of one
+VillageEconomyAnalyzer call and connection per village and section.
+Reports are then streamed per village as JSON or CSV.
+"""
+
+import csv
+import io
+import json
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+import village_economy as ve
+from nutrient_density import get_nutrient_density_index
+
+
+# Cheapest foods per village in a report (get_cost_effective_recommendations uses 5)
+TOP_FOODS = 5
+
+# Seasonal crops per village
+TOP_CROPS = 3
+
+CSV_COLUMNS = ['village', 'economy_score', 'junk_percentage', 'families_tracked', 'avg_monthly_spend',
+               'months_reported', 'cheapest_foods', 'local_crops', 'recommendations']
+
+
+def _json_default(value):
+    if isinstance(value, np.generic):
+        return value.item()
+    return str(value)
+
+
+def _records(df):
+    """DataFrame rows as dicts with NaN as None"""
+    return df.astype(object).where(df.notna(), None).to_dict('records')
+
+
+def _spending(conn, months):
+    start = datetime.now().date().replace(day=1) - pd.DateOffset(months=months - 1)
+    return pd.read_sql_query("""
+        SELECT village, month, year,
+               nutritious_sum as total_nutritious, junk_sum as total_junk, total_sum as total_spend,
+               families, junk_percentage
+        FROM village_spending_monthly
+        WHERE year * 100 + month_num >= ?
+        ORDER BY village, year DESC, month_num DESC
+    """, conn, params=[start.year * 100 + start.month])
+
+
+def _cheapest_foods(top_n):
+    """Best nutrition per rupee per village, from the nutrient density index"""
+    index = get_nutrient_density_index(ve.DB_PATH)
+    foods = [food for village in index.villages()
+             for food in index.top_k(top_n, market=village, profile='economy')]
+    df = pd.DataFrame(foods, columns=['village', 'ingredient_name', 'price', 'calories_per_100g',
+                                      'protein_per_100g', 'category', 'score'])
+    return df.rename(columns={'price': 'avg_price', 'score': 'nutrition_per_rupee'})
+
+
+def _local_crops(conn, top_n):
+    return pd.read_sql_query("""
+        SELECT village, crop_name, season, avg_price_per_kg, nutrition_score
+        FROM (
+            SELECT lc.village, lc.crop_name, lc.season, lc.avg_price_per_kg, lc.nutrition_score,
+                   ROW_NUMBER() OVER (PARTITION BY lc.village ORDER BY lc.nutrition_score DESC) as rank
+            FROM crop_availability ca
+            JOIN local_crops lc ON lc.id = ca.crop_id
+            WHERE ca.month = ? AND lc.village IS NOT NULL
+        )
+        WHERE rank <= ?
+        ORDER BY village, rank
+    """, conn, params=[datetime.now().strftime('%B'), top_n])
+
+
+def _economy_scores(spending):
+    """Per-village score as in calculate_nutrition_economy_score"""
+    if spending.empty:
+        return {}
+    grouped = spending.groupby('village').agg(
+        junk_percentage=('junk_percentage', 'mean'),
+        families=('families', 'sum'),
+        avg_monthly_spend=('total_spend', 'mean'),
+        months=('month', 'size'),
+    )
+    return {
+        village: {
+            'score': round(max(0, 100 - row.junk_percentage), 1),
+            'junk_percentage': round(row.junk_percentage, 1),
+            'total_families_tracked': int(row.families),
+            'avg_monthly_spend': round(row.avg_monthly_spend, 2),
+            'months_reported': int(row.months),
+        }
+        for village, row in grouped.iterrows()
+    }
+
+
+def iter_village_reports(months=6, top_foods=TOP_FOODS, top_crops=TOP_CROPS, conn=None):
+    """
+    Yield one report dict per village (sorted by name)
+
+    All sections are computed up front with one query each; only the
+    per-village assembly happens while iterating.
+    """
+    own_conn = conn is None
+    if own_conn:
+        ve.initialize_economy_tables()
+        conn = ve.get_connection()
+    try:
+        spending = _spending(conn, months)
+        crops = _local_crops(conn, max(top_crops, 3))
+    finally:
+        if own_conn:
+            conn.close()
+
+    foods = _cheapest_foods(max(top_foods, 5))
+    scores = _economy_scores(spending)
+    spending_by_village = dict(tuple(spending.groupby('village')))
+    foods_by_village = dict(tuple(foods.groupby('village')))
+    crops_by_village = dict(tuple(crops.groupby('village')))
+    villages = sorted(set(scores) | set(foods_by_village) | set(crops_by_village))
+
+    empty_foods, empty_crops = foods.iloc[0:0], crops.iloc[0:0]
+    for village in villages:
+        village_foods = foods_by_village.get(village, empty_foods)
+        village_crops = crops_by_village.get(village, empty_crops)
+        trend = spending_by_village.get(village)
+        yield {
+            'village': village,
+            'economy_score': scores.get(village),
+            'cheapest_foods': _records(village_foods.head(top_foods).drop(columns='village')),
+            'spending_trend': [] if trend is None else _records(trend.drop(columns='village')),
+            'local_crops': _records(village_crops.head(top_crops).drop(columns='village')),
+            'recommendations': ve.build_recommendations(village_foods, village_crops),
+        }
+
+
+def stream_json(reports):
+    """JSON array of reports, one chunk per village"""
+    yield '['
+    for i, report in enumerate(reports):
+        yield (',' if i else '') + json.dumps(report, default=_json_default)
+    yield ']\n'
+
+
+def stream_csv(reports):
+    """One CSV row per village (lists joined with '; '), one chunk per row"""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+
+    def flush():
+        chunk = buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+        return chunk
+
+    writer.writerow(CSV_COLUMNS)
+    yield flush()
+    for report in reports:
+        score = report['economy_score'] or {}
+        writer.writerow([
+            report['village'],
+            score.get('score'),
+            score.get('junk_percentage'),
+            score.get('total_families_tracked'),
+            score.get('avg_monthly_spend'),
+            score.get('months_reported'),
+            '; '.join(f"{f['ingredient_name']} ({f['avg_price']:.2f}/kg)" for f in report['cheapest_foods']),
+            '; '.join(c['crop_name'] for c in report['local_crops']),
+            '; '.join(r['food'] for r in report['recommendations']),
+        ])
+        yield flush()
+
+
+def register_economy_report_routes(app):
+    """Register the all-villages economy export route"""
+    from flask import Response, jsonify, request, stream_with_context
+
+    @app.route('/api/village-economy/report')
+    def api_village_economy_report():
+        """All villages' economy report, streamed as JSON (default) or CSV"""
+        export_format = request.args.get('format', 'json').lower()
+        if export_format not in ('json', 'csv'):
+            return jsonify({'success': False, 'error': 'format must be json or csv'}), 400
+        months = int(request.args.get('months', 6))
+        reports = iter_village_reports(months=months)
+
+        if export_format == 'csv':
+            return Response(stream_with_context(stream_csv(reports)), mimetype='text/csv', headers={
+                'Content-Disposition': 'attachment; filename=village_economy_report.csv'})
+        return Response(stream_with_context(stream_json(reports)), mimetype='application/json')
@@ -17,6 +17,8 @@ load_dotenv()
 
 # Import custom modules
 import database as db
+from prediction_cache import get_prediction_cache, model_version_of
+from request_tracing import get_tracer, timing_headers_enabled
 import meal_optimizer as mo
 from utils import export_to_pdf, get_food_emoji, format_currency
 from usda_api import get_usda_api
@@ -56,6 +58,13 @@ except (Exception, KeyboardInterrupt, SystemExit) as e:
     class MandiPriceAPI:
         pass
 
+try:
+    from economy_report import register_economy_report_routes
+except (Exception, KeyboardInterrupt, SystemExit) as e:
+    print(f"WARNING: Village economy report not available: {e}")
+    def register_economy_report_routes(app):
+        pass
+
 try:
     from child_identity_qr import register_child_identity_routes
     CHILD_ID_AVAILABLE = True
@@ -66,18 +75,20 @@ except (Exception, KeyboardInterrupt, SystemExit) as e:
         pass
 
 # Import malnutrition predictor (trained Random Forest model with fallback)
+# Models are memory-mapped on first prediction; with PRELOAD_MODELS=1 and
+# gunicorn --preload they are mapped once in the master and shared by workers
 MALNUTRITION_PREDICTOR = None
 PREDICTOR_ERROR = None
 
 try:
-    import sys
-    # Force reload to ensure we get the latest trained model
-    if 'malnutrition_predictor' in sys.modules:
-        del sys.modules['malnutrition_predictor']
     from malnutrition_predictor import get_predictor
-    MALNUTRITION_PREDICTOR = get_predictor()
-    predictor_type = "fallback (WHO z-score)" if MALNUTRITION_PREDICTOR.use_fallback else "trained Random Forest"
-    print(f"[OK] Malnutrition predictor loaded successfully ({predictor_type})")
+    from model_loader import preload_enabled
+    MALNUTRITION_PREDICTOR = get_predictor(lazy=not preload_enabled())
+    if MALNUTRITION_PREDICTOR.is_loaded:
+        predictor_type = "fallback (WHO z-score)" if MALNUTRITION_PREDICTOR.use_fallback else "trained Random Forest"
+        print(f"[OK] Malnutrition predictor preloaded ({predictor_type}) in {MALNUTRITION_PREDICTOR.load_time_ms} ms")
+    else:
+        print("[OK] Malnutrition predictor ready (models load on first prediction)")
 except Exception as e:
     print(f"[ERROR] Malnutrition predictor failed to load: {e}")
     PREDICTOR_ERROR = str(e)
@@ -92,15 +103,42 @@ except Exception as e:
         PREDICTOR_ERROR = f"Main: {str(e)}, Fallback: {str(e2)}"
         MALNUTRITION_PREDICTOR = None
 
+
+def active_malnutrition_predictor():
+    """Predictor serving traffic - follows registry promotions / hot swaps"""
+    if hasattr(MALNUTRITION_PREDICTOR, 'get_load_stats'):
+        from malnutrition_predictor import get_active_predictor
+        return get_active_predictor()
+    return MALNUTRITION_PREDICTOR
+
+
 app = Flask(__name__)
 app.secret_key = os.environ.get('SECRET_KEY', 'nutrition-advisor-secret-key-2025')
 
 # Register Mandi Price API routes
 register_mandi_routes(app)
 
+# Register all-villages economy report export
+register_economy_report_routes(app)
+
 # Register Child Identity Card routes
 register_child_identity_routes(app)
 
+# Load persisted recommender artifacts (training only ever runs in the background)
+try:
+    from recommender_store import get_recommender_service
+    _recommender_status = get_recommender_service().status()
+    print(f"[OK] Recommender artifacts: trained_at={_recommender_status['trained_at'] or 'none yet'}")
+except Exception as e:
+    print(f"WARNING: Recommender artifacts not available: {e}")
+
+# Register model registry admin routes (versions, hot swap, shadow scoring)
+try:
+    from model_registry import register_model_admin_routes
+    register_model_admin_routes(app)
+except Exception as e:
+    print(f"WARNING: Model admin routes not available: {e}")
+
 # Initialize translation service
 translation_service = get_translation_service()
 
@@ -161,10 +199,12 @@ def health_check():
         # Check predictor status
         predictor_status = 'not_loaded'
         predictor_type = 'none'
+        model_loading = None
         if MALNUTRITION_PREDICTOR is not None:
             predictor_status = 'loaded'
-            if hasattr(MALNUTRITION_PREDICTOR, 'use_fallback'):
-                predictor_type = 'fallback' if MALNUTRITION_PREDICTOR.use_fallback else 'trained'
+            if hasattr(MALNUTRITION_PREDICTOR, 'get_load_stats'):
+                model_loading = active_malnutrition_predictor().get_load_stats()
+                predictor_type = model_loading['predictor_type'] or 'lazy'
             else:
                 predictor_type = 'fallback'
         
@@ -178,6 +218,9 @@ def health_check():
             'children_count': child_count,
             'malnutrition_predictor': predictor_status,
             'predictor_type': predictor_type,
+            'model_loading': model_loading,
+            'model_version': model_loading['model_version'] if model_loading else None,
+            'prediction_cache': get_prediction_cache().get_stats(),
             'timestamp': datetime.now().isoformat()
         }
         
@@ -306,7 +349,9 @@ def generate_plan():
             age_group=age_group,
             total_cost=meal_plan['total_cost'],
             nutrition_score=meal_plan['nutrition_score'],
-            plan_data=plan_data
+            plan_data=plan_data,
+            child_id=data.get('child_id'),
+            ingredients=selected_ingredients
         )
         
         # Store in session for later retrieval
@@ -844,14 +889,22 @@ def api_chatbot_alternatives():
         if not ingredient:
             return jsonify({'success': False, 'error': 'No ingredient provided'}), 400
         
+        # Same-category ingredients with the best nutrition per rupee
+        from nutrient_density import get_nutrient_density_index
+        alternatives = get_nutrient_density_index(db.DATABASE_PATH).alternatives(
+            ingredient, k=5, cheaper=reason == 'cost')
+        
         if not chatbot:
+            if alternatives:
+                return jsonify({'success': True, 'suggestions': None, 'alternatives': alternatives})
             return jsonify({'success': False, 'error': 'Chatbot not available'}), 500
         
         suggestions = chatbot.suggest_alternatives(ingredient, reason)
         
         return jsonify({
             'success': True,
-            'suggestions': suggestions
+            'suggestions': suggestions,
+            'alternatives': alternatives
         })
         
     except Exception as e:
@@ -882,7 +935,9 @@ def api_cheapest_foods():
     
     village = request.args.get('village', '')
     limit = int(request.args.get('limit', 20))
-    foods = analyzer.get_cheapest_nutritious_foods(village, limit)
+    category = request.args.get('category') or None
+    max_price = request.args.get('max_price', type=float)
+    foods = analyzer.get_cheapest_nutritious_foods(village, limit, category, max_price)
     
     return jsonify(foods)
 
@@ -1131,10 +1186,6 @@ def asha_get_nutrition_score(child_id):
 
 
 # Food Recognition endpoints removed
-        return jsonify({
-            'success': False,
-            'error': 'Food database not available'
-        }), 500
 
 
 # ========================================
@@ -1148,18 +1199,18 @@ def ml_recommendations_page():
 
 @app.route('/api/ml/train', methods=['POST'])
 def train_ml_models():
-    """Train ML recommendation models"""
+    """Retrain ML recommendation models in the background"""
     try:
-        from ml_recommender import MealRecommendationSystem
+        from recommender_store import get_recommender_service
         
-        recommender = MealRecommendationSystem()
-        result = recommender.train_models()
+        service = get_recommender_service()
+        started = service.retrain_async()
         
         return jsonify({
             'success': True,
-            'message': 'ML models trained successfully',
-            'details': result
-        })
+            'message': 'ML model training started' if started else 'ML model training already running',
+            'details': service.status()
+        }), 202
     except Exception as e:
         return jsonify({
             'success': False,
@@ -1170,13 +1221,13 @@ def train_ml_models():
 def get_ml_recommendations(child_id):
     """Get ML-powered recommendations for a child"""
     try:
-        from ml_recommender import MealRecommendationSystem
+        from recommender_store import get_recommender_service
         
-        recommender = MealRecommendationSystem()
+        service = get_recommender_service()
         rec_type = request.args.get('type', 'hybrid')
         top_n = int(request.args.get('top_n', 10))
         
-        recommendations = recommender.get_recommendations(
+        recommendations = service.recommend(
             child_id=child_id,
             recommendation_type=rec_type,
             top_n=top_n
@@ -1198,12 +1249,15 @@ def get_ml_recommendations(child_id):
 def get_similar_children(child_id):
     """Get similar children for collaborative filtering"""
     try:
-        from ml_recommender import MealRecommendationSystem
+        from recommender_store import get_recommender
         
-        recommender = MealRecommendationSystem()
+        recommender = get_recommender()
         top_n = int(request.args.get('top_n', 5))
+        village = request.args.get('village')
+        same_village = request.args.get('same_village', '').lower() in ('1', 'true', 'yes')
         
-        similar = recommender.find_similar_children(child_id, top_n=top_n)
+        similar = recommender.find_similar_children(child_id, top_n=top_n, village=village,
+                                                    same_village=same_village)
         
         return jsonify({
             'success': True,
@@ -1220,13 +1274,13 @@ def get_similar_children(child_id):
 def generate_weekly_variety():
     """Generate 7-day variety plan using ML"""
     try:
-        from ml_recommender import MealRecommendationSystem
+        from recommender_store import get_recommender
         
         data = request.json
         child_id = data.get('child_id')
         budget = data.get('budget', 2000)
         
-        recommender = MealRecommendationSystem()
+        recommender = get_recommender()
         weekly_plan = recommender.generate_weekly_variety(
             child_id=child_id,
             budget=budget
@@ -1246,13 +1300,13 @@ def generate_weekly_variety():
 def predict_meal_acceptance():
     """Predict meal acceptance rate using ML"""
     try:
-        from ml_recommender import MealRecommendationSystem
+        from recommender_store import get_recommender
         
         data = request.json
         child_id = data.get('child_id')
         ingredients = data.get('ingredients', [])
         
-        recommender = MealRecommendationSystem()
+        recommender = get_recommender()
         prediction = recommender.predict_meal_acceptance(
             child_id=child_id,
             ingredients=ingredients
@@ -1268,13 +1322,29 @@ def predict_meal_acceptance():
             'error': str(e)
         }), 500
 
+@app.route('/api/ml/status', methods=['GET'])
+def get_ml_status():
+    """Training timestamp, data watermark and staleness of the recommender artifacts"""
+    try:
+        from recommender_store import get_recommender_service
+        
+        service = get_recommender_service()
+        status = service.status()
+        status['stale'] = service.is_stale()
+        return jsonify({'success': True, 'status': status})
+    except Exception as e:
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 500
+
 @app.route('/api/ml/child-profile/<int:child_id>', methods=['GET'])
 def get_ml_child_profile(child_id):
     """Get ML-generated child profile"""
     try:
-        from ml_recommender import MealRecommendationSystem
+        from recommender_store import get_recommender
         
-        recommender = MealRecommendationSystem()
+        recommender = get_recommender()
         profile = recommender.prepare_child_profile(child_id)
         
         if not profile:
@@ -1365,254 +1435,182 @@ def malnutrition_prediction_page():
     """Malnutrition Risk Prediction page"""
     return render_template('malnutrition_prediction.html')
 
+def _age_in_months(dob):
+    """Age in (fractional) months from a date_of_birth stored as string, date or datetime"""
+    if isinstance(dob, str):
+        dob = datetime.strptime(dob[:10], '%Y-%m-%d').date()
+    elif isinstance(dob, datetime):
+        dob = dob.date()
+    return (datetime.now().date() - dob).days / 30.44
+
+
+def _format_malnutrition_prediction(child, age_months, result):
+    """Shape a predictor result the way the prediction page expects"""
+    # Map status to risk_level (Normal->low, Mild->medium, Moderate->high, Severe->critical)
+    status_to_risk = {
+        'Normal': 'low',
+        'Mild': 'medium',
+        'Moderate': 'high',
+        'Severe': 'critical'
+    }
+    
+    # Convert detailed predictions to frontend format
+    frontend_predictions = {}
+    for condition, details in result.get('predictions', {}).items():
+        status = details.get('status', 'Normal')
+        
+        # Calculate probability based on status
+        if status == 'Severe':
+            probability = result['probabilities'].get('severe', 0.05)
+        elif status == 'Moderate':
+            probability = result['probabilities'].get('moderate', 0.1)
+        elif status == 'Mild':
+            probability = 0.15
+        else:
+            probability = 0.02
+        
+        frontend_predictions[condition] = {
+            'risk_level': status_to_risk.get(status, 'low'),
+            'probability': probability,
+            'current_status': status != 'Normal',
+            'zscore': details.get('zscore', 0)
+        }
+    
+    return {
+        'success': True,
+        'child': {
+            'id': child['id'],
+            'name': child['name'],
+            'age_months': int(age_months),
+            'gender': child['gender']
+        },
+        'prediction': {
+            'nutrition_status': result['nutrition_status'],
+            'risk_level': result['risk_level'],
+            'confidence': result['confidence'],
+            'overall_risk': result['risk_level'],
+            'predictions': frontend_predictions,
+            'probabilities': result['probabilities'],
+            'recommendations': _generate_recommendations_for_result(result),
+            'z_scores': result.get('z_scores', {})
+        }
+    }
+
+
+PREDICT_TRACER = get_tracer('predict-malnutrition')
+
+
 @app.route('/api/predict-malnutrition/<int:child_id>', methods=['POST'])
 def predict_malnutrition(child_id):
     """Predict malnutrition risk for a child using trained CSV model"""
+    tracer = PREDICT_TRACER
+    trace = tracer.start()
+    
+    predictor = active_malnutrition_predictor()
+    if predictor is None:
+        tracer.error("Predictor not loaded: %s", PREDICTOR_ERROR or 'Unknown')
+        return jsonify({
+            'success': False,
+            'error': f'Malnutrition predictor not available. Error: {PREDICTOR_ERROR or "Unknown"}',
+            'details': 'The malnutrition prediction system failed to initialize. Please check server logs.'
+        }), 500
+    
     conn = None
-    cursor = None
     try:
-        print(f"[DEBUG] Starting prediction for child_id: {child_id}")
-        
-        # Use global predictor loaded at startup
-        if MALNUTRITION_PREDICTOR is None:
-            print("[ERROR] Predictor is None")
-            return jsonify({'success': False, 'error': 'Malnutrition predictor not available'}), 500
-        
-        print("[DEBUG] Predictor is available")
-        
-        # Get child data
         conn = db.get_connection()
-        print("[DEBUG] Database connection established")
         
-        cursor, placeholder = db.get_cursor(conn)
-        print(f"[DEBUG] Cursor obtained, placeholder: {placeholder}")
+        # Child and their latest measurement in one round trip
+        with trace.phase('db'):
+            cursor, placeholder = db.get_cursor(conn)
+            cursor.execute(f"""
+                SELECT c.id, c.name, c.date_of_birth, c.gender, c.village,
+                       g.id AS measurement_id, g.weight_kg, g.height_cm,
+                       g.measurement_date AS measured_date
+                FROM children c
+                LEFT JOIN growth_tracking g ON g.id = (
+                    SELECT g2.id FROM growth_tracking g2
+                    WHERE g2.child_id = c.id
+                    ORDER BY g2.measurement_date DESC, g2.id DESC
+                    LIMIT 1
+                )
+                WHERE c.id = {placeholder}
+            """, (child_id,))
+            child = db.dict_from_row(cursor.fetchone())
+            cursor.close()
+        tracer.trace("child %s row: %s", child_id, child)
         
-        query1 = f"""
-            SELECT id, name, date_of_birth, gender, village
-            FROM children WHERE id = {placeholder}
-        """
-        print(f"[DEBUG] Executing query1: {query1} with child_id={child_id}")
-        cursor.execute(query1, (child_id,))
-        child_row = cursor.fetchone()
-        print(f"[DEBUG] Child row fetched: {child_row}")
-        
-        if not child_row:
-            if cursor:
-                cursor.close()
-            if conn:
-                conn.close()
-            print("[ERROR] Child not found")
+        if not child:
             return jsonify({'success': False, 'error': 'Child not found'}), 404
-        
-        # Convert to dict
-        child = db.dict_from_row(child_row)
-        print(f"[DEBUG] Child data: {child}")
-        
-        # Get latest growth data
-        query2 = f"""
-            SELECT weight_kg, height_cm, measurement_date as measured_date
-            FROM growth_tracking
-            WHERE child_id = {placeholder}
-            ORDER BY measurement_date DESC
-            LIMIT 1
-        """
-        print(f"[DEBUG] Executing query2: {query2}")
-        cursor.execute(query2, (child_id,))
-        growth_row = cursor.fetchone()
-        print(f"[DEBUG] Growth row fetched: {growth_row}")
-        
-        if not growth_row:
-            if cursor:
-                cursor.close()
-            if conn:
-                conn.close()
-            print("[ERROR] No growth data available")
+        if child['measurement_id'] is None:
             return jsonify({'success': False, 'error': 'No growth data available'}), 404
         
-        # Convert to dict
-        latest_growth = db.dict_from_row(growth_row)
-        print(f"[DEBUG] Latest growth: {latest_growth}")
-        
-        # Get growth history (for display, not used in prediction)
-        if db.DB_TYPE == 'mysql':
-            query3 = f"""
-                SELECT weight_kg as weight, height_cm as height, measurement_date as measured_date
-                FROM growth_tracking
-                WHERE child_id = {placeholder}
-                AND measurement_date >= DATE_SUB(NOW(), INTERVAL 6 MONTH)
-                ORDER BY measurement_date ASC
-            """
-        else:
-            query3 = f"""
-                SELECT weight_kg as weight, height_cm as height, measurement_date as measured_date
-                FROM growth_tracking
-                WHERE child_id = {placeholder}
-                AND measurement_date >= date('now', '-6 months')
-                ORDER BY measurement_date ASC
-            """
-        
-        cursor.execute(query3, (child_id,))
-        growth_history_rows = cursor.fetchall()
-        growth_history = [db.dict_from_row(row) for row in growth_history_rows]
-        
-        # Calculate age in months
-        dob = child['date_of_birth']
-        print(f"[DEBUG] DOB from database: {dob}, type: {type(dob)}")
-        today = datetime.now().date()
-        
-        # Parse date_of_birth - handle string, date, or datetime
-        if isinstance(dob, str):
-            # Parse string date (format: YYYY-MM-DD)
-            print(f"[DEBUG] Parsing DOB string: {dob}")
-            dob_date = datetime.strptime(dob, '%Y-%m-%d').date()
-        elif isinstance(dob, datetime):
-            print(f"[DEBUG] Converting datetime to date")
-            dob_date = dob.date()
-        else:
-            # Already a date object
-            print(f"[DEBUG] DOB is already a date object")
-            dob_date = dob
-        
-        print(f"[DEBUG] Calculating age: today={today}, dob_date={dob_date}")
-        age_months = ((today - dob_date).days / 30.44)
-        print(f"[DEBUG] Age in months: {age_months}")
-        
-        # Get additional data from request
-        request_data = request.json or {}
-        
-        # Prepare child data
-        print(f"[DEBUG] Preparing child data...")
+        age_months = _age_in_months(child['date_of_birth'])
         child_data = {
             'age_months': int(age_months),
-            'weight_kg': float(latest_growth['weight_kg']),
-            'height_cm': float(latest_growth['height_cm']),
-            'gender': child['gender'],
-            'meals_per_day': request_data.get('meals_per_day', 3),
-            'milk_intake_ml': request_data.get('milk_intake_ml', 500),
-            'protein_servings': request_data.get('protein_servings', 2),
-            'vegetable_servings': request_data.get('vegetable_servings', 2),
-            'illness_days_last_month': request_data.get('illness_days_last_month', 0),
-            'diarrhea_recent': request_data.get('diarrhea_recent', False),
-            'fever_recent': request_data.get('fever_recent', False)
+            'weight_kg': float(child['weight_kg']),
+            'height_cm': float(child['height_cm']),
+            'gender': child['gender']
         }
-        print(f"[DEBUG] Child data prepared: {child_data}")
-        
-        # Get predictor and make prediction using trained CSV model
-        predictor = MALNUTRITION_PREDICTOR
-        print(f"[DEBUG] Predictor type: {type(predictor)}")
-        print(f"[DEBUG] Predictor is None: {predictor is None}")
-        
-        if predictor is None:
-            error_msg = f'Predictor not loaded. Error: {PREDICTOR_ERROR or "Unknown"}'
-            print(f"[ERROR] {error_msg}")
-            return jsonify({
-                'success': False, 
-                'error': error_msg,
-                'details': 'The malnutrition prediction system failed to initialize. Please check server logs.'
-            }), 500
-        
-        # Use new predictor method with gender
-        print(f"[DEBUG] Calling predict with: age={child_data['age_months']}, weight={child_data['weight_kg']}, height={child_data['height_cm']}, gender={child_data['gender']}")
-        
-        try:
-            result = predictor.predict(
-                age_months=child_data['age_months'],
-                weight_kg=child_data['weight_kg'],
-                height_cm=child_data['height_cm'],
-                gender=child_data['gender']
-            )
-            print(f"[DEBUG] Prediction result: {result}")
-        except Exception as pred_error:
-            print(f"[ERROR] Prediction call failed: {pred_error}")
-            import traceback
-            traceback.print_exc()
-            return jsonify({
-                'success': False,
-                'error': f'Prediction failed: {str(pred_error)}',
-                'details': 'An error occurred while processing the prediction.'
-            }), 500
-        
-        # Log prediction
-        print(f"[OK] Prediction for {child['name']}: {result['nutrition_status']} ({result['confidence']*100:.1f}% confidence)")
         
-        if cursor:
-            cursor.close()
-        if conn:
-            conn.close()
-        print("[DEBUG] Database connection closed")
-        
-        # Get z-scores and detailed predictions from result
-        z_scores = result.get('z_scores', {})
-        detailed_predictions = result.get('predictions', {})
-        
-        # Convert detailed predictions to frontend format
-        frontend_predictions = {}
-        for condition, details in detailed_predictions.items():
-            # Map status to risk_level (Normal->low, Mild->medium, Moderate->high, Severe->critical)
-            status_to_risk = {
-                'Normal': 'low',
-                'Mild': 'medium',
-                'Moderate': 'high',
-                'Severe': 'critical'
-            }
-            risk_level = status_to_risk.get(details.get('status', 'Normal'), 'low')
+        # Reuse the stored prediction while measurement, model and age are unchanged
+        prediction_cache = get_prediction_cache()
+        with trace.phase('cache'):
+            cache_key = (child['measurement_id'], model_version_of(predictor), child_data['age_months'])
+            try:
+                result = prediction_cache.get(conn, child_id, *cache_key)
+            except Exception as cache_error:
+                # A cache read failure is a miss, like a failed put
+                tracer.warning("Could not read cached prediction for child %s: %s", child_id, cache_error)
+                result = None
+        tracer.debug("child %s cache %s for key %s", child_id,
+                     'hit' if result is not None else 'miss', cache_key)
+        
+        if result is None:
+            try:
+                with trace.phase('predict'):
+                    result = predictor.predict(
+                        age_months=child_data['age_months'],
+                        weight_kg=child_data['weight_kg'],
+                        height_cm=child_data['height_cm'],
+                        gender=child_data['gender']
+                    )
+            except Exception as pred_error:
+                tracer.error("Prediction call failed for child %s: %s", child_id, pred_error)
+                return jsonify({
+                    'success': False,
+                    'error': f'Prediction failed: {str(pred_error)}',
+                    'details': 'An error occurred while processing the prediction.'
+                }), 500
             
-            # Calculate probability based on status
-            if details.get('status') == 'Severe':
-                probability = result['probabilities'].get('severe', 0.05)
-            elif details.get('status') == 'Moderate':
-                probability = result['probabilities'].get('moderate', 0.1)
-            elif details.get('status') == 'Mild':
-                probability = 0.15
-            else:
-                probability = 0.02
+            if hasattr(predictor, 'get_load_stats'):
+                from malnutrition_predictor import shadow_score
+                shadow_score(result, child_data)
             
-            frontend_predictions[condition] = {
-                'risk_level': risk_level,
-                'probability': probability,
-                'current_status': details.get('status') != 'Normal',
-                'zscore': details.get('zscore', 0)
-            }
+            try:
+                with trace.phase('db'):
+                    prediction_cache.put(conn, child_id, *cache_key, result)
+            except Exception as cache_error:
+                tracer.warning("Could not cache prediction for child %s: %s", child_id, cache_error)
         
-        # Format response to match frontend expectations
-        response = {
-            'success': True,
-            'child': {
-                'id': child['id'],
-                'name': child['name'],
-                'age_months': int(age_months),
-                'gender': child['gender']
-            },
-            'prediction': {
-                'nutrition_status': result['nutrition_status'],
-                'risk_level': result['risk_level'],
-                'confidence': result['confidence'],
-                'overall_risk': result['risk_level'],
-                'predictions': frontend_predictions,
-                'probabilities': result['probabilities'],
-                'recommendations': _generate_recommendations_for_result(result),
-                'z_scores': z_scores
-            }
-        }
+        tracer.debug("child %s: %s (%.1f%% confidence)", child_id,
+                     result['nutrition_status'], result['confidence'] * 100)
         
-        print("[DEBUG] Returning successful response")
-        return jsonify(response)
+        with trace.phase('format'):
+            response = jsonify(_format_malnutrition_prediction(child, age_months, result))
         
-    except Exception as e:
-        print(f"[ERROR] Exception in predict_malnutrition: {e}")
-        import traceback
-        traceback.print_exc()
-        
-        # Clean up connections
-        try:
-            if cursor:
-                cursor.close()
-            if conn:
-                conn.close()
-        except:
-            pass
+        if timing_headers_enabled(app):
+            response.headers.update(trace.headers())
+        return response
         
+    except Exception as e:
+        tracer.error("Exception in predict_malnutrition for child %s: %s", child_id, e)
+        if tracer.enabled('DEBUG'):
+            import traceback
+            tracer.debug("%s", traceback.format_exc())
         return jsonify({'success': False, 'error': f'Prediction failed: {str(e)}'}), 500
+    finally:
+        if conn:
+            conn.close()
 
 @app.route('/api/malnutrition-stats', methods=['GET'])
 def get_malnutrition_stats():
@@ -1637,7 +1635,7 @@ def get_malnutrition_stats():
         """)
         children = cursor.fetchall()
         
-        predictor = MALNUTRITION_PREDICTOR
+        predictor = active_malnutrition_predictor()
         stats = {
             'total_children': len(children),
             'high_risk': 0,
@@ -1727,7 +1725,7 @@ def test_predictor():
             return jsonify({'error': 'Predictor is None'}), 500
         
         # Test with Lakshmi's data
-        result = MALNUTRITION_PREDICTOR.predict(
+        result = active_malnutrition_predictor().predict(
             age_months=59,
             weight_kg=18.0,
             height_cm=109.0
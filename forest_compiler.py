@@ -0,0 +1,288 @@
+"""
+Random Forest Compiler
+Flattens a trained sklearn RandomForestClassifier into plain NumPy node arrays
+(feature, threshold, left, right, leaf probabilities) and evaluates every tree
+for a whole batch at once - no sklearn validation or joblib threads per call.
+
+Compiled forests are stored as a directory of .npy files so they can be
+memory-mapped read-only and shared between worker processes.
+"""
+
+import os
+import pickle
+import re
+import shutil
+import time
+import numpy as np
+
+
+COMPILED_SUFFIX = '.forest'
+ARRAY_NAMES = ('feature', 'threshold', 'left', 'right', 'value', 'roots', 'classes',
+               'n_features', 'max_depth')
+
+
+class CompiledForest:
+    """Array-based random forest that mirrors sklearn's predict/predict_proba"""
+
+    def __init__(self, feature, threshold, left, right, value, roots, classes,
+                 n_features, max_depth):
+        self.feature = feature
+        self.threshold = threshold
+        self.left = left
+        self.right = right
+        self.value = value
+        self.roots = roots
+        self.classes_ = classes
+        # Scalars come back from np.load(mmap_mode='r') as 1-element memmaps
+        self.n_features_in_ = int(np.ravel(n_features)[0])
+        self.max_depth = int(np.ravel(max_depth)[0])
+
+    @property
+    def n_estimators(self):
+        return len(self.roots)
+
+    @property
+    def node_count(self):
+        return len(self.feature)
+
+    @property
+    def nbytes(self):
+        """Total size of the node arrays (mapped, not necessarily resident)"""
+        return sum(getattr(self, name).nbytes for name in
+                   ('feature', 'threshold', 'left', 'right', 'value', 'roots'))
+
+    def predict_proba(self, X):
+        """
+        Average leaf probabilities over all trees
+
+        Args:
+            X: array-like of shape (n_samples, n_features)
+
+        Returns:
+            ndarray of shape (n_samples, n_classes)
+        """
+        # sklearn evaluates trees on float32 inputs; do the same for parity
+        X = np.asarray(X, dtype=np.float32)
+        if X.ndim == 1:
+            X = X.reshape(1, -1)
+        if X.shape[1] != self.n_features_in_:
+            raise ValueError(
+                f"X has {X.shape[1]} features, but the forest expects {self.n_features_in_}"
+            )
+
+        rows = np.arange(X.shape[0])[:, None]
+        node = np.broadcast_to(self.roots, (X.shape[0], len(self.roots)))
+
+        # Leaves point to themselves, so walking max_depth steps lands every
+        # (sample, tree) pair on its leaf regardless of the tree's own depth
+        for _ in range(self.max_depth):
+            go_left = X[rows, self.feature[node]] <= self.threshold[node]
+            node = np.where(go_left, self.left[node], self.right[node])
+
+        return self.value[node].mean(axis=1)
+
+    def predict(self, X):
+        """Predict class labels (same tie-breaking as sklearn: first max wins)"""
+        proba = self.predict_proba(X)
+        return self.classes_[np.argmax(proba, axis=1)]
+
+    def save(self, path):
+        """
+        Save compiled arrays as one .npy file per array
+
+        Arrays go to a new versioned sibling directory (`<path>.v<ns>-<pid>`)
+        and `path` - a relative symlink - is switched to it with os.replace,
+        so `path` always resolves to one complete forest. The previous
+        version is kept for readers that resolved `path` just before the
+        switch; older ones are removed. Where symlinks are unavailable the
+        directory is replaced in place (not atomic).
+        """
+        arrays = {
+            'feature': self.feature,
+            'threshold': self.threshold,
+            'left': self.left,
+            'right': self.right,
+            'value': self.value,
+            'roots': self.roots,
+            'classes': self.classes_,
+            'n_features': np.array(self.n_features_in_),
+            'max_depth': np.array(self.max_depth),
+        }
+
+        version_path = f"{path}.v{time.time_ns()}-{os.getpid()}"
+        os.makedirs(version_path)
+        for name, array in arrays.items():
+            np.save(os.path.join(version_path, f'{name}.npy'), np.ascontiguousarray(array))
+
+        link_tmp = f"{path}.link-{os.getpid()}"
+        try:
+            if os.path.lexists(link_tmp):
+                os.remove(link_tmp)
+            os.symlink(os.path.basename(version_path), link_tmp)
+        except (OSError, NotImplementedError):
+            if os.path.isdir(path):
+                shutil.rmtree(path)
+            os.rename(version_path, path)
+            return
+
+        if os.path.isdir(path) and not os.path.islink(path):
+            # Plain directory written before versioned saves
+            shutil.rmtree(path)
+        os.replace(link_tmp, path)
+        _prune_versions(path, keep=2)
+
+    @classmethod
+    def load(cls, path, mmap=True):
+        """
+        Load compiled arrays written by save()
+
+        Args:
+            path: compiled forest directory
+            mmap: map arrays read-only instead of reading them into memory
+        """
+        mmap_mode = 'r' if mmap else None
+        # Resolve the symlink once so every array comes from the same version
+        path = os.path.realpath(path)
+        data = {
+            name: np.load(os.path.join(path, f'{name}.npy'), mmap_mode=mmap_mode,
+                          allow_pickle=False)
+            for name in ARRAY_NAMES
+        }
+        return cls(**data)
+
+
+def _prune_versions(path, keep=2):
+    """Remove all but the newest `keep` versioned directories of a compiled forest"""
+    parent, name = os.path.split(os.path.abspath(path))
+    current = os.path.basename(os.path.realpath(path))
+    pattern = re.compile(rf"{re.escape(name)}\.v(\d+)-\d+")
+    versions = sorted((int(match.group(1)), entry) for entry in os.listdir(parent)
+                      for match in [pattern.fullmatch(entry)] if match)
+    for _, entry in versions[:-keep]:
+        if entry != current:
+            shutil.rmtree(os.path.join(parent, entry), ignore_errors=True)
+
+
+def compile_forest(model):
+    """
+    Convert a fitted RandomForestClassifier into a CompiledForest
+
+    All trees are concatenated into one set of flat node arrays; child
+    indices are global so a single gather walks every tree in parallel.
+    """
+    if not hasattr(model, 'estimators_'):
+        raise ValueError("Model is not a fitted forest (no estimators_)")
+    if getattr(model, 'n_outputs_', 1) != 1:
+        raise ValueError("Only single-output forests can be compiled")
+
+    features, thresholds, lefts, rights, values, roots = [], [], [], [], [], []
+    offset = 0
+    max_depth = 0
+
+    for estimator in model.estimators_:
+        tree = estimator.tree_
+        n_nodes = tree.node_count
+        node_ids = np.arange(n_nodes)
+        is_leaf = tree.children_left == -1
+
+        feature = np.where(is_leaf, 0, tree.feature).astype(np.int32)
+        threshold = np.where(is_leaf, np.inf, tree.threshold).astype(np.float64)
+        left = np.where(is_leaf, node_ids, tree.children_left) + offset
+        right = np.where(is_leaf, node_ids, tree.children_right) + offset
+
+        # Leaf class distribution, normalised the way DecisionTreeClassifier does
+        value = tree.value[:, 0, :].astype(np.float64)
+        normalizer = value.sum(axis=1, keepdims=True)
+        normalizer[normalizer == 0.0] = 1.0
+        value = value / normalizer
+
+        features.append(feature)
+        thresholds.append(threshold)
+        lefts.append(left.astype(np.int32))
+        rights.append(right.astype(np.int32))
+        values.append(value)
+        roots.append(offset)
+
+        offset += n_nodes
+        max_depth = max(max_depth, tree.max_depth)
+
+    return CompiledForest(
+        feature=np.concatenate(features),
+        threshold=np.concatenate(thresholds),
+        left=np.concatenate(lefts),
+        right=np.concatenate(rights),
+        value=np.concatenate(values),
+        roots=np.array(roots, dtype=np.int32),
+        classes=np.asarray(model.classes_),
+        n_features=model.n_features_in_,
+        max_depth=max_depth,
+    )
+
+
+def compiled_path_for(pickle_path):
+    """Path of the compiled artifact that sits next to a model pickle"""
+    return os.path.splitext(pickle_path)[0] + COMPILED_SUFFIX
+
+
+def save_compiled(model, pickle_path):
+    """Compile a fitted forest and write the artifact next to its pickle"""
+    compiled = compile_forest(model)
+    compiled_file = compiled_path_for(pickle_path)
+    compiled.save(compiled_file)
+    return compiled_file
+
+
+def load_or_compile(pickle_path, mmap=True):
+    """
+    Load the compiled forest for a model pickle, compiling it if needed
+
+    The compiled artifact is rebuilt whenever it is missing or older than
+    the pickle, so retraining never serves a stale forest. A freshly
+    compiled forest is re-opened from disk so it is mapped like any other.
+
+    Returns:
+        (CompiledForest, sklearn model or None if loaded from the artifact)
+    """
+    compiled_file = compiled_path_for(pickle_path)
+
+    if (os.path.isdir(compiled_file)
+            and os.path.getmtime(compiled_file) >= os.path.getmtime(pickle_path)):
+        return CompiledForest.load(compiled_file, mmap=mmap), None
+
+    with open(pickle_path, 'rb') as f:
+        model = pickle.load(f)
+
+    compiled = compile_forest(model)
+    try:
+        compiled.save(compiled_file)
+        compiled = CompiledForest.load(compiled_file, mmap=mmap)
+    except OSError as e:
+        print(f"[WARNING] Could not save compiled forest {compiled_file}: {e}")
+
+    return compiled, model
+
+
+def compile_model_directory(model_path='models/malnutrition'):
+    """Compile every forest pickle in a model directory"""
+    compiled = []
+    for file_name in sorted(os.listdir(model_path)):
+        if not file_name.endswith('.pkl'):
+            continue
+        pickle_file = os.path.join(model_path, file_name)
+        with open(pickle_file, 'rb') as f:
+            model = pickle.load(f)
+        if not hasattr(model, 'estimators_'):
+            continue
+        compiled.append(save_compiled(model, pickle_file))
+    return compiled
+
+
+if __name__ == '__main__':
+    import sys
+
+    target = sys.argv[1] if len(sys.argv) > 1 else 'models/malnutrition'
+    print(f"Compiling forests in {target}...")
+    for path in compile_model_directory(target):
+        forest = CompiledForest.load(path)
+        print(f"   [OK] {path}: {forest.n_estimators} trees, "
+              f"{forest.node_count} nodes, depth {forest.max_depth}")
@@ -0,0 +1,143 @@
+"""
+Shared HTTP Client
+Pooled requests.Session for the external data APIs (data.gov.in mandi
+prices and friends).
+
+    - keep-alive connection pool per host (no TLS handshake per call)
+    - retry with exponential backoff on 429 / 5xx and connection errors,
+      honouring Retry-After
+    - per-host rate limiting (minimum interval between requests, shared by
+      all threads)
+    - bounded thread pool for fanning out independent fetches, so N
+      commodity lookups cost about as much as the slowest one
+"""
+
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+
+
+# Concurrent requests per client (also the connection pool size per host)
+MAX_WORKERS = int(os.getenv('HTTP_MAX_WORKERS', 8))
+
+# Requests per second per host (0 disables rate limiting)
+RATE_LIMIT = float(os.getenv('HTTP_RATE_LIMIT', 10))
+
+# Attempts per request, and the first backoff delay in seconds (doubles each retry)
+MAX_RETRIES = int(os.getenv('HTTP_MAX_RETRIES', 3))
+BACKOFF = float(os.getenv('HTTP_BACKOFF', 0.5))
+
+# Longest Retry-After we are willing to sleep for
+MAX_RETRY_AFTER = 30.0
+
+RETRY_STATUSES = frozenset({429, 500, 502, 503, 504})
+
+
+class RateLimiter:
+    """Minimum interval between requests to each host"""
+
+    def __init__(self, rate=RATE_LIMIT):
+        self.interval = 1.0 / rate if rate > 0 else 0.0
+        self._next = {}  # host -> earliest monotonic time of the next request
+        self._lock = threading.Lock()
+
+    def wait(self, host):
+        if not self.interval:
+            return
+        with self._lock:
+            now = time.monotonic()
+            slot = max(now, self._next.get(host, now))
+            self._next[host] = slot + self.interval
+        if slot > now:
+            time.sleep(slot - now)
+
+
+def _retry_after(response):
+    """Seconds from a Retry-After header (delta-seconds form only), or None"""
+    value = response.headers.get('Retry-After')
+    try:
+        return min(float(value), MAX_RETRY_AFTER)
+    except (TypeError, ValueError):
+        return None
+
+
+class HTTPClient:
+    """Pooled, rate-limited session with retries and a fan-out pool"""
+
+    def __init__(self, max_workers=MAX_WORKERS, rate=RATE_LIMIT,
+                 max_retries=MAX_RETRIES, backoff=BACKOFF):
+        self.max_workers = max_workers
+        self.max_retries = max(1, max_retries)  # at least one attempt
+        self.backoff = backoff
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=4, pool_maxsize=max_workers)
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+        self.limiter = RateLimiter(rate)
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='http-client')
+        self.stats = {'requests': 0, 'retries': 0, 'failures': 0}
+        self._stats_lock = threading.Lock()
+
+    def _count(self, key):
+        with self._stats_lock:
+            self.stats[key] += 1
+
+    def get(self, url, params=None, timeout=30, **kwargs):
+        """
+        GET with rate limiting and retries
+
+        Returns the last response (which may still be a 429 / 5xx once
+        retries are exhausted); raises requests.RequestException if the
+        final attempt fails at the connection level.
+        """
+        host = urlsplit(url).netloc
+        for attempt in range(self.max_retries):
+            last = attempt == self.max_retries - 1
+            self.limiter.wait(host)
+            self._count('requests')
+            try:
+                response = self.session.get(url, params=params, timeout=timeout, **kwargs)
+            except (requests.exceptions.ConnectionError, requests.exceptions.Timeout):
+                if last:
+                    self._count('failures')
+                    raise
+                delay = None
+            else:
+                if response.status_code not in RETRY_STATUSES or last:
+                    if response.status_code in RETRY_STATUSES:
+                        self._count('failures')
+                    return response
+                delay = _retry_after(response)
+
+            self._count('retries')
+            time.sleep(delay if delay is not None else self.backoff * (2 ** attempt))
+
+    def map(self, fn, items):
+        """fn over items on the client's pool; results in input order"""
+        items = list(items)
+        if len(items) <= 1:
+            return [fn(item) for item in items]
+        return list(self._pool.map(fn, items))
+
+    def get_stats(self):
+        with self._stats_lock:
+            return dict(self.stats)
+
+
+_client = None
+_client_lock = threading.Lock()
+
+
+def get_http_client():
+    """Process-wide HTTPClient"""
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                _client = HTTPClient()
+    return _client
@@ -0,0 +1,316 @@
+"""
+Ingredient Inverted Index
+Maps ingredients to the meal plans (child_id, plan_id, nutrition_score)
+they appear in, built once from meal_plans and kept up to date as plans
+are saved.
+
+Plans are rows of a sparse plans x ingredients incidence matrix, ordered by
+child so a neighbourhood's plans are a few contiguous slices. Acceptance of
+a list of ingredients by a set of similar children is then one sparse
+vector-matrix product instead of a query and a JSON parse per plan.
+
+Newly saved plans go to a small pending buffer that queries scan directly;
+the buffer is merged into the matrix once it reaches MERGE_THRESHOLD plans.
+"""
+
+import json
+import sqlite3
+import threading
+
+import numpy as np
+import pandas as pd
+from scipy import sparse
+
+
+# Plans with at least this nutrition score count as accepted meals
+MIN_ACCEPTED_SCORE = 60
+
+# Pending plans merged into the incidence matrix at once
+MERGE_THRESHOLD = 256
+
+
+def plan_ingredient_names(ingredients):
+    """Ingredient names of a meal_plans.ingredients value (JSON dict or list)"""
+    if not ingredients:
+        return []
+    if isinstance(ingredients, str):
+        try:
+            ingredients = json.loads(ingredients)
+        except ValueError:
+            return []
+    if isinstance(ingredients, dict):
+        return list(ingredients.keys())
+    if isinstance(ingredients, (list, tuple)):
+        return [name for name in ingredients if isinstance(name, str)]
+    return []
+
+
+class IngredientPlanIndex:
+    """Inverted index ingredient -> (child_id, plan_id, nutrition_score)"""
+
+    def __init__(self, merge_threshold=MERGE_THRESHOLD):
+        self.merge_threshold = merge_threshold
+        self.vocabulary = {}  # ingredient name -> column
+        self.plan_ids = np.empty(0, dtype=np.int64)
+        self.child_ids = np.empty(0, dtype=np.int64)  # sorted; rows are grouped by child
+        self.scores = np.empty(0, dtype=np.float64)
+        self.incidence = sparse.csr_matrix((0, 0), dtype=np.float64)
+        self._pending = []  # (plan_id, child_id, score, [columns])
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.plan_ids) + len(self._pending)
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        del state['_lock']
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._lock = threading.Lock()
+
+    # ==================== BUILD ====================
+
+    def build(self, conn):
+        """Index every meal plan that has a child and an ingredient list"""
+        try:
+            plans = pd.read_sql_query("""
+                SELECT id, child_id, ingredients, nutrition_score
+                FROM meal_plans
+                WHERE child_id IS NOT NULL AND ingredients IS NOT NULL
+            """, conn)
+        except (pd.errors.DatabaseError, sqlite3.OperationalError):
+            # meal_plans predates the child_id / ingredients columns
+            return self
+        self._set_plans(
+            plans['id'].to_numpy(dtype=np.int64),
+            plans['child_id'].to_numpy(dtype=np.int64),
+            plans['nutrition_score'].fillna(0).to_numpy(dtype=np.float64),
+            [plan_ingredient_names(value) for value in plans['ingredients']],
+        )
+        return self
+
+    def _columns(self, names):
+        columns = []
+        for name in names:
+            column = self.vocabulary.get(name)
+            if column is None:
+                column = self.vocabulary[name] = len(self.vocabulary)
+            columns.append(column)
+        return sorted(set(columns))
+
+    def _set_plans(self, plan_ids, child_ids, scores, ingredient_lists):
+        columns = [self._columns(names) for names in ingredient_lists]
+        lengths = np.fromiter((len(c) for c in columns), dtype=np.int64, count=len(columns))
+        indptr = np.concatenate([[0], np.cumsum(lengths)])
+        indices = np.fromiter((col for c in columns for col in c), dtype=np.int64, count=int(indptr[-1]))
+        incidence = sparse.csr_matrix(
+            (np.ones(len(indices)), indices, indptr),
+            shape=(len(plan_ids), len(self.vocabulary)))
+
+        order = np.argsort(child_ids, kind='stable')
+        self.plan_ids = plan_ids[order]
+        self.child_ids = child_ids[order]
+        self.scores = scores[order]
+        self.incidence = incidence[order]
+
+    # ==================== UPDATES ====================
+
+    def add_plan(self, plan_id, child_id, ingredients, nutrition_score):
+        """Index a newly saved meal plan"""
+        if child_id is None or ingredients is None:
+            return False
+        names = plan_ingredient_names(ingredients)
+        with self._lock:
+            self._pending.append((int(plan_id), int(child_id), float(nutrition_score or 0),
+                                  self._columns(names)))
+            if len(self._pending) >= self.merge_threshold:
+                self._merge()
+        return True
+
+    def _merge(self):
+        """Fold pending plans into the sorted arrays and incidence matrix"""
+        pending, self._pending = self._pending, []
+        n_columns = len(self.vocabulary)
+        base = self.incidence
+        base.resize((base.shape[0], n_columns))
+        rows = sparse.csr_matrix(
+            (np.ones(sum(len(p[3]) for p in pending)),
+             [col for p in pending for col in p[3]],
+             np.concatenate([[0], np.cumsum([len(p[3]) for p in pending])])),
+            shape=(len(pending), n_columns))
+
+        plan_ids = np.concatenate([self.plan_ids, [p[0] for p in pending]]).astype(np.int64)
+        child_ids = np.concatenate([self.child_ids, [p[1] for p in pending]]).astype(np.int64)
+        scores = np.concatenate([self.scores, [p[2] for p in pending]])
+        incidence = sparse.vstack([base, rows], format='csr')
+
+        order = np.argsort(child_ids, kind='stable')
+        self.plan_ids = plan_ids[order]
+        self.child_ids = child_ids[order]
+        self.scores = scores[order]
+        self.incidence = incidence[order]
+
+    # ==================== QUERIES ====================
+
+    def acceptance(self, neighbors, ingredients, min_score=MIN_ACCEPTED_SCORE):
+        """
+        Acceptance probability of each ingredient among similar children
+
+        For the neighbours' plans scoring at least min_score: the
+        similarity-weighted count of plans containing the ingredient,
+        divided by the number of such plans.
+
+        Args:
+            neighbors: list of (child_id, similarity)
+            ingredients: ingredient names
+            min_score: nutrition_score threshold for an accepted plan
+
+        Returns:
+            numpy array aligned with ingredients (0.5 when there is no evidence)
+        """
+        result = np.full(len(ingredients), 0.5)
+        if not neighbors or not ingredients:
+            return result
+
+        neighbor_ids = np.array([child_id for child_id, _ in neighbors], dtype=np.int64)
+        similarities = np.array([similarity for _, similarity in neighbors], dtype=np.float64)
+
+        with self._lock:
+            columns = np.array([self.vocabulary.get(name, -1) for name in ingredients], dtype=np.int64)
+            # Ingredients first seen in pending plans have no matrix column yet
+            known = (columns >= 0) & (columns < self.incidence.shape[1])
+
+            # Contiguous row range of each neighbour
+            starts = np.searchsorted(self.child_ids, neighbor_ids, side='left')
+            ends = np.searchsorted(self.child_ids, neighbor_ids, side='right')
+            rows = np.concatenate([np.arange(s, e) for s, e in zip(starts, ends)] or [[]]).astype(np.int64)
+            weights = np.repeat(similarities, ends - starts)
+            accepted = self.scores[rows] >= min_score
+            rows, weights = rows[accepted], weights[accepted]
+
+            total = len(rows)
+            weighted = np.zeros(len(ingredients))
+            if total and known.any():
+                matrix = self.incidence[rows][:, columns[known]]
+                weighted[known] = matrix.T @ weights
+
+            # Plans saved since the last merge
+            similarity_of = dict(zip(neighbor_ids.tolist(), similarities.tolist()))
+            for _, child_id, score, plan_columns in self._pending:
+                if child_id not in similarity_of or score < min_score:
+                    continue
+                total += 1
+                plan_columns = set(plan_columns)
+                for i, column in enumerate(columns):
+                    if column in plan_columns:
+                        weighted[i] += similarity_of[child_id]
+
+        if total == 0:
+            return result
+        return np.clip(weighted / total, 0.0, 1.0)
+
+    def neighbor_plan_scores(self, neighbors, min_score=70, limit=50):
+        """
+        Ingredient popularity among similar children's best plans
+
+        Takes the neighbours' plans scoring at least min_score, best
+        `limit` first (newest plan on ties), and sums
+        nutrition_score * similarity per ingredient.
+
+        Returns:
+            {ingredient_name: score} for ingredients in the selected plans
+        """
+        if not neighbors:
+            return {}
+        neighbor_ids = np.array([child_id for child_id, _ in neighbors], dtype=np.int64)
+        similarities = np.array([similarity for _, similarity in neighbors], dtype=np.float64)
+
+        with self._lock:
+            starts = np.searchsorted(self.child_ids, neighbor_ids, side='left')
+            ends = np.searchsorted(self.child_ids, neighbor_ids, side='right')
+            rows = np.concatenate([np.arange(s, e) for s, e in zip(starts, ends)] or [[]]).astype(np.int64)
+            row_similarity = np.repeat(similarities, ends - starts)
+            keep = self.scores[rows] >= min_score
+            rows, row_similarity = rows[keep], row_similarity[keep]
+
+            similarity_of = dict(zip(neighbor_ids.tolist(), similarities.tolist()))
+            pending = [(plan_id, score, similarity_of[child_id], columns)
+                       for plan_id, child_id, score, columns in self._pending
+                       if child_id in similarity_of and score >= min_score]
+
+            # Rank matrix rows and pending plans together: score, then plan id, descending
+            scores = np.concatenate([self.scores[rows], [p[1] for p in pending]])
+            plan_ids = np.concatenate([self.plan_ids[rows], [p[0] for p in pending]])
+            selected = np.lexsort((-plan_ids, -scores))[:limit]
+            from_matrix = selected[selected < len(rows)]
+            from_pending = selected[selected >= len(rows)] - len(rows)
+
+            totals = np.zeros(len(self.vocabulary))
+            if len(from_matrix):
+                weights = self.scores[rows[from_matrix]] * row_similarity[from_matrix]
+                matrix_totals = self.incidence[rows[from_matrix]].T @ weights
+                totals[:len(matrix_totals)] += matrix_totals
+            for i in from_pending:
+                _, score, similarity, columns = pending[i]
+                totals[columns] += score * similarity
+            used = np.zeros(len(self.vocabulary), dtype=bool)
+            for i in from_pending:
+                used[pending[i][3]] = True
+            if len(from_matrix):
+                used[self.incidence[rows[from_matrix]].indices] = True
+            names = self.ingredient_names()
+
+        return {names[column]: float(totals[column]) for column in np.flatnonzero(used)}
+
+    def ingredient_names(self):
+        """Ingredient names in column order"""
+        names = [None] * len(self.vocabulary)
+        for name, column in self.vocabulary.items():
+            names[column] = name
+        return names
+
+    def child_ingredient_matrix(self, plan_weights=None):
+        """
+        Sparse children x ingredients interaction matrix
+
+        Each plan adds its weight to every (child, ingredient) it contains:
+        plan_weights[plan_id] where given, else nutrition_score / 100.
+
+        Args:
+            plan_weights: optional Series plan_id -> weight (e.g. feedback ratings)
+
+        Returns:
+            (child_ids, CSR matrix, ingredient names in column order)
+        """
+        with self._lock:
+            if self._pending:
+                self._merge()
+            weights = self.scores / 100.0
+            if plan_weights is not None and len(plan_weights):
+                given = plan_weights.reindex(self.plan_ids).to_numpy(dtype=np.float64)
+                weights = np.where(np.isnan(given), weights, given)
+
+            child_ids, rows = np.unique(self.child_ids, return_inverse=True)
+            n_plans = len(self.plan_ids)
+            per_child = sparse.csr_matrix((weights, (rows, np.arange(n_plans))),
+                                          shape=(len(child_ids), n_plans))
+            incidence = self.incidence.copy()
+            incidence.resize((n_plans, len(self.vocabulary)))
+            matrix = (per_child @ incidence).tocsr()
+            return child_ids, matrix, self.ingredient_names()
+
+    def plans_with(self, ingredient_name):
+        """(child_id, plan_id, nutrition_score) tuples of plans containing an ingredient"""
+        column = self.vocabulary.get(ingredient_name)
+        if column is None:
+            return []
+        with self._lock:
+            rows = (self.incidence[:, column].nonzero()[0] if column < self.incidence.shape[1]
+                    else np.empty(0, dtype=np.int64))
+            postings = list(zip(self.child_ids[rows].tolist(), self.plan_ids[rows].tolist(),
+                                self.scores[rows].tolist()))
+            postings += [(child_id, plan_id, score) for plan_id, child_id, score, plan_columns
+                         in self._pending if column in plan_columns]
+        return postings
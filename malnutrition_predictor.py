@@ -2,48 +2,107 @@
 Malnutrition Predictor using trained Random Forest model from CSV data
 Loads the model trained on real malnutrition data
 Auto-fallback to WHO z-score based predictor if models unavailable
+Model arrays are memory-mapped and can be loaded lazily on first prediction
+Versions come from the model registry and can be hot-swapped / shadow-scored
 """
 
 import numpy as np
 import pickle
 import os
-from datetime import datetime
+import threading
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from model_loader import get_lazy_forest, forest_stats
+from model_registry import get_registry
+
+# Simplified WHO median values (males) by age in months
+MEDIAN_WEIGHTS = {0: 3.3, 6: 7.9, 12: 9.6, 18: 11.0, 24: 12.2, 36: 14.3, 48: 16.3, 60: 18.3}
+MEDIAN_HEIGHTS = {0: 49.9, 6: 67.6, 12: 75.7, 18: 82.3, 24: 87.1, 36: 96.1, 48: 103.3, 60: 109.2}
+MEDIAN_BMIS = {12: 16.5, 24: 16.2, 36: 15.8, 48: 15.5, 60: 15.3}
 
 class MalnutritionPredictor:
     """Malnutrition prediction using trained Random Forest model"""
     
-    def __init__(self):
-        self.model = None
-        self.label_encoder = None
+    def __init__(self, lazy=False, reload_models=False, version=None):
+        """
+        Args:
+            lazy: If True, defer loading until the first prediction
+            reload_models: If True, drop any forest already mapped by this process
+            version: Registry version to serve (default: the registry's current
+                version, or the legacy files in models/malnutrition/)
+        """
+        self.compiled_model = None
+        self.class_names = None
         self.metadata = None
-        self.model_path = 'models/malnutrition/'
+        self.model_version = version or get_registry().get_current_version()
+        if self.model_version:
+            self.model_path = get_registry().version_dir(self.model_version)
+        else:
+            self.model_path = 'models/malnutrition/'
         self.use_fallback = False
         self.fallback_predictor = None
+        self.load_time_ms = None
         
-        self._load_trained_model()
+        self._forest = get_lazy_forest(os.path.join(self.model_path, 'trained_model.pkl'))
+        if reload_models:
+            self._forest.reset()
+        self._loaded = False
+        self._load_lock = threading.Lock()
+        
+        if not lazy:
+            self.load()
+    
+    @property
+    def is_loaded(self):
+        return self._loaded
+    
+    def load(self):
+        """Load models once (thread-safe); called automatically before predicting"""
+        if not self._loaded:
+            with self._load_lock:
+                if not self._loaded:
+                    start = time.perf_counter()
+                    self._load_trained_model()
+                    self.load_time_ms = round((time.perf_counter() - start) * 1000, 2)
+                    self._loaded = True
+        return self
+    
+    def get_load_stats(self):
+        """Model load time and memory figures for the /health endpoint"""
+        stats = forest_stats()
+        stats.update({
+            'model_version': self.model_version,
+            'loaded': self._loaded,
+            'predictor_type': None if not self._loaded else ('fallback' if self.use_fallback else 'trained'),
+            'load_time_ms': self.load_time_ms,
+            'model_mapped_bytes': self.compiled_model.nbytes if self.compiled_model is not None else None
+        })
+        return stats
     
     def _load_trained_model(self):
         """Load the trained model from disk, fallback to simple predictor if unavailable"""
         try:
-            # Load main model
-            model_file = os.path.join(self.model_path, 'trained_model.pkl')
-            with open(model_file, 'rb') as f:
-                self.model = pickle.load(f)
+            # Map main model as flat node arrays (compiled next to the pickle on first use)
+            self.compiled_model = self._forest.get()
             
-            # Load label encoder
-            encoder_file = os.path.join(self.model_path, 'label_encoder.pkl')
-            with open(encoder_file, 'rb') as f:
-                self.label_encoder = pickle.load(f)
+            # Load metadata (a plain dict - no sklearn import on the serving path)
+            if self.model_version:
+                self.metadata = get_registry().get_metadata(self.model_version)
+            else:
+                metadata_file = os.path.join(self.model_path, 'model_metadata.pkl')
+                with open(metadata_file, 'rb') as f:
+                    self.metadata = pickle.load(f)
             
-            # Load metadata
-            metadata_file = os.path.join(self.model_path, 'model_metadata.pkl')
-            with open(metadata_file, 'rb') as f:
-                self.metadata = pickle.load(f)
+            # Class names in label-encoder order (label_encoder.classes_ is saved as metadata['classes'])
+            self.class_names = np.array(self.metadata['classes'])
             
-            print("[OK] Trained model loaded successfully")
+            print(f"[OK] Trained model loaded successfully (version: {self.model_version or 'legacy'})")
             print(f"   Accuracy: {self.metadata['accuracy']*100:.2f}%")
             print(f"   Classes: {self.metadata['classes']}")
             print(f"   Training date: {self.metadata['training_date']}")
+            print(f"   Compiled forest: {self.compiled_model.n_estimators} trees, {self.compiled_model.node_count} nodes")
             
         except (FileNotFoundError, Exception) as e:
             print(f"[WARNING] Trained model not available: {e}")
@@ -84,6 +143,8 @@ class MalnutritionPredictor:
         Returns:
             dict with prediction results
         """
+        self.load()
+        
         # Use fallback predictor if trained model not available
         if self.use_fallback:
             return self.fallback_predictor.predict(
@@ -100,16 +161,16 @@ class MalnutritionPredictor:
         # Prepare features in correct order
         features = np.array([[age_months, weight_kg, height_cm, muac_cm, bmi]])
         
-        # Make prediction
-        prediction = self.model.predict(features)[0]
-        probabilities = self.model.predict_proba(features)[0]
+        # Make prediction (pure NumPy traversal, same probabilities as sklearn)
+        probabilities = self.compiled_model.predict_proba(features)[0]
+        prediction = self.compiled_model.classes_[np.argmax(probabilities)]
         
         # Get class name
-        predicted_class = self.label_encoder.inverse_transform([prediction])[0]
+        predicted_class = str(self.class_names[prediction])
         
         # Get probabilities for all classes
         class_probabilities = {}
-        for i, class_name in enumerate(self.label_encoder.classes_):
+        for i, class_name in enumerate(self.class_names.tolist()):
             class_probabilities[class_name] = float(probabilities[i])
         
         # Determine risk level
@@ -179,10 +240,9 @@ class MalnutritionPredictor:
         Calculate simplified z-scores for display
         Based on WHO growth standards (simplified version)
         """
-        # Simplified median values (males)
-        median_weights = {0: 3.3, 6: 7.9, 12: 9.6, 18: 11.0, 24: 12.2, 36: 14.3, 48: 16.3, 60: 18.3}
-        median_heights = {0: 49.9, 6: 67.6, 12: 75.7, 18: 82.3, 24: 87.1, 36: 96.1, 48: 103.3, 60: 109.2}
-        median_bmis = {12: 16.5, 24: 16.2, 36: 15.8, 48: 15.5, 60: 15.3}
+        median_weights = MEDIAN_WEIGHTS
+        median_heights = MEDIAN_HEIGHTS
+        median_bmis = MEDIAN_BMIS
         
         # Adjust for gender (females ~5% lighter)
         gender_factor = 0.95 if gender.lower() == 'female' else 1.0
@@ -215,6 +275,8 @@ class MalnutritionPredictor:
         Args:
             child_data: Dict with age_months, weight_kg, height_cm, gender
         """
+        self.load()
+        
         # Use fallback predictor if trained model not available
         if self.use_fallback:
             return self.fallback_predictor.predict_from_child_data(child_data)
@@ -231,21 +293,244 @@ class MalnutritionPredictor:
 # Global predictor instance
 _predictor_instance = None
 
-def get_predictor(force_reload=False):
+# Hot-swap state: a new version is loaded next to the serving one and only
+# replaces it once it has loaded and answered a warm-up prediction
+_swap_lock = threading.Lock()
+_swap_state = {'status': 'idle', 'target_version': None, 'error': None, 'last_swap': None,
+               'failures': 0, 'next_retry': None}
+
+# A failed swap to the CURRENT version is retried after SWAP_RETRY_BASE
+# seconds, doubling per consecutive failure up to SWAP_RETRY_MAX
+SWAP_RETRY_BASE = 30.0
+SWAP_RETRY_MAX = 600.0
+_swap_retry_at = None  # time.monotonic() of the next retry
+
+# How often each worker re-reads the registry CURRENT pointer
+POINTER_CHECK_INTERVAL = 5.0
+_last_pointer_check = 0.0
+_last_pointer_mtime = None
+
+# Shadow scoring: a candidate version scores live requests off the request path
+_shadow_predictor = None
+_shadow_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='shadow-model')
+_shadow_lock = threading.Lock()
+_shadow_stats = None
+
+WARMUP_CHILD = {'age_months': 24, 'weight_kg': 11.5, 'height_cm': 85.0, 'gender': 'male'}
+
+
+def get_predictor(force_reload=False, lazy=False):
     """
     Get the malnutrition predictor instance
     
     Args:
-        force_reload: If True, recreates the predictor
+        force_reload: If True, recreates the predictor and re-maps model files
+        lazy: If True, a newly created predictor loads on first prediction
     """
     global _predictor_instance
     
     if _predictor_instance is None or force_reload:
-        _predictor_instance = MalnutritionPredictor()
+        _predictor_instance = MalnutritionPredictor(lazy=lazy, reload_models=force_reload)
     
     return _predictor_instance
 
 
+def _load_version(version):
+    """Load and warm up a registry version; raises if it cannot serve"""
+    predictor = MalnutritionPredictor(version=version)
+    if predictor.use_fallback:
+        raise RuntimeError(f"Model version {version} could not be loaded")
+    predictor.predict_from_child_data(WARMUP_CHILD)
+    return predictor
+
+
+def _swap_worker(version):
+    global _predictor_instance, _swap_retry_at
+    try:
+        predictor = _load_version(version)
+    except Exception as e:
+        # Keep serving the old version; get_active_predictor() retries later
+        with _swap_lock:
+            failures = _swap_state['failures'] + 1
+            delay = min(SWAP_RETRY_BASE * 2 ** (failures - 1), SWAP_RETRY_MAX)
+            _swap_retry_at = time.monotonic() + delay
+            _swap_state.update({'status': 'failed', 'error': str(e), 'failures': failures,
+                                'next_retry': (datetime.now() + timedelta(seconds=delay)).isoformat()})
+        print(f"[ERROR] Model swap to {version} failed (attempt {failures}, retry in {delay:.0f}s): {e}")
+        return
+
+    with _swap_lock:
+        _predictor_instance = predictor
+        _swap_retry_at = None
+        _swap_state.update({'status': 'idle', 'error': None, 'failures': 0, 'next_retry': None,
+                            'last_swap': datetime.now().isoformat()})
+    print(f"[OK] Now serving malnutrition model version {version}")
+
+
+def swap_predictor(version, wait=False):
+    """
+    Load a registry version in the background and atomically make it the active predictor
+
+    Requests keep using the current predictor until the new one is ready.
+
+    Args:
+        version: registry version id
+        wait: If True, block until the swap finished (used by tests/CLI)
+
+    Returns:
+        True if a swap was started, False if one is already running
+    """
+    with _swap_lock:
+        if _swap_state['status'] == 'loading':
+            return False
+        if _swap_state['target_version'] != version:
+            _swap_state['failures'] = 0
+        _swap_state.update({'status': 'loading', 'target_version': version, 'error': None,
+                            'next_retry': None})
+
+    thread = threading.Thread(target=_swap_worker, args=(version,),
+                              name=f'model-swap-{version}', daemon=True)
+    thread.start()
+    if wait:
+        thread.join()
+    return True
+
+
+def get_swap_status():
+    """Status of the last/ongoing hot swap"""
+    with _swap_lock:
+        return dict(_swap_state)
+
+
+def get_active_predictor():
+    """
+    Predictor serving traffic, following promotions made in other processes
+
+    The registry pointer is checked at most every POINTER_CHECK_INTERVAL
+    seconds; when it names another version, a background swap is started
+    and this call keeps returning the current predictor meanwhile. A failed
+    swap is retried with backoff (see get_swap_status()).
+    """
+    global _last_pointer_check, _last_pointer_mtime
+
+    predictor = get_predictor(lazy=True)
+    now = time.monotonic()
+    if now - _last_pointer_check < POINTER_CHECK_INTERVAL:
+        return predictor
+    _last_pointer_check = now
+
+    with _swap_lock:
+        retry = (_swap_state['status'] == 'failed'
+                 and _swap_retry_at is not None and now >= _swap_retry_at)
+        target = _swap_state['target_version']
+
+    registry = get_registry()
+    mtime = registry.pointer_mtime()
+    if mtime == _last_pointer_mtime and not retry:
+        return predictor
+    _last_pointer_mtime = mtime
+
+    current = registry.get_current_version()
+    if current and current != predictor.model_version and (target != current or retry):
+        swap_predictor(current)
+    return predictor
+
+
+def _empty_shadow_stats(version):
+    return {
+        'version': version,
+        'status': 'loading',
+        'error': None,
+        'requests': 0,
+        'agreements': 0,
+        'confidence_diff_sum': 0.0,
+        'status_pairs': Counter(),
+    }
+
+
+def _load_shadow(version):
+    global _shadow_predictor
+    try:
+        predictor = _load_version(version)
+    except Exception as e:
+        with _shadow_lock:
+            if _shadow_stats and _shadow_stats['version'] == version:
+                _shadow_stats.update({'status': 'failed', 'error': str(e)})
+        return
+
+    with _shadow_lock:
+        # Ignore a load that was superseded by another set_shadow_version call
+        if _shadow_stats and _shadow_stats['version'] == version:
+            _shadow_predictor = predictor
+            _shadow_stats['status'] = 'active'
+
+
+def set_shadow_version(version):
+    """
+    Start shadow scoring a registry version against live traffic (None stops it)
+
+    The shadow model is loaded in the background; its predictions are only
+    compared with the active model's and never returned to callers.
+    """
+    global _shadow_predictor, _shadow_stats
+    with _shadow_lock:
+        _shadow_predictor = None
+        _shadow_stats = _empty_shadow_stats(version) if version else None
+    if version:
+        _shadow_executor.submit(_load_shadow, version)
+
+
+def _score_shadow(predictor, primary_result, child_data):
+    try:
+        shadow_result = predictor.predict_from_child_data(child_data)
+    except Exception as e:
+        print(f"[WARNING] Shadow prediction failed: {e}")
+        return
+
+    primary_status = primary_result.get('nutrition_status')
+    shadow_status = shadow_result.get('nutrition_status')
+    with _shadow_lock:
+        # The shadow version may have been replaced while we were scoring
+        if _shadow_predictor is not predictor:
+            return
+        _shadow_stats['requests'] += 1
+        _shadow_stats['agreements'] += int(primary_status == shadow_status)
+        _shadow_stats['confidence_diff_sum'] += abs(
+            float(primary_result.get('confidence', 0)) - float(shadow_result.get('confidence', 0))
+        )
+        _shadow_stats['status_pairs'][f"{primary_status}->{shadow_status}"] += 1
+
+
+def shadow_score(primary_result, child_data):
+    """
+    Queue a shadow prediction for the same input as a served prediction
+
+    Args:
+        primary_result: result returned by the active predictor
+        child_data: the child_data dict that produced it
+    """
+    predictor = _shadow_predictor
+    if predictor is None or not primary_result:
+        return
+    _shadow_executor.submit(_score_shadow, predictor, primary_result, dict(child_data))
+
+
+def get_shadow_stats():
+    """Agreement between the active and the shadow model, or None if no shadow is set"""
+    with _shadow_lock:
+        if _shadow_stats is None:
+            return None
+        stats = dict(_shadow_stats)
+        stats['status_pairs'] = dict(_shadow_stats['status_pairs'])
+
+    n = stats['requests']
+    agreements = stats.pop('agreements')
+    diff_sum = stats.pop('confidence_diff_sum')
+    stats['agreement_rate'] = round(agreements / n, 4) if n else None
+    stats['mean_confidence_diff'] = round(diff_sum / n, 4) if n else None
+    return stats
+
+
 # Test function
 if __name__ == '__main__':
     print("\n" + "="*80)
@@ -11,15 +11,60 @@ from typing import Optional, Dict, List
 import os
 from dotenv import load_dotenv
 
+from http_client import get_http_client
+from price_cache import get_price_cache
+from price_series import get_price_series
+
 load_dotenv()
 
+# Records per page when syncing a whole state resource
+PAGE_SIZE = int(os.getenv('MANDI_PAGE_SIZE', 1000))
+
+# Upper bound on pages per sync (guards against a misreported total)
+MAX_PAGES = int(os.getenv('MANDI_MAX_PAGES', 200))
+
+
+def _arrival_sort_key(record: Dict) -> str:
+    """Sortable (ISO) form of a record's arrival_date ('' when unknown)"""
+    value = record.get('arrival_date') or ''
+    for fmt in ('%d/%m/%Y', '%Y-%m-%d', '%d-%m-%Y'):
+        try:
+            return datetime.strptime(value, fmt).strftime('%Y-%m-%d')
+        except ValueError:
+            continue
+    return ''
+
+
+def build_commodity_index(records: List[Dict]) -> Dict[str, Dict[str, Dict]]:
+    """
+    In-memory index of price records keyed by commodity, then market
+
+    Names are matched case-insensitively; for each (commodity, market) the
+    record with the latest arrival date is kept.
+
+    Returns:
+        {commodity_lower: {market_lower: record}}
+    """
+    index = {}
+    for record in records:
+        commodity = (record.get('commodity') or '').strip().lower()
+        market = (record.get('market') or '').strip().lower()
+        if not commodity:
+            continue
+        markets = index.setdefault(commodity, {})
+        current = markets.get(market)
+        if current is None or _arrival_sort_key(record) > _arrival_sort_key(current):
+            markets[market] = record
+    return index
+
+
 class MandiPriceAPI:
     """
     Integration with data.gov.in API for real-time mandi prices
     """
     
     # API Configuration
-    BASE_URL = "https://api.data.gov.in/resource"
+    BASE_URL = os.getenv('DATA_GOV_BASE_URL', "https://api.data.gov.in/resource")
     RESOURCE_ID = "9ef84268-d588-465a-a308-a864a43d0070"  # Daily commodity prices
     
     # Mapping of our ingredients to commodity names used in mandi data
@@ -114,11 +159,16 @@ class MandiPriceAPI:
         "Raichur", "Bijapur", "Gadag", "Haveri", "Koppal"
     ]
     
-    def __init__(self, api_key: Optional[str] = None):
-        """Initialize with API key"""
+    def __init__(self, api_key: Optional[str] = None, base_url: Optional[str] = None):
+        """Initialize with API key (and optionally another server, e.g. mock_mandi_server)"""
         self.api_key = api_key or os.getenv('DATA_GOV_API_KEY')
+        if base_url:
+            self.BASE_URL = base_url
         self.db_path = os.path.join(os.path.dirname(__file__), 'nutrition_advisor.db')
+        self.http = get_http_client()
+        self.cache = get_price_cache(self.db_path)
         self._ensure_price_table()
+        self.series = get_price_series(self.db_path)
     
     def _ensure_price_table(self):
         """Create price history table if not exists"""
@@ -142,6 +192,11 @@ class MandiPriceAPI:
             )
         ''')
         
+        cursor.execute('''
+            CREATE INDEX IF NOT EXISTS idx_mandi_prices_commodity_state
+            ON mandi_prices(commodity COLLATE NOCASE, state)
+        ''')
+        
         cursor.execute('''
             CREATE TABLE IF NOT EXISTS ingredient_price_history (
                 id INTEGER PRIMARY KEY AUTOINCREMENT,
@@ -176,6 +231,14 @@ class MandiPriceAPI:
             print("Warning: No API key configured. Using cached/sample data.")
             return self._get_sample_prices()
         
+        records = self.cache.get(state, commodity, limit,
+                                 lambda n: self._fetch_remote_prices(commodity, state, n))
+        if records is None:
+            return self._get_cached_prices(commodity, state)
+        return records
+    
+    def _fetch_remote_prices(self, commodity: str, state: str, limit: int) -> Optional[List[Dict]]:
+        """One data.gov.in request; None when it fails"""
         try:
             params = {
                 "api-key": self.api_key,
@@ -185,48 +248,96 @@ class MandiPriceAPI:
             }
             
             # Add filters
-            filters = []
             if state:
-                filters.append(f"state:{state}")
-            if commodity:
-                filters.append(f"commodity:{commodity}")
-            
-            if filters:
                 params["filters[state]"] = state
-                if commodity:
-                    params["filters[commodity]"] = commodity
+            if commodity:
+                params["filters[commodity]"] = commodity
             
             url = f"{self.BASE_URL}/{self.RESOURCE_ID}"
-            response = requests.get(url, params=params, timeout=30)
+            response = self.http.get(url, params=params, timeout=30)
             
             if response.status_code == 200:
                 data = response.json()
                 records = data.get("records", [])
                 
-                # Cache the fetched data
+                # Keep the price history table up to date
                 self._cache_prices(records)
                 
                 return records
             else:
                 print(f"API Error: {response.status_code} - {response.text}")
-                return self._get_cached_prices(commodity, state)
+                return None
                 
         except requests.exceptions.RequestException as e:
             print(f"Network error: {e}")
-            return self._get_cached_prices(commodity, state)
+            return None
     
-    def _cache_prices(self, records: List[Dict]):
-        """Cache fetched prices to database"""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
+    def fetch_state_prices(self, state: str = "Karnataka", page_size: int = PAGE_SIZE) -> List[Dict]:
+        """
+        Page through the whole daily price resource for a state
+        
+        One HTTP round trip per page instead of one per commodity. Falls
+        back to the cached prices for the state if the first page fails.
+        
+        Returns:
+            All price records of the state
+        """
+        if not self.api_key:
+            print("Warning: No API key configured. Using cached/sample data.")
+            return self._get_sample_prices()
         
+        url = f"{self.BASE_URL}/{self.RESOURCE_ID}"
+        records = []
+        complete = False  # paging reached the last page (not an error or MAX_PAGES)
+        for page in range(MAX_PAGES):
+            params = {
+                "api-key": self.api_key,
+                "format": "json",
+                "limit": page_size,
+                "offset": page * page_size,
+                "filters[state]": state,
+            }
+            try:
+                response = self.http.get(url, params=params, timeout=30)
+            except requests.exceptions.RequestException as e:
+                print(f"Network error on page {page + 1}: {e}")
+                break
+            if response.status_code != 200:
+                print(f"API Error on page {page + 1}: {response.status_code} - {response.text}")
+                break
+            
+            data = response.json()
+            batch = data.get("records", [])
+            records.extend(batch)
+            total = int(data.get("total", 0) or 0)
+            if len(batch) < page_size or (total and len(records) >= total):
+                complete = True
+                break
+        
+        if not records:
+            return self._get_cached_prices(state=state, limit=None)
+        
+        self._cache_prices(records)
+        if not complete:
+            # A partial list must not be cached as a commodity's complete price list
+            print(f"Warning: {state} price sync stopped after {len(records)} records; price cache not warmed")
+            return records
+        
+        # Warm the price cache: the state-wide list and every commodity's list
+        by_commodity = {'': records}
+        for record in records:
+            if record.get('commodity'):
+                by_commodity.setdefault(record['commodity'], []).append(record)
+        self.cache.put_many(state, by_commodity)
+        return records
+    
+    def _cache_prices(self, records: List[Dict]):
+        """Cache fetched prices to database (one executemany, one transaction)"""
+        fetched_at = datetime.now().isoformat()
+        rows = []
         for record in records:
             try:
-                cursor.execute('''
-                    INSERT OR REPLACE INTO mandi_prices 
-                    (commodity, state, district, market, variety, min_price, max_price, modal_price, arrival_date, fetched_at)
-                    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-                ''', (
+                rows.append((
                     record.get('commodity', ''),
                     record.get('state', ''),
                     record.get('district', ''),
@@ -236,15 +347,25 @@ class MandiPriceAPI:
                     float(record.get('max_price', 0) or 0),
                     float(record.get('modal_price', 0) or 0),
                     record.get('arrival_date', ''),
-                    datetime.now().isoformat()
+                    fetched_at
                 ))
-            except Exception as e:
+            except (TypeError, ValueError) as e:
                 print(f"Cache error for {record.get('commodity')}: {e}")
         
-        conn.commit()
-        conn.close()
+        conn = sqlite3.connect(self.db_path)
+        try:
+            conn.executemany('''
+                INSERT OR REPLACE INTO mandi_prices 
+                (commodity, state, district, market, variety, min_price, max_price, modal_price, arrival_date, fetched_at)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+            ''', rows)
+            conn.commit()
+        finally:
+            conn.close()
+        return len(rows)
     
-    def _get_cached_prices(self, commodity: str = None, state: str = None) -> List[Dict]:
+    def _get_cached_prices(self, commodity: str = None, state: str = None,
+                           limit: Optional[int] = 100) -> List[Dict]:
         """Get prices from cache"""
         conn = sqlite3.connect(self.db_path)
         cursor = conn.cursor()
@@ -253,13 +374,15 @@ class MandiPriceAPI:
         params = []
         
         if commodity:
-            query += " AND commodity LIKE ?"
-            params.append(f"%{commodity}%")
+            query += " AND commodity = ? COLLATE NOCASE"
+            params.append(commodity)
         if state:
             query += " AND state = ?"
             params.append(state)
         
-        query += " ORDER BY fetched_at DESC LIMIT 100"
+        query += " ORDER BY fetched_at DESC"
+        if limit:
+            query += f" LIMIT {int(limit)}"
         
         cursor.execute(query, params)
         rows = cursor.fetchall()
@@ -311,137 +434,158 @@ class MandiPriceAPI:
         
         # Fetch prices for this commodity
         prices = self.fetch_mandi_prices(commodity=commodity, state="Karnataka")
-        
+        return self._match_market(ingredient_name, commodity, prices, market)
+    
+    def _match_market(self, ingredient_name: str, commodity: str, prices: List[Dict],
+                      market: str) -> Optional[Dict]:
+        """Price for the requested market, else the first available one"""
         # Find price for specified market or nearest available
         for price in prices:
-            if market.lower() in price.get('market', '').lower():
-                # Convert from Rs/Quintal to Rs/kg
-                modal_price_per_kg = float(price.get('modal_price', 0)) / 100
-                return {
-                    'ingredient': ingredient_name,
-                    'commodity': commodity,
-                    'market': price.get('market'),
-                    'state': price.get('state'),
-                    'price_per_kg': modal_price_per_kg,
-                    'min_price_per_kg': float(price.get('min_price', 0)) / 100,
-                    'max_price_per_kg': float(price.get('max_price', 0)) / 100,
-                    'arrival_date': price.get('arrival_date'),
-                    'source': 'data.gov.in'
-                }
+            if market.lower() in (price.get('market') or '').lower():
+                return self._price_info(ingredient_name, commodity, price)
         
         # If no exact match, return first available
         if prices:
-            price = prices[0]
-            modal_price_per_kg = float(price.get('modal_price', 0)) / 100
-            return {
-                'ingredient': ingredient_name,
-                'commodity': commodity,
-                'market': price.get('market'),
-                'state': price.get('state'),
-                'price_per_kg': modal_price_per_kg,
-                'min_price_per_kg': float(price.get('min_price', 0)) / 100,
-                'max_price_per_kg': float(price.get('max_price', 0)) / 100,
-                'arrival_date': price.get('arrival_date'),
-                'source': 'data.gov.in'
-            }
+            return self._price_info(ingredient_name, commodity, prices[0])
         
         return None
     
-    def update_all_ingredient_prices(self, market: str = "Hubli") -> Dict:
+    def _price_info(self, ingredient_name: str, commodity: str, price: Dict) -> Dict:
+        """Price record converted from Rs/Quintal to Rs/kg"""
+        return {
+            'ingredient': ingredient_name,
+            'commodity': commodity,
+            'market': price.get('market'),
+            'state': price.get('state'),
+            'price_per_kg': float(price.get('modal_price', 0) or 0) / 100,
+            'min_price_per_kg': float(price.get('min_price', 0) or 0) / 100,
+            'max_price_per_kg': float(price.get('max_price', 0) or 0) / 100,
+            'arrival_date': price.get('arrival_date'),
+            'source': 'data.gov.in'
+        }
+    
+    def update_all_ingredient_prices(self, market: str = "Hubli", state: str = "Karnataka") -> Dict:
         """
         Update prices for all mapped ingredients
         
+        Pages through the state's price resource once, indexes it by
+        (commodity, market) in memory and resolves every ingredient from the
+        index; all writes happen in one transaction. Without an API key
+        nothing is written: the sample prices are not market data.
+        
         Returns:
             Summary of updated prices
         """
+        if not self.api_key:
+            print("Warning: No API key configured. Ingredient prices left unchanged.")
+            return {
+                'updated_count': 0,
+                'failed_count': 0,
+                'updated_ingredients': [],
+                'failed_ingredients': [],
+                'records_fetched': 0,
+                'source': 'sample'
+            }
+        
+        records = self.fetch_state_prices(state=state)
+        index = build_commodity_index(records)
+        
         updated = []
         failed = []
-        
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
+        history_rows = []
+        cost_rows = []
+        observation_rows = []
+        fetched_at = datetime.now().isoformat()
+        today = datetime.now().strftime('%Y-%m-%d')
         
         for ingredient, commodity in self.INGREDIENT_TO_COMMODITY.items():
-            try:
-                price_info = self.get_ingredient_price(ingredient, market)
-                
-                if price_info and price_info['price_per_kg'] > 0:
-                    # Update ingredient_price_history
-                    cursor.execute('''
-                        INSERT OR REPLACE INTO ingredient_price_history
-                        (ingredient_name, price_per_kg, source, market, state, recorded_date, fetched_at)
-                        VALUES (?, ?, ?, ?, ?, ?, ?)
-                    ''', (
-                        ingredient,
-                        price_info['price_per_kg'],
-                        'data.gov.in',
-                        price_info['market'],
-                        price_info['state'],
-                        price_info.get('arrival_date', datetime.now().strftime('%Y-%m-%d')),
-                        datetime.now().isoformat()
-                    ))
-                    
-                    # Also update main ingredients table
-                    cursor.execute('''
-                        UPDATE ingredients SET cost = ? WHERE name = ?
-                    ''', (price_info['price_per_kg'], ingredient))
-                    
-                    updated.append({
-                        'ingredient': ingredient,
-                        'new_price': price_info['price_per_kg'],
-                        'market': price_info['market']
-                    })
-                else:
-                    failed.append(ingredient)
-                    
-            except Exception as e:
-                print(f"Error updating {ingredient}: {e}")
+            markets = index.get(commodity.strip().lower(), {})
+            price_info = self._match_market(ingredient, commodity, list(markets.values()), market)
+            
+            if price_info and price_info['price_per_kg'] > 0:
+                history_rows.append((
+                    ingredient,
+                    price_info['price_per_kg'],
+                    'data.gov.in',
+                    price_info['market'],
+                    price_info['state'],
+                    price_info.get('arrival_date') or today,
+                    fetched_at
+                ))
+                cost_rows.append((price_info['price_per_kg'], ingredient))
+                observation_rows.append((
+                    ingredient,
+                    price_info['market'],
+                    price_info.get('arrival_date') or today,
+                    price_info['price_per_kg'],
+                    price_info['min_price_per_kg'],
+                    price_info['max_price_per_kg'],
+                    'data.gov.in'
+                ))
+                updated.append({
+                    'ingredient': ingredient,
+                    'new_price': price_info['price_per_kg'],
+                    'market': price_info['market']
+                })
+            else:
                 failed.append(ingredient)
         
-        conn.commit()
-        conn.close()
+        self.series.ensure_schema()
+        conn = sqlite3.connect(self.db_path)
+        try:
+            conn.executemany('''
+                INSERT OR REPLACE INTO ingredient_price_history
+                (ingredient_name, price_per_kg, source, market, state, recorded_date, fetched_at)
+                VALUES (?, ?, ?, ?, ?, ?, ?)
+            ''', history_rows)
+            # Also update main ingredients table
+            conn.executemany('''
+                UPDATE ingredients SET cost_per_kg = ? WHERE name = ?
+            ''', cost_rows)
+            self.series.record_many(observation_rows, conn=conn)
+            conn.commit()
+        finally:
+            conn.close()
         
         return {
             'updated_count': len(updated),
             'failed_count': len(failed),
             'updated_ingredients': updated,
-            'failed_ingredients': failed
+            'failed_ingredients': failed,
+            'records_fetched': len(records),
+            'source': 'data.gov.in'
         }
     
-    def get_price_trends(self, ingredient_name: str, days: int = 30) -> List[Dict]:
+    def get_price_trends(self, ingredient_name: str, days: int = 30,
+                         granularity: str = 'day') -> List[Dict]:
         """
         Get historical price trends for an ingredient
         
+        Reads the price time-series rollups; the window is on the price
+        (arrival) date, not on when the price was fetched.
+        
         Args:
             ingredient_name: Name of ingredient
             days: Number of days of history
+            granularity: 'day', 'week' or 'month'
             
         Returns:
-            List of price records
+            List of per-period, per-market prices (newest first)
         """
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        
-        cutoff_date = (datetime.now() - timedelta(days=days)).isoformat()
-        
-        cursor.execute('''
-            SELECT ingredient_name, price_per_kg, market, state, recorded_date
-            FROM ingredient_price_history
-            WHERE ingredient_name = ? AND fetched_at >= ?
-            ORDER BY recorded_date DESC
-        ''', (ingredient_name, cutoff_date))
-        
-        rows = cursor.fetchall()
-        conn.close()
+        start = (datetime.now() - timedelta(days=days)).date()
+        series = self.series.trend(ingredient_name, granularity, start=start)
         
         return [
             {
-                'ingredient': row[0],
-                'price_per_kg': row[1],
-                'market': row[2],
-                'state': row[3],
-                'date': row[4]
+                'ingredient': ingredient_name,
+                'price_per_kg': round(float(series['avg'][i]), 2),
+                'min_price_per_kg': float(series['min'][i]),
+                'max_price_per_kg': float(series['max'][i]),
+                'market': series['market'][i],
+                'date': str(series['period'][i]),
+                'observations': int(series['observations'][i])
             }
-            for row in rows
+            for i in reversed(range(len(series['period'])))
         ]
     
     def get_cheapest_markets(self, ingredient_name: str) -> List[Dict]:
@@ -459,18 +603,21 @@ class MandiPriceAPI:
             return []
         
         prices = self.fetch_mandi_prices(commodity=commodity, state="Karnataka", limit=50)
-        
+        return self._sorted_market_prices(prices)
+    
+    def _sorted_market_prices(self, prices: List[Dict]) -> List[Dict]:
+        """Price records converted to Rs/kg, cheapest first"""
         # Convert and sort by price
         market_prices = []
         for price in prices:
-            modal_price = float(price.get('modal_price', 0))
+            modal_price = float(price.get('modal_price', 0) or 0)
             if modal_price > 0:
                 market_prices.append({
                     'market': price.get('market'),
                     'district': price.get('district'),
                     'price_per_kg': modal_price / 100,  # Convert from quintal to kg
-                    'min_price_per_kg': float(price.get('min_price', 0)) / 100,
-                    'max_price_per_kg': float(price.get('max_price', 0)) / 100,
+                    'min_price_per_kg': float(price.get('min_price', 0) or 0) / 100,
+                    'max_price_per_kg': float(price.get('max_price', 0) or 0) / 100,
                     'arrival_date': price.get('arrival_date')
                 })
         
@@ -486,10 +633,19 @@ class MandiPriceAPI:
         Returns:
             Comparison data
         """
+        # One fetch per distinct commodity, all in flight at once
+        commodities = sorted({self.INGREDIENT_TO_COMMODITY[ingredient] for ingredient in ingredients
+                              if ingredient in self.INGREDIENT_TO_COMMODITY})
+        fetched = self.http.map(
+            lambda commodity: self.fetch_mandi_prices(commodity=commodity, state="Karnataka", limit=50),
+            commodities)
+        markets_by_commodity = {commodity: self._sorted_market_prices(prices)
+                                for commodity, prices in zip(commodities, fetched)}
+        
         comparison = {}
         
         for ingredient in ingredients:
-            markets = self.get_cheapest_markets(ingredient)
+            markets = markets_by_commodity.get(self.INGREDIENT_TO_COMMODITY.get(ingredient), [])
             if markets:
                 comparison[ingredient] = {
                     'cheapest_market': markets[0] if markets else None,
@@ -542,13 +698,36 @@ def register_mandi_routes(app):
         result = mandi_api.update_all_ingredient_prices(market)
         return jsonify({'success': True, 'result': result})
     
+    @app.route('/api/mandi-prices/cache-stats')
+    def api_mandi_cache_stats():
+        """Hit/miss/refresh counters of the price cache and HTTP client"""
+        return jsonify({
+            'success': True,
+            'cache': mandi_api.cache.get_stats(),
+            'http': mandi_api.http.get_stats()
+        })
+    
     @app.route('/api/price-trends/<ingredient_name>')
     def api_price_trends(ingredient_name):
         """Get price trends for an ingredient"""
         days = int(request.args.get('days', 30))
-        trends = mandi_api.get_price_trends(ingredient_name, days)
+        granularity = request.args.get('granularity', 'day')
+        if granularity not in ('day', 'week', 'month'):
+            return jsonify({'success': False, 'error': 'granularity must be day, week or month'}), 400
+        trends = mandi_api.get_price_trends(ingredient_name, days, granularity)
         return jsonify({'success': True, 'trends': trends})
     
+    @app.route('/api/price-forecast/<ingredient_name>')
+    def api_price_forecast(ingredient_name):
+        """Next-week price forecast for an ingredient, per market"""
+        from price_forecast import get_price_forecaster
+        
+        market = request.args.get('market')
+        forecasts = get_price_forecaster(mandi_api.db_path).get(ingredient_name, market)
+        if not forecasts:
+            return jsonify({'success': False, 'error': 'No price history for this ingredient'}), 404
+        return jsonify({'success': True, 'ingredient': ingredient_name, 'forecasts': forecasts})
+    
     @app.route('/api/cheapest-markets/<ingredient_name>')
     def api_cheapest_markets(ingredient_name):
         """Get cheapest markets for an ingredient"""
@@ -15,6 +15,114 @@ from sklearn.decomposition import TruncatedSVD
 import sqlite3
 from datetime import datetime, timedelta
 import json
+import copy
+
+from child_similarity import ChildSimilarityIndex
+from ingredient_index import IngredientPlanIndex, plan_ingredient_names
+from nutrient_density import CATALOG, get_nutrient_density_index
+
+# Columns of the child feature matrix (collaborative filtering)
+CHILD_FEATURE_COLUMNS = ['age', 'weight', 'height', 'gender', 'health_conditions',
+                         'avg_cost', 'nutrition_score', 'weight_trend', 'height_trend']
+
+# Measurements per child used for weight/height trends
+TREND_WINDOW = 5
+
+# Recent meal plans averaged into avg_cost / nutrition_score
+MEAL_HISTORY_WINDOW = 20
+
+# Ingredient columns scored by content-based filtering
+CONTENT_SCORE_COLUMNS = ['protein_per_100g', 'iron_per_100g', 'calcium_per_100g',
+                         'calories_per_100g', 'cost_per_kg']
+
+# Score weight per (nutrient priority, level) on the matching ingredient column;
+# cost always counts against an ingredient
+PRIORITY_WEIGHTS = {
+    ('protein', 'high'): ('protein_per_100g', 2.0),
+    ('iron', 'high'): ('iron_per_100g', 3.0),  # anemia risk
+    ('calcium', 'high'): ('calcium_per_100g', 2.0),  # bone growth
+    ('calories', 'high'): ('calories_per_100g', 0.1),
+    ('calories', 'low'): ('calories_per_100g', -0.05),
+}
+COST_WEIGHT = -0.1
+
+# Explanation shown with each recommendation, by source
+RECOMMENDATION_REASONS = {
+    'collaborative': 'Popular in successful meal plans of similar children',
+    'content-based': "Matches the child's nutritional priorities",
+    'hybrid': 'Similar children eat it and it matches nutritional priorities',
+    'matrix-factorization': "Fits the child's meal plan history",
+    'nutrition-density': 'High nutrition density and value',
+}
+
+# Latent factors of the child x ingredient interaction matrix
+SVD_COMPONENTS = 10
+
+
+def priority_levels(features):
+    """
+    Nutritional priority levels for many children at once
+    
+    Args:
+        features: DataFrame with age, weight, height, weight_trend and
+            health_conditions columns (child_features layout)
+    
+    Returns:
+        DataFrame of 'high' / 'medium' / 'low' per protein, iron, calcium, calories
+    """
+    age = features['age'].to_numpy(dtype=float)
+    weight = features['weight'].to_numpy(dtype=float)
+    height_m = features['height'].to_numpy(dtype=float) / 100
+    with np.errstate(divide='ignore', invalid='ignore'):
+        bmi = np.where(height_m > 0, weight / height_m ** 2, 0)
+    
+    levels = {name: np.full(len(features), 'medium', dtype=object)
+              for name in ('protein', 'iron', 'calcium', 'calories')}
+    
+    def raise_to(level, mask, *names):
+        for name in names:
+            levels[name][mask] = level
+    
+    # Age-based priorities
+    raise_to('high', age < 2, 'protein', 'calcium', 'calories')
+    raise_to('high', (age >= 2) & (age < 5), 'protein', 'iron', 'calcium')
+    # Losing weight
+    raise_to('high', features['weight_trend'].to_numpy(dtype=float) < -0.5, 'calories', 'protein')
+    # BMI-based priorities
+    underweight = (bmi < 14) & (age >= 2)
+    raise_to('high', underweight, 'calories', 'protein')
+    raise_to('low', (bmi > 18) & (age >= 2), 'calories')
+    # Health conditions
+    raise_to('high', features['health_conditions'].to_numpy(dtype=float) > 0, 'iron', 'protein')
+    
+    return pd.DataFrame(levels, index=features.index)
+
+
+def priority_weight_matrix(levels):
+    """Children x CONTENT_SCORE_COLUMNS weight matrix for priority levels"""
+    weights = np.zeros((len(levels), len(CONTENT_SCORE_COLUMNS)))
+    weights[:, CONTENT_SCORE_COLUMNS.index('cost_per_kg')] = COST_WEIGHT
+    for (nutrient, level), (column, weight) in PRIORITY_WEIGHTS.items():
+        mask = (levels[nutrient] == level).to_numpy()
+        weights[mask, CONTENT_SCORE_COLUMNS.index(column)] += weight
+    return weights
+
+
+def top_k_indices(scores, k):
+    """Indices of the k largest scores per row, best first (ties keep column order)"""
+    scores = np.atleast_2d(scores)
+    k = min(k, scores.shape[1])
+    if k <= 0:
+        return np.empty((scores.shape[0], 0), dtype=np.int64)
+    if k < scores.shape[1]:
+        candidates = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+        candidates.sort(axis=1)
+    else:
+        candidates = np.tile(np.arange(scores.shape[1]), (scores.shape[0], 1))
+    candidate_scores = np.take_along_axis(scores, candidates, axis=1)
+    order = np.argsort(-candidate_scores, axis=1, kind='stable')
+    return np.take_along_axis(candidates, order, axis=1)
+
 
 class MealRecommendationSystem:
     """
@@ -23,13 +131,35 @@ class MealRecommendationSystem:
     
     def __init__(self, db_path='nutrition_advisor.db'):
         self.db_path = db_path
-        self.scaler = StandardScaler()
-        self.collaborative_model = NearestNeighbors(n_neighbors=5, metric='cosine')
+        # Separate scalers so fitting one matrix never rescales the other
+        self.child_scaler = StandardScaler()
+        self.ingredient_scaler = StandardScaler()
+        self.similarity_index = None  # ChildSimilarityIndex over child_profiles
+        self.plan_index = None  # IngredientPlanIndex over meal_plans
         self.content_model = NearestNeighbors(n_neighbors=10, metric='cosine')
-        self.svd_model = TruncatedSVD(n_components=10)
-        self.child_profiles = None
+        self.svd_model = TruncatedSVD(n_components=SVD_COMPONENTS)
+        self.child_factors = None  # children x components (U * Sigma)
+        self.item_factors = None  # components x ingredients
+        self.interaction_children = None  # child_id per child_factors row
+        self.interaction_items = None  # ingredient name per item_factors column
+        self.child_features = None  # raw, unscaled
+        self.child_profiles = None  # scaled
+        self.child_stats = None  # running count / sum / sumsq per feature
+        self.index_dirty = 0  # rows changed since the neighbor index was fit
         self.meal_features = None
         self.ingredient_features = None
+        self.content_matrix = None  # derived from ingredient_features
+        self.trained_at = None
+        self.watermark = None
+    
+    @property
+    def scaler(self):
+        """Backward-compatible alias for the child feature scaler"""
+        return self.child_scaler
+    
+    @property
+    def is_trained(self):
+        return self.trained_at is not None
         
     def get_connection(self):
         """Get database connection"""
@@ -59,7 +189,7 @@ class MealRecommendationSystem:
         growth_latest_query = """
             SELECT weight_kg, height_cm, bmi
             FROM growth_tracking WHERE child_id = ?
-            ORDER BY measurement_date DESC LIMIT 1
+            ORDER BY measurement_date DESC, id DESC LIMIT 1
         """
         growth_latest = pd.read_sql_query(growth_latest_query, conn, params=(child_id,))
         
@@ -78,18 +208,18 @@ class MealRecommendationSystem:
         
         # Get child's meal history
         # Note: meal_plans table doesn't have child_id, so we'll use limited data
-        meal_history_query = """
+        meal_history_query = f"""
             SELECT id, created_at, total_cost, nutrition_score
             FROM meal_plans
-            ORDER BY created_at DESC LIMIT 20
+            ORDER BY created_at DESC LIMIT {MEAL_HISTORY_WINDOW}
         """
         meal_history = pd.read_sql_query(meal_history_query, conn)
         
         # Get growth measurements
-        growth_query = """
+        growth_query = f"""
             SELECT weight_kg, height_cm, bmi, measurement_date
             FROM growth_tracking WHERE child_id = ?
-            ORDER BY measurement_date DESC LIMIT 5
+            ORDER BY measurement_date DESC, id DESC LIMIT {TREND_WINDOW}
         """
         growth_data = pd.read_sql_query(growth_query, conn, params=(child_id,))
         
@@ -120,57 +250,233 @@ class MealRecommendationSystem:
         values = data[column].values
         return (values[0] - values[-1]) / len(values)
     
+    def load_child_features(self, conn=None, child_ids=None, meal_stats=None):
+        """
+        Raw (unscaled) features for every child, built set-based
+
+        Three queries instead of 4 per child: children, the last
+        TREND_WINDOW measurements per child (window function), and one
+        aggregate over recent meal plans. Ages, latest values and trends
+        are computed with vectorized pandas/groupby operations.
+
+        Args:
+            conn: optional open connection
+            child_ids: restrict to these children (incremental updates)
+            meal_stats: precomputed {'avg_cost', 'avg_score'} to skip the meal_plans query
+
+        Returns:
+            DataFrame indexed by child_id with CHILD_FEATURE_COLUMNS
+        """
+        child_filter = growth_filter = ''
+        params = []
+        if child_ids is not None:
+            child_ids = [int(child_id) for child_id in child_ids]
+            if not child_ids:
+                return self._child_features_frame(pd.DataFrame(), None, None)
+            placeholders = ','.join('?' for _ in child_ids)
+            child_filter = f"WHERE id IN ({placeholders})"
+            growth_filter = f"WHERE child_id IN ({placeholders})"
+            params = child_ids
+        
+        own_conn = conn is None
+        if own_conn:
+            conn = self.get_connection()
+        try:
+            children = pd.read_sql_query(f"""
+                SELECT id, date_of_birth, gender, health_notes
+                FROM children
+                {child_filter}
+            """, conn, params=params)
+            
+            growth = pd.read_sql_query(f"""
+                SELECT child_id, weight_kg, height_cm, rn
+                FROM (
+                    SELECT child_id, weight_kg, height_cm,
+                           ROW_NUMBER() OVER (
+                               PARTITION BY child_id
+                               ORDER BY measurement_date DESC, id DESC
+                           ) AS rn
+                    FROM growth_tracking
+                    {growth_filter}
+                ) recent
+                WHERE rn <= {TREND_WINDOW}
+            """, conn, params=params)
+            
+            # Same recent-plans window prepare_child_profile uses (shared by all children)
+            if meal_stats is None:
+                meal_stats = pd.read_sql_query(f"""
+                    SELECT AVG(total_cost) AS avg_cost, AVG(nutrition_score) AS avg_score
+                    FROM (
+                        SELECT total_cost, nutrition_score
+                        FROM meal_plans
+                        ORDER BY created_at DESC LIMIT {MEAL_HISTORY_WINDOW}
+                    ) recent_plans
+                """, conn)
+            else:
+                meal_stats = pd.DataFrame([meal_stats])
+        finally:
+            if own_conn:
+                conn.close()
+        
+        return self._child_features_frame(children, growth, meal_stats)
+    
+    def _child_features_frame(self, children, growth, meal_stats):
+        """Vectorized feature computation from the bulk query results"""
+        if children.empty:
+            return pd.DataFrame(columns=CHILD_FEATURE_COLUMNS, dtype=float)
+        
+        features = pd.DataFrame(index=children['id'].values)
+        features.index.name = 'child_id'
+        
+        dob = pd.to_datetime(children['date_of_birth'], errors='coerce')
+        age_years = (pd.Timestamp(datetime.now()) - dob).dt.days / 365.25
+        features['age'] = age_years.fillna(age_years.median()).values
+        
+        # Latest measurement (rn == 1) or the prepare_child_profile defaults
+        latest = growth[growth['rn'] == 1].set_index('child_id')
+        features['weight'] = latest['weight_kg'].reindex(features.index).fillna(15.0)
+        features['height'] = latest['height_cm'].reindex(features.index).fillna(85.0)
+        
+        features['gender'] = (children['gender'] == 'M').astype(int).values
+        notes = children['health_notes']
+        features['health_conditions'] = (notes.notna() & (notes.astype(str).str.len() > 0)).astype(int).values
+        
+        avg_cost = meal_stats['avg_cost'].iloc[0] if not meal_stats.empty else None
+        avg_score = meal_stats['avg_score'].iloc[0] if not meal_stats.empty else None
+        features['avg_cost'] = 0 if pd.isna(avg_cost) else avg_cost
+        features['nutrition_score'] = 0 if pd.isna(avg_score) else avg_score
+        
+        # Trend = (newest - oldest) / n over the last TREND_WINDOW measurements
+        by_child = growth.sort_values(['child_id', 'rn']).groupby('child_id')
+        counts = by_child.size()
+        for column, name in (('weight_kg', 'weight_trend'), ('height_cm', 'height_trend')):
+            trend = (by_child[column].first() - by_child[column].last()) / counts
+            trend[counts < 2] = 0
+            features[name] = trend.reindex(features.index).fillna(0)
+        
+        return features[CHILD_FEATURE_COLUMNS].astype(float)
+    
     def build_child_feature_matrix(self):
         """Build feature matrix for all children for collaborative filtering"""
-        conn = self.get_connection()
+        features = self.load_child_features()
         
-        # Get all children
-        children_query = """
-            SELECT id
-            FROM children
-        """
-        children_df = pd.read_sql_query(children_query, conn)
-        conn.close()
-        
-        if children_df.empty:
+        if features.empty:
             return None
         
-        # Create feature matrix
-        features = []
-        child_ids = []
-        
-        for _, child in children_df.iterrows():
-            profile = self.prepare_child_profile(child['id'])
-            if profile:
-                child_ids.append(child['id'])
-                features.append([
-                    profile['age_years'],
-                    profile['weight_kg'],
-                    profile['height_cm'],
-                    profile['gender'],
-                    profile['has_health_conditions'],
-                    profile['avg_meal_cost'],
-                    profile['avg_nutrition_score'],
-                    profile['weight_trend'],
-                    profile['height_trend']
-                ])
-        
-        if not features:
-            return None
-        
-        feature_matrix = np.array(features)
         # Normalize features
-        feature_matrix_scaled = self.scaler.fit_transform(feature_matrix)
+        self.child_features = features
+        feature_matrix_scaled = self.child_scaler.fit_transform(features.values)
+        self._init_running_stats()
         
         self.child_profiles = pd.DataFrame(
             feature_matrix_scaled,
-            columns=['age', 'weight', 'height', 'gender', 'health_conditions', 
-                    'avg_cost', 'nutrition_score', 'weight_trend', 'height_trend'],
-            index=child_ids
+            columns=CHILD_FEATURE_COLUMNS,
+            index=features.index.tolist()
         )
         
         return self.child_profiles
     
+    # ==================== INCREMENTAL UPDATES ====================
+    
+    def _init_running_stats(self):
+        """Per-column count / sum / sum of squares behind child_scaler"""
+        X = self.child_features.values.astype(np.float64)
+        self.child_stats = {
+            'n': len(X),
+            'sum': X.sum(axis=0),
+            'sumsq': (X ** 2).sum(axis=0),
+        }
+        self.index_dirty = 0
+    
+    def _apply_running_stats(self):
+        """Point a copy of child_scaler at the current running mean / variance"""
+        n = self.child_stats['n']
+        mean = self.child_stats['sum'] / n
+        var = np.maximum(self.child_stats['sumsq'] / n - mean ** 2, 0.0)
+        # Constant columns keep unit scale, as StandardScaler does
+        constant = var <= 1e-12 * np.maximum(1.0, mean ** 2)
+        scaler = copy.copy(self.child_scaler)
+        scaler.mean_ = mean
+        scaler.var_ = np.where(constant, 0.0, var)
+        scaler.scale_ = np.where(constant, 1.0, np.sqrt(var))
+        scaler.n_samples_seen_ = n
+        self.child_scaler = scaler
+    
+    def clone(self):
+        """
+        Shallow copy sharing the trained artifacts
+        
+        update_child_features() and refresh_index() replace the frames,
+        statistics, scaler and index they change instead of mutating them,
+        so running them on a clone leaves this instance untouched.
+        """
+        return copy.copy(self)
+    
+    def update_child_features(self, child_ids):
+        """
+        Recompute the feature rows of a few children after new measurements
+        
+        Only these rows are re-queried; the scaler's running statistics are
+        adjusted by the old/new row difference, and the updated rows are
+        re-scaled. Other rows and the neighbor index keep the previous
+        scaling until refresh_index() runs (index_dirty counts pending rows).
+        The changed frames are copies, assigned once complete.
+        
+        Returns:
+            Number of rows updated
+        """
+        if self.child_features is None or self.child_stats is None:
+            return 0
+        
+        meal_stats = {
+            'avg_cost': float(self.child_features['avg_cost'].iloc[0]),
+            'avg_score': float(self.child_features['nutrition_score'].iloc[0]),
+        } if len(self.child_features) else None
+        rows = self.load_child_features(child_ids=child_ids, meal_stats=meal_stats)
+        if rows.empty:
+            return 0
+        
+        features = self.child_features.copy()
+        stats = {
+            'n': self.child_stats['n'],
+            'sum': self.child_stats['sum'].copy(),
+            'sumsq': self.child_stats['sumsq'].copy(),
+        }
+        for child_id, row in rows.iterrows():
+            new = row.values.astype(np.float64)
+            if child_id in features.index:
+                old = features.loc[child_id].values.astype(np.float64)
+            else:
+                old = np.zeros_like(new)
+                stats['n'] += 1
+            stats['sum'] += new - old
+            stats['sumsq'] += new ** 2 - old ** 2
+            features.loc[child_id] = new
+        
+        self.child_features, self.child_stats = features, stats
+        self._apply_running_stats()
+        profiles = self.child_profiles.copy()
+        scaled = self.child_scaler.transform(rows.values)
+        for child_id, scaled_row in zip(rows.index, scaled):
+            profiles.loc[child_id] = scaled_row
+        self.child_profiles = profiles
+        
+        self.index_dirty += len(rows)
+        return len(rows)
+    
+    def refresh_index(self):
+        """Re-scale every row with the current statistics and refit the neighbor index"""
+        if self.child_features is None:
+            return False
+        self.child_profiles = pd.DataFrame(
+            self.child_scaler.transform(self.child_features.values),
+            columns=CHILD_FEATURE_COLUMNS,
+            index=self.child_features.index.tolist()
+        )
+        self.index_dirty = 0
+        self._build_similarity_index()
+        return True
+    
     def build_ingredient_feature_matrix(self):
         """Build feature matrix for ingredients (content-based filtering)"""
         conn = self.get_connection()
@@ -193,7 +499,8 @@ class MealRecommendationSystem:
                           'iron_per_100g', 'calcium_per_100g']
         
         features = ingredients_df[feature_columns].fillna(0)
-        features_scaled = self.scaler.fit_transform(features)
+        features_scaled = self.ingredient_scaler.fit_transform(features)
+        self.content_matrix = None
         
         self.ingredient_features = pd.DataFrame(
             features_scaled,
@@ -208,45 +515,67 @@ class MealRecommendationSystem:
     # ==================== COLLABORATIVE FILTERING ====================
     
     def train_collaborative_model(self):
-        """Train collaborative filtering model using child similarity"""
+        """Build the child similarity index used for collaborative filtering"""
         if self.child_profiles is None:
             self.build_child_feature_matrix()
         
         if self.child_profiles is None or len(self.child_profiles) < 2:
             return False
         
-        # Fit nearest neighbors model
-        self.collaborative_model.fit(self.child_profiles.values)
+        self._build_similarity_index()
         return True
     
-    def find_similar_children(self, child_id, n_neighbors=5):
-        """
-        Find children similar to the given child
-        Returns: List of (child_id, similarity_score) tuples
+    def _build_similarity_index(self, conn=None):
+        """Index the scaled child profiles, grouped by village for pre-filtering"""
+        own_conn = conn is None
+        if own_conn:
+            conn = self.get_connection()
+        try:
+            villages = pd.read_sql_query("SELECT id, village FROM children", conn)
+        finally:
+            if own_conn:
+                conn.close()
+        villages = villages.set_index('id')['village']
+        self.similarity_index = ChildSimilarityIndex().build(self.child_profiles, villages)
+        return self.similarity_index
+    
+    def similar_children(self, child_id, top_n=5, village=None):
         """
-        if self.child_profiles is None or child_id not in self.child_profiles.index:
-            return []
+        Nearest children by cosine similarity of scaled profiles
         
-        child_features = self.child_profiles.loc[child_id].values.reshape(1, -1)
-        distances, indices = self.collaborative_model.kneighbors(child_features, n_neighbors=n_neighbors+1)
+        Args:
+            child_id: query child (must have a feature row)
+            top_n: number of neighbors
+            village: only search children of this village
         
-        similar_children = []
-        for i, idx in enumerate(indices[0][1:]):  # Skip first (self)
-            similar_child_id = self.child_profiles.index[idx]
-            similarity = 1 - distances[0][i+1]  # Convert distance to similarity
-            similar_children.append((similar_child_id, similarity))
+        Returns:
+            List of (child_id, similarity_score) tuples, most similar first
+        """
+        if (self.similarity_index is None or self.child_profiles is None
+                or child_id not in self.child_profiles.index):
+            return []
         
-        return similar_children
+        # The profile row carries incremental updates not yet in the index
+        vector = self.child_profiles.loc[child_id].values
+        return self.similarity_index.query(vector, k=top_n, village=village, exclude=child_id)
     
     def get_collaborative_recommendations(self, child_id, top_n=10):
         """
         Get meal recommendations based on what similar children ate
         """
-        similar_children = self.find_similar_children(child_id, n_neighbors=5)
-        
+        similar_children = self.similar_children(child_id, top_n=5)
+        return self._collaborative_scores(similar_children, top_n)
+    
+    def _collaborative_scores(self, similar_children, top_n):
+        """Top ingredients of similar children's successful plans"""
         if not similar_children:
             return []
         
+        if self.plan_index is not None:
+            ingredient_scores = self.plan_index.neighbor_plan_scores(similar_children, min_score=70, limit=50)
+            sorted_ingredients = sorted(ingredient_scores.items(), key=lambda x: x[1], reverse=True)
+            return sorted_ingredients[:top_n]
+        
         conn = self.get_connection()
         
         # Get successful meal plans from similar children
@@ -276,10 +605,9 @@ class MealRecommendationSystem:
         for _, row in recommendations.iterrows():
             if row['ingredients']:
                 try:
-                    ingredients = json.loads(row['ingredients'])
                     child_similarity = dict(similar_children).get(row['child_id'], 0.5)
                     
-                    for ing_name, quantity in ingredients.items():
+                    for ing_name in plan_ingredient_names(row['ingredients']):
                         if ing_name not in ingredient_scores:
                             ingredient_scores[ing_name] = 0
                         # Weight by nutrition score and child similarity
@@ -317,89 +645,62 @@ class MealRecommendationSystem:
         # Determine nutritional priorities based on child profile
         priorities = self._determine_nutritional_priorities(profile)
         
+        # Ingredient features come from the trained artifacts; never build them per request
         if self.ingredient_features is None:
-            self.build_ingredient_feature_matrix()
+            return []
         
-        # Score ingredients based on priorities
-        ingredient_scores = []
+        weights = priority_weight_matrix(pd.DataFrame([priorities]))[0]
+        scores = self._content_matrix() @ weights
         
-        for ing_id, ing_data in self.ingredient_features.iterrows():
-            score = 0
-            
-            # High protein priority
-            if priorities['protein'] == 'high':
-                score += ing_data['protein_per_100g'] * 2
-            
-            # High iron priority (for anemia risk)
-            if priorities['iron'] == 'high':
-                score += ing_data['iron_per_100g'] * 3
-            
-            # High calcium priority (for bone growth)
-            if priorities['calcium'] == 'high':
-                score += ing_data['calcium_per_100g'] * 2
-            
-            # Calorie needs
-            if priorities['calories'] == 'high':
-                score += ing_data['calories_per_100g'] * 0.1
-            elif priorities['calories'] == 'low':
-                score -= ing_data['calories_per_100g'] * 0.05
-            
-            # Budget consideration
-            score -= ing_data['cost_per_kg'] * 0.1
-            
-            ingredient_scores.append((ing_data['name'], score))
+        names = self.ingredient_features['name'].to_numpy()
+        return [(names[i], float(scores[i])) for i in top_k_indices(scores, top_n)[0]]
+    
+    def get_content_based_recommendations_batch(self, child_ids, top_n=10):
+        """
+        Content-based recommendations for many children at once
         
-        # Sort and return top recommendations
-        sorted_ingredients = sorted(ingredient_scores, key=lambda x: x[1], reverse=True)
-        return sorted_ingredients[:top_n]
+        Priorities come from the trained child feature rows; scores for all
+        children are one (children x columns) @ (columns x ingredients)
+        product with a row-wise argpartition top-k.
+        
+        Returns:
+            {child_id: [(ingredient_name, score), ...]} for children with a feature row
+        """
+        if self.ingredient_features is None or self.child_features is None:
+            return {}
+        features = self.child_features.loc[self.child_features.index.intersection(list(child_ids))]
+        if features.empty:
+            return {}
+        
+        weights = priority_weight_matrix(priority_levels(features))
+        scores = weights @ self._content_matrix().T
+        
+        names = self.ingredient_features['name'].to_numpy()
+        top = top_k_indices(scores, top_n)
+        return {
+            int(child_id): [(names[i], float(scores[row, i])) for i in top[row]]
+            for row, child_id in enumerate(features.index)
+        }
+    
+    def _content_matrix(self):
+        """Contiguous ingredients x CONTENT_SCORE_COLUMNS matrix of scaled features"""
+        if self.content_matrix is None or len(self.content_matrix) != len(self.ingredient_features):
+            self.content_matrix = np.ascontiguousarray(
+                self.ingredient_features[CONTENT_SCORE_COLUMNS].to_numpy(dtype=np.float64))
+        return self.content_matrix
     
     def _determine_nutritional_priorities(self, profile):
         """
         Determine nutritional priorities based on child profile
         """
-        priorities = {
-            'protein': 'medium',
-            'iron': 'medium',
-            'calcium': 'medium',
-            'calories': 'medium'
-        }
-        
-        age = profile['age_years']
-        weight = profile['weight_kg']
-        height = profile['height_cm']
-        
-        # Calculate BMI
-        height_m = height / 100
-        bmi = weight / (height_m ** 2) if height_m > 0 else 0
-        
-        # Age-based priorities
-        if age < 2:
-            priorities['protein'] = 'high'
-            priorities['calcium'] = 'high'
-            priorities['calories'] = 'high'
-        elif age < 5:
-            priorities['protein'] = 'high'
-            priorities['iron'] = 'high'
-            priorities['calcium'] = 'high'
-        
-        # Weight-based priorities
-        if profile['weight_trend'] < -0.5:  # Losing weight
-            priorities['calories'] = 'high'
-            priorities['protein'] = 'high'
-        
-        # BMI-based priorities
-        if bmi < 14 and age >= 2:  # Underweight
-            priorities['calories'] = 'high'
-            priorities['protein'] = 'high'
-        elif bmi > 18 and age >= 2:  # Overweight
-            priorities['calories'] = 'low'
-        
-        # Health conditions
-        if profile['has_health_conditions']:
-            priorities['iron'] = 'high'
-            priorities['protein'] = 'high'
-        
-        return priorities
+        features = pd.DataFrame([{
+            'age': profile['age_years'],
+            'weight': profile['weight_kg'],
+            'height': profile['height_cm'],
+            'weight_trend': profile['weight_trend'],
+            'health_conditions': profile['has_health_conditions'],
+        }])
+        return priority_levels(features).iloc[0].to_dict()
     
     # ==================== HYBRID RECOMMENDATIONS ====================
     
@@ -411,8 +712,36 @@ class MealRecommendationSystem:
         # Get both types of recommendations
         collab_recs = self.get_collaborative_recommendations(child_id, top_n=20)
         content_recs = self.get_content_based_recommendations(child_id, top_n=20)
+        return self._combine_hybrid(collab_recs, content_recs, top_n)
+    
+    def get_hybrid_recommendations_batch(self, child_ids, top_n=15):
+        """
+        Hybrid recommendations for many children at once (materialization)
+        
+        Neighbours come from one blocked similarity query per chunk and
+        content scores from one matrix product; content priorities use the
+        trained child feature rows.
         
-        # Combine scores with weights
+        Returns:
+            {child_id: [(ingredient_name, score, source), ...]}
+        """
+        if self.child_profiles is None or self.similarity_index is None:
+            return {}
+        child_ids = [child_id for child_id in child_ids if child_id in self.child_profiles.index]
+        if not child_ids:
+            return {}
+        
+        neighbors = self.similarity_index.query_many(
+            self.child_profiles.loc[child_ids].values, k=5, exclude=child_ids)
+        content = self.get_content_based_recommendations_batch(child_ids, top_n=20)
+        return {
+            int(child_id): self._combine_hybrid(self._collaborative_scores(similar, 20),
+                                                content.get(int(child_id), []), top_n)
+            for child_id, similar in zip(child_ids, neighbors)
+        }
+    
+    def _combine_hybrid(self, collab_recs, content_recs, top_n):
+        """Weighted merge of collaborative (0.6) and content-based (0.4) scores"""
         combined_scores = {}
         
         # Add collaborative filtering recommendations (weight: 0.6)
@@ -476,6 +805,9 @@ class MealRecommendationSystem:
         ingredients_df = pd.read_sql_query(query, conn, params=ingredient_names)
         conn.close()
         
+        # First row per name, like the per-name filter it replaces
+        categories = dict(zip(ingredients_df['name'][::-1], ingredients_df['category'][::-1]))
+        
         # Create weekly meal plan with variety
         weekly_plan = []
         used_ingredients = set()
@@ -492,14 +824,11 @@ class MealRecommendationSystem:
             
             # Select diverse ingredients for each day
             for rec_name, rec_score, rec_source in recommendations:
-                ing_data = ingredients_df[ingredients_df['name'] == rec_name]
+                category = categories.get(rec_name)
                 
-                if ing_data.empty:
+                if category is None:
                     continue
                 
-                ing = ing_data.iloc[0]
-                category = ing['category']
-                
                 # Ensure variety - don't repeat ingredients too soon
                 if rec_name in used_ingredients and len(day_plan['ingredients']) > 0:
                     continue
@@ -536,54 +865,118 @@ class MealRecommendationSystem:
     
     # ==================== INGREDIENT ACCEPTANCE PREDICTION ====================
     
+    def build_plan_index(self):
+        """Inverted ingredient -> meal plan index used for acceptance prediction"""
+        conn = self.get_connection()
+        try:
+            self.plan_index = IngredientPlanIndex().build(conn)
+        finally:
+            conn.close()
+        return self.plan_index
+    
+    def add_meal_plan(self, plan_id, child_id, ingredients, nutrition_score):
+        """Index a newly saved meal plan (meal plan listener)"""
+        if self.plan_index is None:
+            return False
+        return self.plan_index.add_plan(plan_id, child_id, ingredients, nutrition_score)
+    
+    def ingredient_acceptance(self, child_id, ingredient_names):
+        """
+        Acceptance probabilities of several ingredients in one pass
+        
+        Based on similar children's meal plans, weighted by similarity.
+        
+        Returns:
+            numpy array aligned with ingredient_names (0.5 = no evidence)
+        """
+        if self.plan_index is None:
+            return np.full(len(ingredient_names), 0.5)
+        similar_children = self.similar_children(child_id, top_n=10)
+        return self.plan_index.acceptance(similar_children, list(ingredient_names))
+    
     def predict_ingredient_acceptance(self, child_id, ingredient_name):
         """
         Predict whether a child will accept a particular ingredient
         Based on similar children's consumption patterns
         """
-        similar_children = self.find_similar_children(child_id, n_neighbors=10)
+        return float(self.ingredient_acceptance(child_id, [ingredient_name])[0])
+    
+    # ==================== MATRIX FACTORIZATION ====================
+    
+    def build_interaction_matrix(self):
+        """
+        Sparse child x ingredient interaction matrix from meal_plans
         
-        if not similar_children:
-            return 0.5  # Neutral prediction
+        A plan weighs in by its average meal_feedback rating (scaled to 0-1)
+        when it has feedback, otherwise by its nutrition score.
+        
+        Returns:
+            (child_ids, CSR matrix, ingredient names)
+        """
+        if self.plan_index is None:
+            self.build_plan_index()
         
         conn = self.get_connection()
+        try:
+            ratings = pd.read_sql_query("""
+                SELECT plan_id, AVG(rating) AS rating
+                FROM meal_feedback
+                WHERE rating IS NOT NULL
+                GROUP BY plan_id
+            """, conn)
+        except (pd.errors.DatabaseError, sqlite3.OperationalError):
+            ratings = pd.DataFrame(columns=['plan_id', 'rating'])
+        finally:
+            conn.close()
         
-        # Get meal plans from similar children that included this ingredient
-        acceptance_count = 0
-        total_count = 0
-        
-        for similar_child_id, similarity in similar_children:
-            query = """
-                SELECT ingredients, nutrition_score
-                FROM meal_plans
-                WHERE child_id = ?
-                AND nutrition_score >= 60
-            """
-            
-            plans = pd.read_sql_query(query, conn, params=(similar_child_id,))
-            
-            for _, plan in plans.iterrows():
-                if plan['ingredients']:
-                    try:
-                        ingredients = json.loads(plan['ingredients'])
-                        total_count += 1
-                        if ingredient_name in ingredients:
-                            acceptance_count += similarity  # Weight by similarity
-                    except:
-                        pass
+        plan_weights = ratings.set_index('plan_id')['rating'].astype(float) / 5.0
+        return self.plan_index.child_ingredient_matrix(plan_weights)
+    
+    def train_svd_model(self):
+        """Fit TruncatedSVD on the interaction matrix and keep the latent factors"""
+        child_ids, matrix, names = self.build_interaction_matrix()
+        n_components = min(SVD_COMPONENTS, matrix.shape[0] - 1, matrix.shape[1] - 1)
+        if n_components < 1 or matrix.nnz == 0:
+            self.child_factors = self.item_factors = None
+            return False
         
-        conn.close()
+        self.svd_model = TruncatedSVD(n_components=n_components, random_state=42)
+        self.child_factors = self.svd_model.fit_transform(matrix)
+        self.item_factors = np.ascontiguousarray(self.svd_model.components_)
+        self.interaction_children = pd.Index(child_ids)
+        self.interaction_items = np.array(names, dtype=object)
+        return True
+    
+    def get_svd_recommendations(self, child_id, top_n=10):
+        """
+        Ingredient recommendations from latent factors
         
-        if total_count == 0:
-            return 0.5
+        One (components) @ (components x ingredients) product, independent
+        of how many plans or children there are.
+        
+        Returns:
+            List of (ingredient_name, score); empty for children without meal plans
+        """
+        if self.child_factors is None:
+            return []
+        row = self.interaction_children.get_indexer([child_id])[0]
+        if row < 0:
+            return []
         
-        acceptance_probability = acceptance_count / total_count
-        return min(1.0, max(0.0, acceptance_probability))
+        scores = self.child_factors[row] @ self.item_factors
+        return [(self.interaction_items[i], float(scores[i]))
+                for i in top_k_indices(scores, top_n)[0]]
     
     # ==================== TRAINING AND INITIALIZATION ====================
     
-    def train_all_models(self):
-        """Train all recommendation models"""
+    def train_all_models(self, watermark=None):
+        """
+        Train all recommendation models
+        
+        Args:
+            watermark: data watermark the training data corresponds to
+                (recorded with the artifacts so staleness can be detected)
+        """
         print("Building child feature matrix...")
         self.build_child_feature_matrix()
         
@@ -596,15 +989,49 @@ class MealRecommendationSystem:
         print("Training content-based filtering model...")
         content_success = self.train_content_model()
         
+        print("Building meal plan ingredient index...")
+        self.build_plan_index()
+        
+        print("Training matrix factorization model...")
+        self.train_svd_model()
+        
+        self.trained_at = datetime.now().isoformat()
+        self.watermark = watermark
         return collab_success and content_success
     
+    # ==================== ARTIFACTS ====================
+    
+    ARTIFACT_ATTRIBUTES = ('child_scaler', 'ingredient_scaler', 'similarity_index',
+                           'content_model', 'child_features', 'child_profiles',
+                           'child_stats', 'index_dirty', 'ingredient_features', 'plan_index',
+                           'svd_model', 'child_factors', 'item_factors',
+                           'interaction_children', 'interaction_items',
+                           'trained_at', 'watermark')
+    
+    def export_artifacts(self):
+        """Trained state as a picklable dict (see recommender_store)"""
+        return {name: getattr(self, name) for name in self.ARTIFACT_ATTRIBUTES}
+    
+    def load_artifacts(self, artifacts):
+        """Restore state produced by export_artifacts()"""
+        for name in self.ARTIFACT_ATTRIBUTES:
+            setattr(self, name, artifacts.get(name))
+        self.index_dirty = self.index_dirty or 0
+        self.svd_model = self.svd_model or TruncatedSVD(n_components=SVD_COMPONENTS)
+        if self.similarity_index is None and self.child_profiles is not None and len(self.child_profiles) >= 2:
+            # Artifacts saved before the similarity index existed
+            self._build_similarity_index()
+        if self.plan_index is None and self.trained_at is not None:
+            self.build_plan_index()
+        return self
+    
     def get_recommendation_explanation(self, child_id, ingredient_name):
         """
         Provide explanation for why an ingredient was recommended
         """
         profile = self.prepare_child_profile(child_id)
         priorities = self._determine_nutritional_priorities(profile)
-        similar_children = self.find_similar_children(child_id, n_neighbors=3)
+        similar_children = self.similar_children(child_id, top_n=3)
         acceptance = self.predict_ingredient_acceptance(child_id, ingredient_name)
         
         explanation = {
@@ -625,7 +1052,7 @@ class MealRecommendationSystem:
         
         Args:
             child_id: ID of the child
-            recommendation_type: 'hybrid', 'collaborative', or 'content'
+            recommendation_type: 'hybrid', 'collaborative', 'content' or 'svd'
             top_n: Number of recommendations to return
             
         Returns:
@@ -633,59 +1060,67 @@ class MealRecommendationSystem:
         """
         try:
             if recommendation_type == 'collaborative':
-                return self.collaborative_recommendations(child_id, top_n=top_n)
+                recommendations = [(name, score, 'collaborative') for name, score
+                                   in self.get_collaborative_recommendations(child_id, top_n=top_n)]
             elif recommendation_type == 'content':
-                return self.content_based_recommendations(child_id, top_n=top_n)
+                recommendations = [(name, score, 'content-based') for name, score
+                                   in self.get_content_based_recommendations(child_id, top_n=top_n)]
+            elif recommendation_type == 'svd':
+                recommendations = [(name, score, 'matrix-factorization') for name, score
+                                   in self.get_svd_recommendations(child_id, top_n=top_n)]
             else:  # hybrid (default)
-                return self.hybrid_recommendations(child_id, top_n=top_n)
+                recommendations = self.get_hybrid_recommendations(child_id, top_n=top_n)
         except Exception as e:
             print(f"Error generating recommendations: {e}")
+            recommendations = []
+        
+        if not recommendations:
             # Fallback to simple recommendations based on nutrition data
             return self._get_fallback_recommendations(child_id, top_n)
+        return self.format_recommendations(recommendations)
+    
+    def format_recommendations(self, recommendations):
+        """(name, score, source) tuples as the dicts served by the API"""
+        categories = {}
+        if self.ingredient_features is not None:
+            categories = dict(zip(self.ingredient_features['name'], self.ingredient_features['category']))
+        return [{
+            'ingredient_name': name,
+            'category': categories.get(name, 'Other'),
+            'score': round(float(score), 4),
+            'source': source,
+            'reason': RECOMMENDATION_REASONS.get(source, ''),
+        } for name, score, source in recommendations]
     
     def _get_fallback_recommendations(self, child_id, top_n=10):
         """
         Fallback recommendations when ML models aren't trained
         Based on nutritional needs and popular ingredients
         """
-        conn = self.get_connection()
-        
-        # Get all ingredients ranked by nutrition score
-        query = """
-            SELECT name, category, protein_per_100g, iron_per_100g, 
-                   calcium_per_100g, calories_per_100g, cost_per_kg
-            FROM ingredients
-            WHERE protein_per_100g > 0 AND iron_per_100g > 0
-            ORDER BY (protein_per_100g + iron_per_100g + calcium_per_100g) DESC
-            LIMIT ?
-        """
-        
-        ingredients = pd.read_sql_query(query, conn, params=(top_n * 2,))
-        conn.close()
-        
-        recommendations = []
-        for idx, ing in ingredients.iterrows():
-            # Calculate score based on nutrition density
-            nutrition_score = (
-                ing['protein_per_100g'] * 2 +  # Protein is important
-                ing['iron_per_100g'] * 3 +      # Iron is critical
-                ing['calcium_per_100g'] * 0.5 +  # Calcium matters
-                ing['calories_per_100g'] * 0.1   # Energy
-            ) / ing['cost_per_kg']  # Normalize by cost
-            
-            recommendations.append({
-                'ingredient_name': ing['name'],
-                'category': ing['category'],
-                'score': round(nutrition_score, 2),
-                'reason': 'High nutrition density and value',
-                'protein': ing['protein_per_100g'],
-                'iron': ing['iron_per_100g'],
-                'calcium': ing['calcium_per_100g']
-            })
-        
-        # Sort by score and return top N
-        recommendations = sorted(recommendations, key=lambda x: x['score'], reverse=True)
-        return recommendations[:top_n]
+        # Nutrition density per rupee at catalog prices, from the shared index
+        foods = get_nutrient_density_index(self.db_path).top_k(
+            None, market=CATALOG, profile='recommender', require=('protein_per_100g', 'iron_per_100g'))
+        
+        # Candidates: the top_n * 2 richest in protein + iron + calcium, then ranked per rupee
+        def richness(food):
+            # NULL calcium makes the SQL sum NULL, which sorted last; 0.0 is a real value
+            if food['calcium_per_100g'] is None:
+                return -np.inf
+            return food['protein_per_100g'] + food['iron_per_100g'] + food['calcium_per_100g']
+        candidates = sorted(foods, key=richness, reverse=True)[:top_n * 2]
+        candidates = [food for food in candidates if food['score'] is not None]
+        candidates.sort(key=lambda food: food['score'], reverse=True)
+        
+        return [{
+            'ingredient_name': food['ingredient_name'],
+            'category': food['category'],
+            'score': round(food['score'], 2),
+            'source': 'nutrition-density',
+            'reason': RECOMMENDATION_REASONS['nutrition-density'],
+            'protein': food['protein_per_100g'],
+            'iron': food['iron_per_100g'],
+            'calcium': food['calcium_per_100g']
+        } for food in candidates[:top_n]]
     
     def train_models(self):
         """Train all ML models and return status"""
@@ -703,65 +1138,55 @@ class MealRecommendationSystem:
                 'message': 'Using fallback recommendations'
             }
     
-    def find_similar_children(self, child_id, top_n=5):
+    def find_similar_children(self, child_id, top_n=5, village=None, same_village=False):
         """
         Find children similar to the given child
-        Returns list of tuples (child_id, similarity_score)
+        
+        Args:
+            child_id: query child
+            top_n: number of similar children
+            village: only consider children of this village
+            same_village: only consider children of the query child's village
+        
+        Returns list of dicts (child_id, name, age_years, similarity_score, village)
         """
         try:
-            conn = self.get_connection()
-            
-            # Get all children with their basic info
-            query = """
-                SELECT DISTINCT c.id, c.name, c.date_of_birth, c.gender, c.village,
-                       g.weight_kg, g.height_cm, g.bmi
-                FROM children c
-                LEFT JOIN growth_tracking g ON c.id = g.child_id
-                WHERE c.id != ?
-                ORDER BY g.measurement_date DESC
-            """
-            
-            children = pd.read_sql_query(query, conn, params=(child_id,))
-            conn.close()
-            
-            if children.empty:
+            if same_village and village is None and self.similarity_index is not None:
+                village = self.similarity_index.village_of(child_id)
+            similar = self.similar_children(child_id, top_n=top_n, village=village)
+            if not similar:
                 return []
             
-            # Calculate age similarity
-            target_query = """
-                SELECT date_of_birth FROM children WHERE id = ?
-            """
-            target_dob = pd.read_sql_query(target_query, self.get_connection(), params=(child_id,))
-            
-            if target_dob.empty:
-                return []
+            # Display fields for the top_n rows only
+            child_ids = [similar_id for similar_id, _ in similar]
+            placeholders = ','.join('?' for _ in child_ids)
+            conn = self.get_connection()
+            try:
+                children = pd.read_sql_query(f"""
+                    SELECT id, name, date_of_birth, village
+                    FROM children
+                    WHERE id IN ({placeholders})
+                """, conn, params=child_ids).set_index('id')
+            finally:
+                conn.close()
             
-            from datetime import datetime
-            target_age = (datetime.now() - pd.to_datetime(target_dob['date_of_birth'].iloc[0])).days / 365.25
+            dob = pd.to_datetime(children['date_of_birth'], errors='coerce')
+            ages = (pd.Timestamp(datetime.now()) - dob).dt.days / 365.25
             
-            similar = []
-            for idx, child in children.iterrows():
-                if pd.isna(child['date_of_birth']):
+            results = []
+            for similar_id, similarity in similar:
+                if similar_id not in children.index:
                     continue
-                    
-                child_age = (datetime.now() - pd.to_datetime(child['date_of_birth'])).days / 365.25
-                age_diff = abs(target_age - child_age)
-                
-                # Similarity score (1.0 = identical age, decreases with age difference)
-                similarity = max(0, 1.0 - (age_diff / 5.0))  # 5 years = 0 similarity
-                
-                if similarity > 0.3:  # Only include reasonably similar children
-                    similar.append({
-                        'child_id': int(child['id']),
-                        'name': child['name'],
-                        'age_years': round(child_age, 1),
-                        'similarity_score': round(similarity, 2),
-                        'village': child['village'] if not pd.isna(child['village']) else 'Unknown'
-                    })
-            
-            # Sort by similarity and return top N
-            similar = sorted(similar, key=lambda x: x['similarity_score'], reverse=True)
-            return similar[:top_n]
+                child = children.loc[similar_id]
+                age = ages.loc[similar_id]
+                results.append({
+                    'child_id': int(similar_id),
+                    'name': child['name'],
+                    'age_years': None if pd.isna(age) else round(float(age), 1),
+                    'similarity_score': round(similarity, 2),
+                    'village': child['village'] if not pd.isna(child['village']) else 'Unknown'
+                })
+            return results
             
         except Exception as e:
             print(f"Error finding similar children: {e}")
@@ -827,12 +1252,8 @@ class MealRecommendationSystem:
             if not ingredients:
                 return 50  # Neutral
             
-            total_acceptance = 0
-            for ingredient in ingredients:
-                acceptance = self.predict_ingredient_acceptance(child_id, ingredient)
-                total_acceptance += acceptance
-            
-            avg_acceptance = (total_acceptance / len(ingredients)) * 100
+            acceptances = self.ingredient_acceptance(child_id, ingredients)
+            avg_acceptance = float(acceptances.mean()) * 100
             
             return {
                 'acceptance_score': round(avg_acceptance, 1),
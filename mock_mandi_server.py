@@ -0,0 +1,253 @@
+"""
+Mock Mandi Server
+Local stand-in for the data.gov.in daily commodity price resource, for
+tests and load benchmarks of the mandi price paths.
+
+Serves synthetic prices for every mandi in MandiPriceAPI.KARNATAKA_MANDIS
+and every commodity in MandiPriceAPI.INGREDIENT_TO_COMMODITY over the last
+few days, and implements the parts of the resource endpoint the client
+uses:
+    GET /resource/<resource_id>?api-key=..&format=json&limit=..&offset=..
+        &filters[state]=..&filters[commodity]=..&filters[market]=..
+        &filters[district]=..
+
+Failure modes (all optional):
+    - latency: fixed delay plus random jitter per request
+    - error_rate: share of requests answered with a 500 / 503
+    - throttle_rate: share of requests answered with a 429 + Retry-After
+    - fail_next(): fail the next N requests with a given status
+
+Point the client at it with DATA_GOV_BASE_URL=<server.url> or
+MandiPriceAPI(base_url=server.url).
+
+Usage: python mock_mandi_server.py [--port 8765] [--latency 0.05] [--error-rate 0.01]
+"""
+
+import argparse
+import json
+import random
+import threading
+import time
+from datetime import date, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+from mandi_price_api import MandiPriceAPI
+
+
+API_KEY = 'mock-api-key'
+
+# Filters of the resource endpoint and the record field each one matches
+FILTER_FIELDS = ('state', 'district', 'market', 'commodity', 'variety')
+
+MAX_LIMIT = 10000
+
+
+def generate_records(days=7, seed=0, state='Karnataka', end_date=None):
+    """
+    Synthetic price records: every mandi x commodity x day
+
+    Prices (Rs/Quintal, as strings like the real API) follow a per-commodity
+    base price, a per-mandi offset and a small daily random walk.
+    """
+    rng = random.Random(seed)
+    end_date = end_date or date.today()
+    commodities = sorted(set(MandiPriceAPI.INGREDIENT_TO_COMMODITY.values()))
+    base_price = {commodity: rng.randint(1500, 12000) for commodity in commodities}
+
+    records = []
+    for market in MandiPriceAPI.KARNATAKA_MANDIS:
+        offset = rng.uniform(0.9, 1.1)
+        for commodity in commodities:
+            price = base_price[commodity] * offset
+            for day in range(days - 1, -1, -1):
+                price *= rng.uniform(0.97, 1.03)
+                modal = round(price)
+                spread = round(modal * rng.uniform(0.05, 0.15))
+                records.append({
+                    'state': state,
+                    'district': market,
+                    'market': market,
+                    'commodity': commodity,
+                    'variety': 'Other',
+                    'grade': 'FAQ',
+                    'arrival_date': (end_date - timedelta(days=day)).strftime('%d/%m/%Y'),
+                    'min_price': str(modal - spread),
+                    'max_price': str(modal + spread),
+                    'modal_price': str(modal),
+                })
+    return records
+
+
+class MockMandiServer:
+    """Threaded HTTP server serving the synthetic price resource"""
+
+    def __init__(self, host='127.0.0.1', port=0, records=None, latency=0.0, jitter=0.0,
+                 error_rate=0.0, throttle_rate=0.0, retry_after=1, api_key=API_KEY, seed=0):
+        self.records = generate_records(seed=seed) if records is None else records
+        self.resource_id = MandiPriceAPI.RESOURCE_ID
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.throttle_rate = throttle_rate
+        self.retry_after = retry_after
+        self.api_key = api_key
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+        self._forced = []  # statuses for the next requests
+        self.stats = {'requests': 0, 'ok': 0, 'errors': 0, 'throttled': 0, 'forbidden': 0}
+        self._server = ThreadingHTTPServer((host, port), self._handler_class())
+        self._server.daemon_threads = True
+        self._thread = None
+
+    @property
+    def url(self):
+        """BASE_URL for MandiPriceAPI"""
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}/resource"
+
+    def start(self):
+        self._thread = threading.Thread(target=self._server.serve_forever,
+                                        name='mock-mandi-server', daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+        if self._thread is not None:
+            self._thread.join()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def fail_next(self, count=1, status=503):
+        """Answer the next `count` requests with `status`"""
+        with self._lock:
+            self._forced.extend([status] * count)
+
+    def _count(self, name):
+        with self._lock:
+            self.stats[name] += 1
+
+    def get_stats(self):
+        with self._lock:
+            return dict(self.stats)
+
+    # ==================== REQUEST HANDLING ====================
+
+    def _failure(self):
+        """Status to fail this request with, or None"""
+        with self._lock:
+            if self._forced:
+                return self._forced.pop(0)
+            draw = self._rng.random()
+        if draw < self.throttle_rate:
+            return 429
+        if draw < self.throttle_rate + self.error_rate:
+            return 503 if draw < self.throttle_rate + self.error_rate / 2 else 500
+        return None
+
+    def _delay(self):
+        with self._lock:
+            delay = self.latency + self._rng.uniform(0, self.jitter)
+        if delay > 0:
+            time.sleep(delay)
+
+    def respond(self, path, query):
+        """(status, headers, body dict) for a request"""
+        self._count('requests')
+        self._delay()
+
+        if path.rstrip('/') != f"/resource/{self.resource_id}":
+            return 404, {}, {'status': 'error', 'message': 'Resource not found'}
+
+        params = {name: values[-1] for name, values in parse_qs(query).items()}
+        if self.api_key and params.get('api-key') != self.api_key:
+            self._count('forbidden')
+            return 403, {}, {'status': 'error', 'message': 'Invalid API key'}
+
+        status = self._failure()
+        if status == 429:
+            self._count('throttled')
+            return 429, {'Retry-After': str(self.retry_after)}, {'status': 'error', 'message': 'Rate limit exceeded'}
+        if status is not None:
+            self._count('errors')
+            return status, {}, {'status': 'error', 'message': 'Service unavailable'}
+
+        try:
+            limit = min(int(params.get('limit', 10)), MAX_LIMIT)
+            offset = int(params.get('offset', 0))
+        except ValueError:
+            return 400, {}, {'status': 'error', 'message': 'Invalid limit or offset'}
+
+        filters = {field: params[f'filters[{field}]'].lower()
+                   for field in FILTER_FIELDS if params.get(f'filters[{field}]')}
+        matched = [record for record in self.records
+                   if all(record.get(field, '').lower() == value for field, value in filters.items())]
+        page = matched[offset:offset + limit]
+
+        self._count('ok')
+        return 200, {}, {
+            'status': 'ok',
+            'index_name': self.resource_id,
+            'total': len(matched),
+            'count': len(page),
+            'limit': str(limit),
+            'offset': str(offset),
+            'records': page,
+        }
+
+    def _handler_class(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'  # keep-alive, like the real API
+
+            def do_GET(self):
+                parts = urlsplit(self.path)
+                status, headers, body = server.respond(parts.path, parts.query)
+                payload = json.dumps(body).encode('utf-8')
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(payload)))
+                for name, value in headers.items():
+                    self.send_header(name, value)
+                self.end_headers()
+                self.wfile.write(payload)
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Local stand-in for the data.gov.in mandi price API')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--days', type=int, default=7, help='days of prices per mandi and commodity')
+    parser.add_argument('--latency', type=float, default=0.0, help='seconds added to every request')
+    parser.add_argument('--jitter', type=float, default=0.0, help='random extra seconds per request')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='share of 500/503 responses')
+    parser.add_argument('--throttle-rate', type=float, default=0.0, help='share of 429 responses')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    server = MockMandiServer(host=args.host, port=args.port,
+                             records=generate_records(days=args.days, seed=args.seed),
+                             latency=args.latency, jitter=args.jitter, error_rate=args.error_rate,
+                             throttle_rate=args.throttle_rate, seed=args.seed)
+    print(f"Mock mandi API on {server.url} ({len(server.records)} records)")
+    print(f"  export DATA_GOV_BASE_URL={server.url} DATA_GOV_API_KEY={API_KEY}")
+    try:
+        server.start()._thread.join()
+    except KeyboardInterrupt:
+        server.stop()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,104 @@
+"""
+Model Loading Layer
+Lazily memory-maps compiled forests so gunicorn workers share one copy of the
+node arrays through the page cache instead of each unpickling its own forest.
+
+Set PRELOAD_MODELS=1 (together with gunicorn --preload) to map the models in
+the master process before workers fork; otherwise each model is mapped on its
+first prediction.
+"""
+
+import os
+import threading
+import time
+
+from forest_compiler import load_or_compile
+
+
+def preload_enabled():
+    """True when models should be loaded at import time (gunicorn --preload)"""
+    return os.environ.get('PRELOAD_MODELS', '').lower() in ('1', 'true', 'yes')
+
+
+def process_rss_bytes():
+    """Resident set size of the current process, or None if unavailable"""
+    try:
+        with open('/proc/self/statm') as f:
+            resident_pages = int(f.read().split()[1])
+        return resident_pages * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, IndexError, AttributeError):
+        pass
+
+    try:
+        import resource
+        # ru_maxrss is the peak, in KB on Linux - better than nothing
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+    except (ImportError, OSError):
+        return None
+
+
+class LazyForest:
+    """Compiled forest for one model pickle, mapped on first use"""
+
+    def __init__(self, pickle_path):
+        self.pickle_path = pickle_path
+        self.load_time_ms = None
+        self._forest = None
+        self._lock = threading.Lock()
+
+    @property
+    def is_loaded(self):
+        return self._forest is not None
+
+    def get(self):
+        """Return the mapped CompiledForest, loading it on the first call"""
+        if self._forest is None:
+            with self._lock:
+                if self._forest is None:
+                    start = time.perf_counter()
+                    # The sklearn model (only returned when we had to compile)
+                    # is dropped here so no worker keeps an unpickled copy
+                    forest, _ = load_or_compile(self.pickle_path)
+                    self.load_time_ms = round((time.perf_counter() - start) * 1000, 2)
+                    self._forest = forest
+        return self._forest
+
+    def reset(self):
+        """Forget the mapped forest so the next get() re-reads it from disk"""
+        with self._lock:
+            self._forest = None
+            self.load_time_ms = None
+
+    def stats(self):
+        """Load statistics for /health"""
+        return {
+            'model': os.path.basename(self.pickle_path),
+            'loaded': self.is_loaded,
+            'load_time_ms': self.load_time_ms,
+            'mapped_bytes': self._forest.nbytes if self._forest is not None else None,
+        }
+
+
+# Shared registry so every caller maps a given model only once per process
+_forests = {}
+_registry_lock = threading.Lock()
+
+
+def get_lazy_forest(pickle_path):
+    """Get the process-wide LazyForest for a model pickle"""
+    key = os.path.abspath(pickle_path)
+    with _registry_lock:
+        if key not in _forests:
+            _forests[key] = LazyForest(pickle_path)
+        return _forests[key]
+
+
+def forest_stats():
+    """Load statistics for every forest registered in this process"""
+    with _registry_lock:
+        forests = list(_forests.values())
+    return {
+        'forests': [forest.stats() for forest in forests],
+        'process_rss_bytes': process_rss_bytes(),
+        'pid': os.getpid(),
+    }
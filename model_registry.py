@@ -0,0 +1,252 @@
+"""
+Malnutrition Model Registry
+Versioned model artifacts with metadata and an atomic "current" pointer
+
+Layout (under models/malnutrition/registry/):
+    versions/<version>/trained_model.pkl      sklearn forest
+    versions/<version>/trained_model.forest/  compiled, memory-mappable arrays
+    versions/<version>/label_encoder.pkl
+    versions/<version>/metadata.json          accuracy, feature_columns, classes,
+                                              training_date, checksum, ...
+    CURRENT                                   name of the active version
+
+New versions are built in a temp directory and renamed into place, and the
+CURRENT pointer is replaced with os.replace, so readers always see either
+the old or the new version - never a partial one.
+"""
+
+import hashlib
+import json
+import os
+import pickle
+import shutil
+from datetime import datetime
+
+from forest_compiler import save_compiled
+
+
+REGISTRY_DIR = os.path.join('models', 'malnutrition', 'registry')
+MODEL_FILE = 'trained_model.pkl'
+METADATA_FILE = 'metadata.json'
+
+
+def file_checksum(path):
+    """SHA-256 of a file, read in chunks"""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class ModelRegistry:
+    """Filesystem registry of malnutrition model versions"""
+
+    def __init__(self, root=REGISTRY_DIR):
+        self.root = root
+        self.versions_dir = os.path.join(root, 'versions')
+        self.pointer_file = os.path.join(root, 'CURRENT')
+
+    # ==================== VERSIONS ====================
+
+    def version_dir(self, version):
+        """Directory holding the artifacts of a version"""
+        return os.path.join(self.versions_dir, version)
+
+    def list_versions(self):
+        """All registered versions (oldest first) with their metadata"""
+        if not os.path.isdir(self.versions_dir):
+            return []
+
+        versions = []
+        for version in sorted(os.listdir(self.versions_dir)):
+            metadata_file = os.path.join(self.versions_dir, version, METADATA_FILE)
+            if os.path.exists(metadata_file):
+                versions.append(self.get_metadata(version))
+        return versions
+
+    def get_metadata(self, version):
+        """Metadata dict of a version"""
+        with open(os.path.join(self.version_dir(version), METADATA_FILE)) as f:
+            return json.load(f)
+
+    def verify(self, version):
+        """True if the model pickle still matches the checksum recorded at registration"""
+        metadata = self.get_metadata(version)
+        model_file = os.path.join(self.version_dir(version), MODEL_FILE)
+        return file_checksum(model_file) == metadata['checksum']
+
+    def _new_version_id(self):
+        base = datetime.now().strftime('v%Y%m%d-%H%M%S')
+        version = base
+        suffix = 1
+        while os.path.exists(self.version_dir(version)):
+            suffix += 1
+            version = f"{base}-{suffix}"
+        return version
+
+    def register(self, model, label_encoder, feature_columns, accuracy,
+                 promote=True, extra_metadata=None):
+        """
+        Store a trained model as a new immutable version
+
+        Args:
+            model: fitted forest
+            label_encoder: fitted LabelEncoder for the target classes
+            feature_columns: feature names in model input order
+            accuracy: held-out accuracy
+            promote: If True, point CURRENT at the new version (skipped for
+                models without a compiled forest, which cannot be served)
+            extra_metadata: optional dict merged into metadata.json
+
+        Returns:
+            The new version id
+        """
+        os.makedirs(self.versions_dir, exist_ok=True)
+        version = self._new_version_id()
+        build_dir = os.path.join(self.versions_dir, f".build-{version}")
+        shutil.rmtree(build_dir, ignore_errors=True)
+        os.makedirs(build_dir)
+
+        model_file = os.path.join(build_dir, MODEL_FILE)
+        with open(model_file, 'wb') as f:
+            pickle.dump(model, f)
+
+        with open(os.path.join(build_dir, 'label_encoder.pkl'), 'wb') as f:
+            pickle.dump(label_encoder, f)
+
+        # cuML forests have no sklearn tree arrays, so there is no compiled forest;
+        # the predictor serves compiled forests only and set_current() refuses them
+        compiled = hasattr(model, 'estimators_')
+        if compiled:
+            save_compiled(model, model_file)
+
+        metadata = {
+            'version': version,
+            'training_date': datetime.now().isoformat(),
+            'accuracy': float(accuracy),
+            'feature_columns': list(feature_columns),
+            'classes': [str(c) for c in label_encoder.classes_],
+            'checksum': file_checksum(model_file),
+            'compiled': compiled,
+        }
+        if extra_metadata:
+            metadata.update(extra_metadata)
+
+        with open(os.path.join(build_dir, METADATA_FILE), 'w') as f:
+            json.dump(metadata, f, indent=2)
+
+        os.rename(build_dir, self.version_dir(version))
+
+        if promote and compiled:
+            self.set_current(version)
+        elif promote:
+            print(f"[WARNING] Model version {version} has no compiled forest; CURRENT left unchanged")
+
+        return version
+
+    # ==================== CURRENT POINTER ====================
+
+    def get_current_version(self):
+        """Version the CURRENT pointer refers to, or None for an empty registry"""
+        try:
+            with open(self.pointer_file) as f:
+                version = f.read().strip()
+        except FileNotFoundError:
+            return None
+        return version or None
+
+    def pointer_mtime(self):
+        """Modification time of the CURRENT pointer (0 if missing) - cheap change check"""
+        try:
+            return os.path.getmtime(self.pointer_file)
+        except OSError:
+            return 0
+
+    def set_current(self, version):
+        """Atomically point CURRENT at an existing, intact, servable version"""
+        if not os.path.isdir(self.version_dir(version)):
+            raise ValueError(f"Unknown model version: {version}")
+        if not self.verify(version):
+            raise ValueError(f"Checksum mismatch for model version: {version}")
+        if not self.get_metadata(version).get('compiled', True):
+            raise ValueError(f"Model version {version} has no compiled forest and cannot be served")
+
+        tmp_file = f"{self.pointer_file}.tmp-{os.getpid()}"
+        with open(tmp_file, 'w') as f:
+            f.write(version)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_file, self.pointer_file)
+
+
+_registry = None
+
+
+def get_registry():
+    """Shared ModelRegistry for the default registry directory"""
+    global _registry
+    if _registry is None:
+        _registry = ModelRegistry()
+    return _registry
+
+
+# Flask routes for model administration
+def register_model_admin_routes(app):
+    """Register admin routes for listing, activating and shadow-scoring model versions"""
+    from flask import jsonify, request
+    import malnutrition_predictor as mp
+
+    def _authorized():
+        # Admin routes are disabled unless ADMIN_TOKEN is configured
+        token = os.environ.get('ADMIN_TOKEN')
+        return bool(token) and request.headers.get('X-Admin-Token') == token
+
+    def _forbidden():
+        return jsonify({'success': False, 'error': 'Admin token required'}), 403
+
+    @app.route('/api/admin/models', methods=['GET'])
+    def api_admin_models():
+        """List registered versions and the version serving traffic"""
+        if not _authorized():
+            return _forbidden()
+        registry = get_registry()
+        return jsonify({
+            'success': True,
+            'current_version': registry.get_current_version(),
+            'active_version': mp.get_predictor(lazy=True).model_version,
+            'swap': mp.get_swap_status(),
+            'shadow': mp.get_shadow_stats(),
+            'versions': registry.list_versions()
+        })
+
+    @app.route('/api/admin/models/activate', methods=['POST'])
+    def api_admin_activate_model():
+        """Promote a version and hot-swap it in the background"""
+        if not _authorized():
+            return _forbidden()
+        data = request.json or {}
+        version = data.get('version')
+        try:
+            if version:
+                get_registry().set_current(version)
+            version = get_registry().get_current_version()
+            if not version:
+                return jsonify({'success': False, 'error': 'Registry has no versions'}), 404
+        except ValueError as e:
+            return jsonify({'success': False, 'error': str(e)}), 400
+
+        mp.swap_predictor(version)
+        return jsonify({'success': True, 'version': version, 'swap': mp.get_swap_status()}), 202
+
+    @app.route('/api/admin/models/shadow', methods=['GET', 'POST'])
+    def api_admin_shadow_model():
+        """Start/stop shadow scoring of a version against live traffic"""
+        if not _authorized():
+            return _forbidden()
+        if request.method == 'POST':
+            version = (request.json or {}).get('version')
+            if version and not os.path.isdir(get_registry().version_dir(version)):
+                return jsonify({'success': False, 'error': f'Unknown model version: {version}'}), 404
+            mp.set_shadow_version(version)
+        return jsonify({'success': True, 'shadow': mp.get_shadow_stats()})
@@ -34,7 +34,10 @@ CREATE TABLE IF NOT EXISTS meal_plans (
     total_cost DECIMAL(10,2),
     nutrition_score DECIMAL(10,2),
     plan_data TEXT,
-    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    child_id INT,
+    ingredients TEXT,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    INDEX idx_meal_plans_child (child_id)
 ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci;
 
 -- Meal feedback table
@@ -102,6 +105,7 @@ CREATE TABLE IF NOT EXISTS growth_tracking (
     notes TEXT,
     measured_by VARCHAR(255),
     created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    INDEX idx_growth_child_date (child_id, measurement_date),
     FOREIGN KEY (child_id) REFERENCES children(id) ON DELETE CASCADE
 ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci;
 
@@ -171,6 +175,10 @@ CREATE TABLE IF NOT EXISTS child_nutrition_snapshot (
     iron_level VARCHAR(50),
     calcium_level VARCHAR(50),
     vitamin_a_level VARCHAR(50),
+    measurement_id INT,
+    model_version VARCHAR(64),
+    age_months INT,
+    prediction_json MEDIUMTEXT,
     last_updated TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
     FOREIGN KEY (child_id) REFERENCES children(id) ON DELETE CASCADE
 ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci;
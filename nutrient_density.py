@@ -0,0 +1,296 @@
+"""
+Nutrient Density Index
+Nutrition-per-rupee scores of every (ingredient, market) pair, shared by
+the village economy rankings, the recommender fallback and the chatbot
+alternative suggestions.
+
+Markets:
+    - each village with food_prices this month (food_price_monthly)
+    - POOLED: all villages' prices this month, averaged per ingredient
+    - CATALOG: ingredients.cost_per_kg
+
+Nutrients are one ingredients x nutrients matrix; a scoring profile is a
+weight vector over it, and each profile's scores are one array over all
+entries, so a top-k query with category / budget filters is a mask and a
+partial sort.
+
+The arrays are rebuilt only when prices or nutrients change: triggers on
+ingredients and food_price_monthly bump a counter in
+nutrient_density_version, and each query compares it (plus the current
+month) with the one the arrays were built from, over one kept-open
+connection. The triggers are schema: install_change_tracking() runs with
+the table migrations (database.initialize_database,
+village_economy.initialize_economy_tables), never on the read path.
+"""
+
+import os
+import sqlite3
+import threading
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+
+NUTRIENTS = ('protein_per_100g', 'fiber_per_100g', 'iron_per_100g', 'calcium_per_100g', 'calories_per_100g')
+
+# Weights over NUTRIENTS; scores are weighted nutrients / price per kg
+PROFILES = {
+    # Village economy nutrition_per_rupee
+    'economy': (2.0, 1.0, 1.0, 0.0, 0.0),
+    # Recommender fallback (iron-heavy, with calcium and energy)
+    'recommender': (2.0, 0.0, 3.0, 0.5, 0.1),
+}
+
+POOLED = '*'
+CATALOG = '#catalog'
+
+# Tables whose changes invalidate the index
+WATCHED_TABLES = ('ingredients', 'food_price_monthly')
+
+
+def install_change_tracking(conn):
+    """Create nutrient_density_version and the triggers on the existing WATCHED_TABLES"""
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS nutrient_density_version (
+            id INTEGER PRIMARY KEY CHECK (id = 1),
+            version INTEGER NOT NULL
+        )
+    """)
+    conn.execute("INSERT OR IGNORE INTO nutrient_density_version (id, version) VALUES (1, 0)")
+    existing = {name for (name,) in conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+    for table in WATCHED_TABLES:
+        if table not in existing:
+            continue
+        for event in ('INSERT', 'UPDATE', 'DELETE'):
+            conn.execute(f"""
+                CREATE TRIGGER IF NOT EXISTS nutrient_density_{table}_{event.lower()}
+                AFTER {event} ON {table}
+                BEGIN
+                    UPDATE nutrient_density_version SET version = version + 1 WHERE id = 1;
+                END
+            """)
+    conn.commit()
+
+
+class NutrientDensityIndex:
+    """Per-(ingredient, market) nutrition-per-rupee arrays, rebuilt on price or nutrient changes"""
+
+    def __init__(self, db_path):
+        self.db_path = db_path
+        self.state = None  # (version, triggers, year, month) the arrays were built from
+        self.markets = []
+        self.market_codes = {}
+        self.ingredient = np.empty(0, dtype=object)
+        self.village = np.empty(0, dtype=object)
+        self.category = np.empty(0, dtype=object)
+        self.market = np.empty(0, dtype=np.int64)
+        self.price = np.empty(0)
+        self.nutrients = np.empty((0, len(NUTRIENTS)))
+        self.scores = {name: np.empty(0) for name in PROFILES}
+        self.builds = 0
+        self._lock = threading.Lock()
+        self._build_lock = threading.Lock()  # also guards _conn
+        self._conn = None  # (pid, connection) for version checks and builds
+
+    # ==================== CHANGE TRACKING ====================
+
+    def _connection(self):
+        # Connections do not survive gunicorn's fork
+        if self._conn is None or self._conn[0] != os.getpid():
+            self._conn = (os.getpid(), sqlite3.connect(self.db_path, timeout=10, check_same_thread=False))
+        return self._conn[1]
+
+    def _current_state(self, conn):
+        now = datetime.now()
+        try:
+            version, triggers = conn.execute("""
+                SELECT (SELECT version FROM nutrient_density_version WHERE id = 1),
+                       (SELECT COUNT(*) FROM sqlite_master
+                        WHERE type = 'trigger' AND name LIKE 'nutrient_density_%')
+            """).fetchone()
+        except sqlite3.OperationalError:
+            version = triggers = None
+        return version, triggers, now.year, now.month
+
+    def refresh(self, force=False):
+        """Rebuild the arrays if prices or nutrients changed since the last build"""
+        with self._build_lock:
+            conn = self._connection()
+            state = self._current_state(conn)
+            # Without change tracking installed nothing says the arrays are current
+            if state == self.state and state[0] is not None and not force:
+                return False
+            self._build(conn, state)
+            return True
+
+    # ==================== BUILD ====================
+
+    @staticmethod
+    def _read(conn, query, params=()):
+        try:
+            return pd.read_sql_query(query, conn, params=params)
+        except (pd.errors.DatabaseError, sqlite3.OperationalError):
+            return None
+
+    def _build(self, conn, state):
+        _, _, year, month = state
+        catalog = self._read(conn, "SELECT * FROM ingredients")
+        if catalog is None:
+            catalog = pd.DataFrame(columns=['name', 'category', 'cost_per_kg'])
+        catalog = catalog.reindex(columns=['name', 'category', 'cost_per_kg', *NUTRIENTS]).drop_duplicates('name')
+
+        monthly = self._read(conn, """
+            SELECT ingredient_name, village, village as market, price_sum / price_count as price
+            FROM food_price_monthly
+            WHERE year = ? AND month_num = ? AND village != ''
+        """, (year, month))
+        pooled = self._read(conn, """
+            SELECT ingredient_name, NULLIF(MIN(village), '') as village, ? as market,
+                   SUM(price_sum) / SUM(price_count) as price
+            FROM food_price_monthly
+            WHERE year = ? AND month_num = ?
+            GROUP BY ingredient_name
+        """, (POOLED, year, month))
+        from_catalog = pd.DataFrame({'ingredient_name': catalog['name'], 'village': None,
+                                     'market': CATALOG, 'price': catalog['cost_per_kg']})
+        entries = pd.concat([frame for frame in (monthly, pooled, from_catalog) if frame is not None],
+                            ignore_index=True)
+
+        # Nutrients and category by ingredient (NaN / None when the ingredient is unknown)
+        lookup = pd.Index(catalog['name'])
+        rows = lookup.get_indexer(entries['ingredient_name'])
+        known = rows >= 0
+        table = catalog[list(NUTRIENTS)].to_numpy(dtype=np.float64)
+        nutrients = np.full((len(entries), len(NUTRIENTS)), np.nan)
+        nutrients[known] = table[rows[known]]
+        categories = np.full(len(entries), None, dtype=object)
+        categories[known] = catalog['category'].to_numpy(dtype=object)[rows[known]]
+
+        price = entries['price'].to_numpy(dtype=np.float64)
+        price = np.where(price > 0, price, np.nan)
+        markets = sorted(set(entries['market']))
+        market_codes = {name: code for code, name in enumerate(markets)}
+
+        scores = {}
+        for name, weights in PROFILES.items():
+            weights = np.array(weights)
+            used = weights != 0
+            # NULL nutrients give a NULL score, as in the SQL this replaces
+            scores[name] = nutrients[:, used] @ weights[used] / price
+
+        with self._lock:
+            self.markets, self.market_codes = markets, market_codes
+            self.ingredient = entries['ingredient_name'].to_numpy(dtype=object)
+            self.village = entries['village'].astype(object).where(entries['village'].notna(), None).to_numpy()
+            self.category = categories
+            self.market = entries['market'].map(market_codes).to_numpy(dtype=np.int64)
+            self.price = price
+            self.nutrients = nutrients
+            self.scores = scores
+            self.state = state
+            self.builds += 1
+
+    # ==================== QUERIES ====================
+
+    def villages(self):
+        """Villages with prices this month"""
+        self.refresh()
+        with self._lock:
+            return [name for name in self.markets if name not in (POOLED, CATALOG)]
+
+    def top_k(self, k=20, market=POOLED, profile='economy', category=None, max_price=None,
+              require=(), exclude=(), max_price_exclusive=False):
+        """
+        Best nutrition per rupee in one market
+
+        Args:
+            market: village name, POOLED or CATALOG
+            profile: key of PROFILES
+            category: optional category (or list of categories) to keep
+            max_price: optional budget per kg
+            require: nutrients that must be positive
+            exclude: ingredient names to leave out
+            max_price_exclusive: keep prices strictly below max_price
+
+        Returns:
+            List of dicts (ingredient_name, village, category, price, score and
+            the NUTRIENTS, NaN as None), best first; ingredients without a
+            score come last
+        """
+        if profile not in PROFILES:
+            raise ValueError(f"profile must be one of {tuple(PROFILES)}")
+        self.refresh()
+        with self._lock:
+            code = self.market_codes.get(market)
+            if code is None:
+                return []
+            mask = (self.market == code) & ~np.isnan(self.price)
+            if category is not None:
+                categories = [category] if isinstance(category, str) else list(category)
+                mask &= np.isin(self.category, categories)
+            if max_price is not None:
+                mask &= (self.price < max_price) if max_price_exclusive else (self.price <= max_price)
+            for nutrient in require:
+                mask &= np.nan_to_num(self.nutrients[:, NUTRIENTS.index(nutrient)]) > 0
+            if exclude:
+                mask &= ~np.isin(self.ingredient, list(exclude))
+
+            candidates = np.flatnonzero(mask)
+            scores = self.scores[profile][candidates]
+            keys = np.where(np.isnan(scores), np.inf, -scores)
+            if k is not None and k < len(candidates):
+                keep = np.argpartition(keys, k)[:k]
+                candidates, keys, scores = candidates[keep], keys[keep], scores[keep]
+            order = np.argsort(keys, kind='stable')
+            return [self._entry(row, score) for row, score in zip(candidates[order], scores[order])]
+
+    def _entry(self, row, score):
+        entry = {
+            'ingredient_name': self.ingredient[row],
+            'village': self.village[row],
+            'category': self.category[row],
+            'price': float(self.price[row]),
+            'score': None if np.isnan(score) else float(score),
+        }
+        for nutrient, value in zip(NUTRIENTS, self.nutrients[row]):
+            entry[nutrient] = None if np.isnan(value) else float(value)
+        return entry
+
+    def alternatives(self, ingredient, k=3, market=CATALOG, profile='recommender', cheaper=False):
+        """
+        Same-category ingredients with the best nutrition per rupee
+
+        Args:
+            cheaper: only ingredients costing less per kg than this one
+
+        Returns:
+            top_k() entries (empty when the ingredient is not indexed)
+        """
+        self.refresh()
+        with self._lock:
+            code = self.market_codes.get(market)
+            if code is None:
+                return []
+            rows = np.flatnonzero((self.market == code) & (self.ingredient == ingredient))
+            if not len(rows) or self.category[rows[0]] is None:
+                return []
+            category, price = self.category[rows[0]], self.price[rows[0]]
+        max_price = price if cheaper and not np.isnan(price) else None
+        return self.top_k(k, market, profile, category=category, max_price=max_price, exclude=(ingredient,),
+                          max_price_exclusive=True)
+
+
+_indexes = {}
+_indexes_lock = threading.Lock()
+
+
+def get_nutrient_density_index(db_path):
+    """Shared NutrientDensityIndex for a database"""
+    index = _indexes.get(db_path)
+    if index is None:
+        with _indexes_lock:
+            index = _indexes.get(db_path)
+            if index is None:
+                index = _indexes[db_path] = NutrientDensityIndex(db_path)
+    return index
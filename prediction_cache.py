@@ -0,0 +1,219 @@
+"""
+Malnutrition Prediction Cache
+Memoizes predictor results per child so reopening the prediction page does
+not re-run the forest when nothing changed.
+
+A cached result is valid for (child_id, latest measurement id, model version,
+age in months): a new growth measurement, a model swap, or the child turning
+a month older all produce a different key.
+
+Two tiers:
+    - in-process LRU (per gunicorn worker)
+    - child_nutrition_snapshot table (shared by all workers, survives restarts)
+"""
+
+import json
+import threading
+from collections import OrderedDict
+from datetime import datetime
+
+import database as db
+
+
+LRU_SIZE = 2048
+
+# Columns added to child_nutrition_snapshot for cached predictions
+SNAPSHOT_COLUMNS = {
+    'measurement_id': 'INTEGER',
+    'model_version': 'VARCHAR(64)',
+    'age_months': 'INTEGER',
+    'prediction_json': 'TEXT',
+}
+
+
+def model_version_of(predictor):
+    """Version tag used in cache keys ('fallback' for the WHO z-score predictor)"""
+    if hasattr(predictor, 'load'):
+        # A lazy predictor only knows whether it fell back once it has loaded
+        predictor.load()
+    if getattr(predictor, 'use_fallback', True):
+        return 'fallback'
+    return getattr(predictor, 'model_version', None) or 'legacy'
+
+
+class PredictionCache:
+    """LRU + child_nutrition_snapshot cache of raw predictor results"""
+
+    def __init__(self, max_entries=LRU_SIZE):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()  # child_id -> (key, result)
+        self._lock = threading.Lock()
+        self._schema_checked = False
+        self.stats = {'lru_hits': 0, 'db_hits': 0, 'misses': 0, 'invalidations': 0}
+
+    # ==================== SCHEMA ====================
+
+    def _ensure_schema(self, conn):
+        """Add the prediction columns to child_nutrition_snapshot on older databases"""
+        if self._schema_checked:
+            return
+        cursor = conn.cursor()
+        if db.DB_TYPE == 'mysql':
+            cursor.execute("""
+                SELECT COLUMN_NAME FROM information_schema.COLUMNS
+                WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = 'child_nutrition_snapshot'
+            """)
+            existing = {row[0] for row in cursor.fetchall()}
+        else:
+            cursor.execute("PRAGMA table_info(child_nutrition_snapshot)")
+            existing = {row[1] for row in cursor.fetchall()}
+
+        for column, sql_type in SNAPSHOT_COLUMNS.items():
+            if column not in existing:
+                cursor.execute(f"ALTER TABLE child_nutrition_snapshot ADD COLUMN {column} {sql_type}")
+        conn.commit()
+        cursor.close()
+        self._schema_checked = True
+
+    # ==================== LOOKUP ====================
+
+    def get(self, conn, child_id, measurement_id, model_version, age_months):
+        """Cached predictor result for this key, or None"""
+        key = (measurement_id, model_version, age_months)
+
+        with self._lock:
+            entry = self._entries.get(child_id)
+            if entry is not None and entry[0] == key:
+                self._entries.move_to_end(child_id)
+                self.stats['lru_hits'] += 1
+                return entry[1]
+
+        self._ensure_schema(conn)
+        cursor, placeholder = db.get_cursor(conn)
+        cursor.execute(f"""
+            SELECT measurement_id, model_version, age_months, prediction_json
+            FROM child_nutrition_snapshot
+            WHERE child_id = {placeholder}
+        """, (child_id,))
+        row = db.dict_from_row(cursor.fetchone())
+        cursor.close()
+
+        if (row and row['prediction_json']
+                and (row['measurement_id'], row['model_version'], row['age_months']) == key):
+            result = json.loads(row['prediction_json'])
+            self._remember(child_id, key, result)
+            with self._lock:
+                self.stats['db_hits'] += 1
+            return result
+
+        with self._lock:
+            self.stats['misses'] += 1
+        return None
+
+    def put(self, conn, child_id, measurement_id, model_version, age_months, result):
+        """Store a predictor result in both tiers"""
+        key = (measurement_id, model_version, age_months)
+        self._remember(child_id, key, result)
+
+        self._ensure_schema(conn)
+        cursor, placeholder = db.get_cursor(conn)
+        values = (child_id, result.get('nutrition_status'), measurement_id, model_version,
+                  age_months, json.dumps(result), datetime.now().isoformat())
+        placeholders = ', '.join([placeholder] * len(values))
+        columns = """child_id, nutrition_status, measurement_id, model_version,
+                     age_months, prediction_json, last_updated"""
+
+        if db.DB_TYPE == 'mysql':
+            cursor.execute(f"""
+                INSERT INTO child_nutrition_snapshot ({columns})
+                VALUES ({placeholders})
+                ON DUPLICATE KEY UPDATE
+                    nutrition_status = VALUES(nutrition_status),
+                    measurement_id = VALUES(measurement_id),
+                    model_version = VALUES(model_version),
+                    age_months = VALUES(age_months),
+                    prediction_json = VALUES(prediction_json),
+                    last_updated = VALUES(last_updated)
+            """, values)
+        else:
+            cursor.execute(f"""
+                INSERT INTO child_nutrition_snapshot ({columns})
+                VALUES ({placeholders})
+                ON CONFLICT(child_id) DO UPDATE SET
+                    nutrition_status = excluded.nutrition_status,
+                    measurement_id = excluded.measurement_id,
+                    model_version = excluded.model_version,
+                    age_months = excluded.age_months,
+                    prediction_json = excluded.prediction_json,
+                    last_updated = excluded.last_updated
+            """, values)
+        conn.commit()
+        cursor.close()
+
+    def _remember(self, child_id, key, result):
+        with self._lock:
+            self._entries[child_id] = (key, result)
+            self._entries.move_to_end(child_id)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    # ==================== INVALIDATION ====================
+
+    def invalidate(self, child_id, conn=None):
+        """
+        Drop the cached prediction of a child after a growth measurement write
+
+        Other workers' LRU entries become unreachable anyway because the new
+        measurement changes the key; clearing the row keeps the table honest.
+        """
+        with self._lock:
+            self._entries.pop(child_id, None)
+            self.stats['invalidations'] += 1
+
+        own_conn = conn is None
+        if own_conn:
+            conn = db.get_connection()
+        try:
+            self._ensure_schema(conn)
+            cursor, placeholder = db.get_cursor(conn)
+            cursor.execute(f"""
+                UPDATE child_nutrition_snapshot
+                SET prediction_json = NULL, measurement_id = NULL
+                WHERE child_id = {placeholder}
+            """, (child_id,))
+            conn.commit()
+            cursor.close()
+        finally:
+            if own_conn:
+                conn.close()
+
+    def clear(self):
+        """Empty the in-process tier"""
+        with self._lock:
+            self._entries.clear()
+
+    def get_stats(self):
+        with self._lock:
+            return dict(self.stats, lru_entries=len(self._entries))
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_prediction_cache():
+    """Process-wide PredictionCache"""
+    global _cache
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                _cache = PredictionCache()
+    return _cache
+
+
+def invalidate_prediction(child_id, conn=None):
+    """Invalidate a child's cached prediction; never fails the caller's write"""
+    try:
+        get_prediction_cache().invalidate(child_id, conn)
+    except Exception as e:
+        print(f"[WARNING] Could not invalidate cached prediction for child {child_id}: {e}")
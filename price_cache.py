@@ -0,0 +1,233 @@
+"""
+Mandi Price Cache
+TTL cache of data.gov.in price lookups keyed by (state, commodity), so
+/api/ingredient-price and /api/cheapest-markets stop calling the remote
+API on every request (prices change about once a day).
+
+Two tiers:
+    - in-process LRU (per gunicorn worker)
+    - mandi_price_cache table (shared by all workers, survives restarts)
+
+Entries older than the TTL are still served while one background refresh
+per key fetches new prices (stale-while-revalidate); entries older than
+MAX_STALE are refetched synchronously.
+"""
+
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+
+# Seconds a fetched price list counts as fresh
+TTL = int(os.getenv('MANDI_CACHE_TTL', 6 * 3600))
+
+# Seconds after which a stale entry is no longer served without a fetch
+MAX_STALE = int(os.getenv('MANDI_CACHE_MAX_STALE', 7 * 24 * 3600))
+
+LRU_SIZE = 512
+
+
+class PriceCache:
+    """LRU + mandi_price_cache table in front of a price fetch function"""
+
+    def __init__(self, db_path, ttl=TTL, max_stale=MAX_STALE, max_entries=LRU_SIZE):
+        self.db_path = db_path
+        self.ttl = ttl
+        self.max_stale = max_stale
+        self.max_entries = max_entries
+        self._entries = OrderedDict()  # key -> (fetched_at, fetch_limit, records)
+        self._lock = threading.Lock()
+        self._refreshing = set()
+        self._refresher = ThreadPoolExecutor(max_workers=2, thread_name_prefix='price-refresh')
+        self._schema_checked = False
+        self.stats = {'lru_hits': 0, 'db_hits': 0, 'stale_hits': 0, 'misses': 0,
+                      'refreshes': 0, 'refresh_failures': 0}
+
+    def _connect(self):
+        conn = sqlite3.connect(self.db_path, timeout=10)
+        if not self._schema_checked:
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS mandi_price_cache (
+                    state TEXT NOT NULL,
+                    commodity TEXT NOT NULL,
+                    fetch_limit INTEGER,
+                    records_json TEXT NOT NULL,
+                    fetched_at REAL NOT NULL,
+                    PRIMARY KEY (state, commodity)
+                )
+            """)
+            conn.commit()
+            self._schema_checked = True
+        return conn
+
+    @staticmethod
+    def key(state, commodity):
+        return ((state or '').strip().lower(), (commodity or '').strip().lower())
+
+    def _count(self, name):
+        with self._lock:
+            self.stats[name] += 1
+
+    # ==================== READS ====================
+
+    def get(self, state, commodity, limit, fetch):
+        """
+        Price records for (state, commodity), at most `limit` of them
+
+        Args:
+            fetch: callable(limit) -> records, or None when the fetch failed
+
+        Returns:
+            Records, or None when nothing is cached and the fetch failed
+        """
+        key = self.key(state, commodity)
+        entry = self._lookup(key, limit)
+        if entry is not None:
+            fetched_at, records = entry
+            age = time.time() - fetched_at
+            if age <= self.ttl:
+                return records[:limit]
+            if age <= self.max_stale:
+                self._count('stale_hits')
+                self.refresh_async(key, limit, fetch)
+                return records[:limit]
+
+        self._count('misses')
+        records = self.refresh(key, limit, fetch)
+        if records is None and entry is not None:
+            # Remote API down: a very old price beats none
+            return entry[1][:limit]
+        return None if records is None else records[:limit]
+
+    def _lookup(self, key, limit):
+        """(fetched_at, records) covering `limit` records, from the LRU or table"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and self._covers(entry[1], entry[2], limit):
+                self._entries.move_to_end(key)
+                self.stats['lru_hits'] += 1
+                return entry[0], entry[2]
+
+        conn = self._connect()
+        try:
+            row = conn.execute("""
+                SELECT fetched_at, fetch_limit, records_json FROM mandi_price_cache
+                WHERE state = ? AND commodity = ?
+            """, key).fetchone()
+        finally:
+            conn.close()
+        if row is None:
+            return None
+        fetched_at, fetch_limit, payload = row
+        records = json.loads(payload)
+        if not self._covers(fetch_limit, records, limit):
+            return None
+        self._remember(key, fetched_at, fetch_limit, records)
+        self._count('db_hits')
+        return fetched_at, records
+
+    @staticmethod
+    def _covers(fetch_limit, records, limit):
+        """Whether an entry fetched with fetch_limit can answer a request for limit"""
+        return (fetch_limit is None or limit is None and len(records) < fetch_limit
+                or limit is not None and (limit <= fetch_limit or len(records) < fetch_limit))
+
+    # ==================== WRITES ====================
+
+    def put_many(self, state, records_by_commodity):
+        """Store complete price lists of several commodities (one transaction)"""
+        fetched_at = time.time()
+        entries = {}
+        for commodity, records in records_by_commodity.items():
+            entries.setdefault(self.key(state, commodity), []).extend(records)
+        conn = self._connect()
+        try:
+            conn.executemany("""
+                INSERT OR REPLACE INTO mandi_price_cache
+                (state, commodity, fetch_limit, records_json, fetched_at)
+                VALUES (?, ?, NULL, ?, ?)
+            """, [(*key, json.dumps(records), fetched_at) for key, records in entries.items()])
+            conn.commit()
+        finally:
+            conn.close()
+        for key, records in entries.items():
+            self._remember(key, fetched_at, None, records)
+
+    def _store(self, key, records, fetch_limit):
+        fetched_at = time.time()
+        conn = self._connect()
+        try:
+            conn.execute("""
+                INSERT OR REPLACE INTO mandi_price_cache
+                (state, commodity, fetch_limit, records_json, fetched_at)
+                VALUES (?, ?, ?, ?, ?)
+            """, (*key, fetch_limit, json.dumps(records), fetched_at))
+            conn.commit()
+        finally:
+            conn.close()
+        self._remember(key, fetched_at, fetch_limit, records)
+
+    def refresh(self, key, limit, fetch):
+        """Fetch and store one key; None if the fetch failed"""
+        records = fetch(limit)
+        if records is None:
+            self._count('refresh_failures')
+            return None
+        self._store(key, records, limit)
+        self._count('refreshes')
+        return records
+
+    def refresh_async(self, key, limit, fetch):
+        """Queue a refresh unless one is already pending for this key"""
+        with self._lock:
+            if key in self._refreshing:
+                return False
+            self._refreshing.add(key)
+
+        def run():
+            try:
+                self.refresh(key, limit, fetch)
+            except Exception as e:
+                print(f"[WARNING] Price refresh for {key} failed: {e}")
+            finally:
+                with self._lock:
+                    self._refreshing.discard(key)
+
+        self._refresher.submit(run)
+        return True
+
+    def _remember(self, key, fetched_at, fetch_limit, records):
+        with self._lock:
+            self._entries[key] = (fetched_at, fetch_limit, records)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        """Empty the in-process tier"""
+        with self._lock:
+            self._entries.clear()
+
+    def get_stats(self):
+        with self._lock:
+            return dict(self.stats, lru_entries=len(self._entries), refreshing=len(self._refreshing),
+                        ttl=self.ttl)
+
+
+_caches = {}
+_caches_lock = threading.Lock()
+
+
+def get_price_cache(db_path):
+    """Shared PriceCache for a database"""
+    cache = _caches.get(db_path)
+    if cache is None:
+        with _caches_lock:
+            cache = _caches.get(db_path)
+            if cache is None:
+                cache = _caches[db_path] = PriceCache(db_path)
+    return cache
@@ -0,0 +1,244 @@
+"""
+Price Forecasting
+Next-week price estimates for every (ingredient, market) series in the
+price time-series store.
+
+History is loaded from the daily rollups as one dense
+ingredient x market x day array (gaps forward-filled). Every series is then
+fitted at once with a damped additive Holt-Winters model with a weekly
+season: the recursion steps over days, but each step updates all series
+and all candidate smoothing parameters together via NumPy broadcasting.
+Per series, the parameter set with the lowest one-step-ahead error on the
+observed days wins.
+
+Series with too few observations fall back to their last price. Fitted
+forecasts are cached per calendar day.
+"""
+
+import threading
+from datetime import date, timedelta
+
+import numpy as np
+
+from price_series import get_price_series, parse_price_date
+
+
+# Days of daily history the model is fitted on
+HISTORY_DAYS = 180
+
+# Days forecast ahead
+HORIZON = 7
+
+# Weekly seasonality
+SEASON = 7
+
+# Series with fewer observed days are forecast as their last price
+MIN_OBSERVATIONS = 14
+
+# Trend damping
+PHI = 0.9
+
+# Candidate smoothing parameters (level, trend, season)
+ALPHAS = (0.1, 0.3, 0.6)
+BETAS = (0.0, 0.1)
+GAMMAS = (0.0, 0.2)
+
+# Two-sided 95% interval
+Z = 1.96
+
+
+def load_price_cube(store, start, end):
+    """
+    Daily average prices as a dense array
+
+    Returns:
+        (ingredients, markets, days datetime64[D], cube float (I, M, D) with
+        NaN where there is no observation)
+    """
+    rows = store.daily_prices(start, end)
+    days = np.arange(np.datetime64(start, 'D'), np.datetime64(end, 'D') + 1)
+    if not rows:
+        return np.array([], dtype=object), np.array([], dtype=object), days, np.empty((0, 0, len(days)))
+
+    ingredient_col, market_col, period_col, price_col = zip(*rows)
+    ingredients, ingredient_idx = np.unique(np.array(ingredient_col, dtype=object), return_inverse=True)
+    markets, market_idx = np.unique(np.array(market_col, dtype=object), return_inverse=True)
+    day_idx = (np.array(period_col, dtype='datetime64[D]') - days[0]).astype(np.int64)
+
+    cube = np.full((len(ingredients), len(markets), len(days)), np.nan)
+    cube[ingredient_idx, market_idx, day_idx] = price_col
+    return ingredients, markets, days, cube
+
+
+def forward_fill(values):
+    """Fill NaNs along the last axis with the previous value (leading NaNs with the first)"""
+    observed = ~np.isnan(values)
+    index = np.where(observed, np.arange(values.shape[-1]), 0)
+    np.maximum.accumulate(index, axis=-1, out=index)
+    filled = np.take_along_axis(values, index, axis=-1)
+
+    first = np.argmax(observed, axis=-1)
+    leading = np.arange(values.shape[-1]) < first[..., None]
+    first_value = np.take_along_axis(values, first[..., None], axis=-1)
+    return np.where(leading, first_value, filled)
+
+
+def fit_holt_winters(y, observed, season=SEASON, horizon=HORIZON, phi=PHI,
+                     alphas=ALPHAS, betas=BETAS, gammas=GAMMAS):
+    """
+    Damped additive Holt-Winters over many series at once
+
+    Args:
+        y: (S, D) gap-filled prices
+        observed: (S, D) bool, True on days with a real observation
+
+    Returns:
+        (forecast (S, horizon), residual std (S,))
+    """
+    n_series, n_days = y.shape
+    grid = np.array([(a, b, g) for a in alphas for b in betas for g in gammas])
+    if n_days < 2 * season:
+        grid = grid[grid[:, 2] == 0]
+    alpha, beta, gamma = (grid[:, i][:, None] for i in range(3))  # (G, 1)
+    n_grid = len(grid)
+
+    # Initial state from the first two seasons (or the first price)
+    if n_days >= 2 * season:
+        first, second = y[:, :season].mean(axis=1), y[:, season:2 * season].mean(axis=1)
+        level0, trend0 = first, (second - first) / season
+        season0 = y[:, :season] - first[:, None]
+    else:
+        level0, trend0 = y[:, 0], np.zeros(n_series)
+        season0 = np.zeros((n_series, season))
+    level = np.broadcast_to(level0, (n_grid, n_series)).copy()
+    trend = np.broadcast_to(trend0, (n_grid, n_series)).copy()
+    seasonal = np.broadcast_to(season0, (n_grid, n_series, season)).copy()
+
+    sse = np.zeros((n_grid, n_series))
+    counted = np.zeros(n_series)
+    for t in range(n_days):
+        s = seasonal[:, :, t % season]
+        error = y[:, t] - (level + phi * trend + s)
+        if t >= season:
+            sse += np.where(observed[:, t], error ** 2, 0.0)
+            counted += observed[:, t]
+        new_level = alpha * (y[:, t] - s) + (1 - alpha) * (level + phi * trend)
+        trend = beta * (new_level - level) + (1 - beta) * phi * trend
+        seasonal[:, :, t % season] = gamma * (y[:, t] - new_level) + (1 - gamma) * s
+        level = new_level
+
+    best = np.argmin(sse, axis=0)
+    series = np.arange(n_series)
+    level, trend, seasonal = level[best, series], trend[best, series], seasonal[best, series]
+
+    steps = np.arange(1, horizon + 1)
+    damped = np.cumsum(phi ** steps)  # phi + phi^2 + ... + phi^h
+    season_index = (n_days - 1 + steps) % season
+    forecast = level[:, None] + damped[None, :] * trend[:, None] + seasonal[:, season_index]
+    sigma = np.sqrt(sse[best, series] / np.maximum(counted, 1))
+    return np.maximum(forecast, 0.0), sigma
+
+
+class PriceForecaster:
+    """Forecasts of every (ingredient, market) series, fitted once per day"""
+
+    def __init__(self, store, history_days=HISTORY_DAYS, horizon=HORIZON):
+        self.store = store
+        self.history_days = history_days
+        self.horizon = horizon
+        self.as_of = None
+        self.ingredients = np.array([], dtype=object)
+        self.markets = np.array([], dtype=object)
+        self._positions = {}  # ingredient -> [(market, series row)]
+        self.forecast = np.empty((0, horizon))
+        self.sigma = np.empty(0)
+        self.naive = np.empty(0, dtype=bool)
+        self.last_observed = np.empty(0, dtype='datetime64[D]')
+        self._lock = threading.Lock()
+        self._fit_lock = threading.Lock()
+
+    def fit(self, as_of=None):
+        """Fit all series on the history up to as_of (default today)"""
+        as_of = parse_price_date(as_of) if as_of else date.today()
+        start = as_of - timedelta(days=self.history_days - 1)
+        ingredients, markets, days, cube = load_price_cube(self.store, start, as_of)
+
+        observed = ~np.isnan(cube)
+        flat_observed = observed.reshape(-1, len(days))
+        has_data = flat_observed.any(axis=1)
+        rows = np.flatnonzero(has_data)
+        y = forward_fill(cube.reshape(-1, len(days))[rows])
+        observed_rows = flat_observed[rows]
+
+        forecast, sigma = (fit_holt_winters(y, observed_rows, horizon=self.horizon) if len(rows)
+                           else (np.empty((0, self.horizon)), np.empty(0)))
+        naive = observed_rows.sum(axis=1) < MIN_OBSERVATIONS
+        if naive.any():
+            forecast[naive] = y[naive, -1:]
+            sigma[naive] = np.nan
+
+        last_index = len(days) - 1 - np.argmax(observed_rows[:, ::-1], axis=1)
+        positions = {}
+        for series, flat in enumerate(rows):
+            ingredient, market = divmod(int(flat), len(markets))
+            positions.setdefault(ingredients[ingredient], []).append((markets[market], series))
+
+        with self._lock:
+            self.as_of = as_of
+            self.ingredients, self.markets = ingredients, markets
+            self._positions = positions
+            self.forecast, self.sigma, self.naive = forecast, sigma, naive
+            self.last_observed = days[last_index] if len(rows) else np.empty(0, dtype='datetime64[D]')
+        return self
+
+    def get(self, ingredient, market=None, as_of=None):
+        """
+        Forecast of one ingredient, per market (refits when the day changed)
+
+        Returns:
+            List of {market, dates, price_per_kg, lower, upper, method,
+            last_observed}, or [] when there is no history
+        """
+        as_of = parse_price_date(as_of) if as_of else date.today()
+        if self.as_of != as_of:
+            with self._fit_lock:
+                if self.as_of != as_of:
+                    self.fit(as_of)
+
+        with self._lock:
+            entries = self._positions.get(ingredient, [])
+            dates = [(self.as_of + timedelta(days=h)).isoformat() for h in range(1, self.horizon + 1)]
+            spread = Z * np.sqrt(np.arange(1, self.horizon + 1))
+            results = []
+            for market_name, series in entries:
+                if market and market.lower() not in market_name.lower():
+                    continue
+                values = self.forecast[series]
+                naive = bool(self.naive[series])
+                interval = (np.zeros(self.horizon) if naive or np.isnan(self.sigma[series])
+                            else spread * self.sigma[series])
+                results.append({
+                    'market': market_name,
+                    'dates': dates,
+                    'price_per_kg': np.round(values, 2).tolist(),
+                    'lower': np.round(np.maximum(values - interval, 0), 2).tolist(),
+                    'upper': np.round(values + interval, 2).tolist(),
+                    'method': 'last_price' if naive else 'holt_winters',
+                    'last_observed': str(self.last_observed[series]),
+                })
+        return results
+
+
+_forecasters = {}
+_forecasters_lock = threading.Lock()
+
+
+def get_price_forecaster(db_path):
+    """Shared PriceForecaster for a database"""
+    forecaster = _forecasters.get(db_path)
+    if forecaster is None:
+        with _forecasters_lock:
+            forecaster = _forecasters.get(db_path)
+            if forecaster is None:
+                forecaster = _forecasters[db_path] = PriceForecaster(get_price_series(db_path))
+    return forecaster
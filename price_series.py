@@ -0,0 +1,281 @@
+"""
+Price Time Series Store
+One table of price observations keyed by (ingredient, market, price date),
+fed by the mandi sync (ingredient_price_history) and the village economy
+prices (food_prices), with rollup tables per day, week and month.
+
+Rollups are maintained incrementally: a batch of observations recomputes
+only the (ingredient, market, period) buckets it touched. They are keyed
+(ingredient, period, market) WITHOUT ROWID, so the trend of one ingredient
+across all markets over a date range is a single primary-key range scan.
+
+Trend queries return NumPy arrays (or a periods x markets matrix) rather
+than row dicts.
+"""
+
+import sqlite3
+import threading
+from datetime import date, datetime, timedelta
+
+import numpy as np
+
+
+GRANULARITIES = ('day', 'week', 'month')
+
+DATE_FORMATS = ('%Y-%m-%d', '%d/%m/%Y', '%d-%m-%Y', '%Y-%m-%dT%H:%M:%S', '%Y-%m-%d %H:%M:%S')
+
+
+def parse_price_date(value):
+    """date of an ISO / dd/mm/YYYY price date (or datetime string), else None"""
+    if isinstance(value, datetime):
+        return value.date()
+    if isinstance(value, date):
+        return value
+    text = (value or '').strip()
+    for fmt in DATE_FORMATS:
+        try:
+            return datetime.strptime(text[:19], fmt).date()
+        except ValueError:
+            continue
+    return None
+
+
+def period_bounds(day, granularity):
+    """(first, last) date of the day / ISO week / month containing day"""
+    if granularity == 'day':
+        return day, day
+    if granularity == 'week':
+        start = day - timedelta(days=day.weekday())
+        return start, start + timedelta(days=6)
+    if granularity == 'month':
+        start = day.replace(day=1)
+        next_month = (start + timedelta(days=32)).replace(day=1)
+        return start, next_month - timedelta(days=1)
+    raise ValueError(f"granularity must be one of {GRANULARITIES}")
+
+
+class PriceSeriesStore:
+    """price_observations + price_rollup_{day,week,month} tables"""
+
+    def __init__(self, db_path):
+        self.db_path = db_path
+        self._schema_checked = False
+        self._lock = threading.Lock()
+
+    def _connect(self):
+        conn = sqlite3.connect(self.db_path, timeout=10)
+        if not self._schema_checked:
+            with self._lock:
+                if not self._schema_checked:
+                    self._ensure_schema(conn)
+                    self._schema_checked = True
+        return conn
+
+    def ensure_schema(self):
+        """Create the tables (and backfill) now, before a caller opens its own transaction"""
+        self._connect().close()
+
+    def _ensure_schema(self, conn):
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS price_observations (
+                ingredient TEXT NOT NULL,
+                market TEXT NOT NULL,
+                price_date TEXT NOT NULL,
+                price_per_kg REAL NOT NULL,
+                min_price_per_kg REAL,
+                max_price_per_kg REAL,
+                source TEXT,
+                recorded_at TEXT,
+                PRIMARY KEY (ingredient, market, price_date)
+            ) WITHOUT ROWID
+        """)
+        for granularity in GRANULARITIES:
+            conn.execute(f"""
+                CREATE TABLE IF NOT EXISTS price_rollup_{granularity} (
+                    ingredient TEXT NOT NULL,
+                    period TEXT NOT NULL,
+                    market TEXT NOT NULL,
+                    price_sum REAL NOT NULL,
+                    price_min REAL,
+                    price_max REAL,
+                    observations INTEGER NOT NULL,
+                    PRIMARY KEY (ingredient, period, market)
+                ) WITHOUT ROWID
+            """)
+        conn.commit()
+
+        # First use on an existing database: load the history already recorded
+        if conn.execute("SELECT 1 FROM price_observations LIMIT 1").fetchone() is None:
+            self.record_many(self._existing_history(conn), conn=conn)
+            conn.commit()
+
+    @staticmethod
+    def _existing_history(conn):
+        """Observation rows from ingredient_price_history and food_prices, if present"""
+        rows = []
+        queries = (
+            """SELECT ingredient_name, market, recorded_date, price_per_kg, source
+               FROM ingredient_price_history""",
+            """SELECT ingredient_name, village, COALESCE(recorded_date, created_at), price_per_kg, source
+               FROM food_prices""",
+        )
+        for query in queries:
+            try:
+                for ingredient, market, price_date, price, source in conn.execute(query):
+                    rows.append((ingredient, market, price_date, price, None, None, source))
+            except sqlite3.OperationalError:
+                continue
+        return rows
+
+    # ==================== WRITES ====================
+
+    def record_many(self, rows, conn=None):
+        """
+        Upsert observations and refresh the rollup buckets they fall in
+
+        Args:
+            rows: iterable of (ingredient, market, price_date, price_per_kg,
+                  min_price_per_kg, max_price_per_kg, source); price_date may
+                  be ISO or dd/mm/YYYY (unparseable dates count as today)
+            conn: optional open connection; the caller commits (call
+                  ensure_schema() before starting that transaction)
+
+        Returns:
+            Number of observations written
+        """
+        today = date.today()
+        recorded_at = datetime.now().isoformat()
+        observations = []
+        buckets = {granularity: set() for granularity in GRANULARITIES}
+        for ingredient, market, price_date, price, low, high, source in rows:
+            if not ingredient or price is None or float(price) <= 0:
+                continue
+            day = parse_price_date(price_date) or today
+            market = market or ''
+            observations.append((ingredient, market, day.isoformat(), float(price),
+                                 low, high, source, recorded_at))
+            for granularity in GRANULARITIES:
+                start, end = period_bounds(day, granularity)
+                buckets[granularity].add((ingredient, market, start.isoformat(), end.isoformat()))
+        if not observations:
+            return 0
+
+        own_conn = conn is None
+        if own_conn:
+            conn = self._connect()
+        try:
+            conn.executemany("""
+                INSERT OR REPLACE INTO price_observations
+                (ingredient, market, price_date, price_per_kg, min_price_per_kg, max_price_per_kg,
+                 source, recorded_at)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+            """, observations)
+            for granularity, keys in buckets.items():
+                conn.executemany(f"""
+                    INSERT OR REPLACE INTO price_rollup_{granularity}
+                    (ingredient, period, market, price_sum, price_min, price_max, observations)
+                    SELECT ingredient, :start, market, SUM(price_per_kg),
+                           MIN(COALESCE(min_price_per_kg, price_per_kg)),
+                           MAX(COALESCE(max_price_per_kg, price_per_kg)), COUNT(*)
+                    FROM price_observations
+                    WHERE ingredient = :ingredient AND market = :market
+                      AND price_date BETWEEN :start AND :end
+                    GROUP BY ingredient, market
+                """, [{'ingredient': ingredient, 'market': market, 'start': start, 'end': end}
+                      for ingredient, market, start, end in keys])
+            if own_conn:
+                conn.commit()
+        finally:
+            if own_conn:
+                conn.close()
+        return len(observations)
+
+    # ==================== TRENDS ====================
+
+    def trend(self, ingredient, granularity='month', start=None, end=None, markets=None):
+        """
+        Rollup rows of one ingredient, ordered by period then market
+
+        Args:
+            granularity: 'day', 'week' or 'month'
+            start, end: optional dates (inclusive); periods are matched by
+                        their first day
+            markets: optional list of markets to keep
+
+        Returns:
+            dict of equal-length arrays: period (datetime64[D]), market,
+            avg, min, max, observations
+        """
+        if granularity not in GRANULARITIES:
+            raise ValueError(f"granularity must be one of {GRANULARITIES}")
+        query = f"""
+            SELECT period, market, price_sum / observations, price_min, price_max, observations
+            FROM price_rollup_{granularity}
+            WHERE ingredient = ? AND period BETWEEN ? AND ?
+        """
+        params = [ingredient,
+                  period_bounds(parse_price_date(start), granularity)[0].isoformat() if start else '',
+                  parse_price_date(end).isoformat() if end else '9999-12-31']
+        if markets:
+            query += f" AND market IN ({','.join('?' * len(markets))})"
+            params.extend(markets)
+        query += " ORDER BY period, market"
+
+        conn = self._connect()
+        try:
+            rows = conn.execute(query, params).fetchall()
+        finally:
+            conn.close()
+
+        periods, market_names, avg, low, high, counts = zip(*rows) if rows else ([],) * 6
+        return {
+            'period': np.array(periods, dtype='datetime64[D]'),
+            'market': np.array(market_names, dtype=object),
+            'avg': np.array(avg, dtype=np.float64),
+            'min': np.array(low, dtype=np.float64),
+            'max': np.array(high, dtype=np.float64),
+            'observations': np.array(counts, dtype=np.int64),
+        }
+
+    def daily_prices(self, start, end):
+        """(ingredient, market, day, average price) rows of all series between two dates"""
+        conn = self._connect()
+        try:
+            return conn.execute("""
+                SELECT ingredient, market, period, price_sum / observations
+                FROM price_rollup_day
+                WHERE period BETWEEN ? AND ?
+            """, (parse_price_date(start).isoformat(), parse_price_date(end).isoformat())).fetchall()
+        finally:
+            conn.close()
+
+    def trend_matrix(self, ingredient, granularity='month', start=None, end=None, markets=None,
+                     value='avg'):
+        """
+        Trend as a periods x markets matrix
+
+        Returns:
+            (periods datetime64[D] array, market names array, float matrix with
+            NaN where a market has no observation in a period)
+        """
+        series = self.trend(ingredient, granularity, start, end, markets)
+        periods, rows = np.unique(series['period'], return_inverse=True)
+        market_names, columns = np.unique(series['market'].astype(str), return_inverse=True)
+        matrix = np.full((len(periods), len(market_names)), np.nan)
+        matrix[rows, columns] = series[value]
+        return periods, market_names, matrix
+
+
+_stores = {}
+_stores_lock = threading.Lock()
+
+
+def get_price_series(db_path):
+    """Shared PriceSeriesStore for a database"""
+    store = _stores.get(db_path)
+    if store is None:
+        with _stores_lock:
+            store = _stores.get(db_path)
+            if store is None:
+                store = _stores[db_path] = PriceSeriesStore(db_path)
+    return store
@@ -0,0 +1,256 @@
+"""
+Materialized Recommendations
+Top-N hybrid recommendations for every child, computed once after each
+training run and served from a table instead of being recomputed per
+request.
+
+Rows carry the generation id (the recommender's trained_at) they were
+computed with. A read that finds a row from an older generation, or one
+marked stale by a new growth measurement, still serves it and queues an
+asynchronous refresh of that child (stale-while-revalidate). Empty rows
+are treated as misses.
+
+Two tiers:
+    - in-process LRU (per gunicorn worker)
+    - ml_recommendations table (shared by all workers, survives restarts)
+
+Invalidations and refreshes go through the table, so an LRU entry is only
+served while its row still has the same computed_at and is not stale (a
+primary-key lookup on a kept-open connection, no payload read).
+"""
+
+import json
+import os
+import sqlite3
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+
+LRU_SIZE = 4096
+
+# Recommendations stored per child; larger top_n requests are computed live
+MATERIALIZED_TOP_N = 30
+
+# Children scored per batch by the materialization job
+MATERIALIZE_CHUNK = 1024
+
+# Only the default hybrid recommendations are materialized
+MATERIALIZED_TYPE = 'hybrid'
+
+
+class RecommendationCache:
+    """LRU + ml_recommendations table of per-child top-N recommendations"""
+
+    def __init__(self, db_path='nutrition_advisor.db', max_entries=LRU_SIZE, top_n=MATERIALIZED_TOP_N):
+        self.db_path = db_path
+        self.max_entries = max_entries
+        self.top_n = top_n
+        self._entries = OrderedDict()  # child_id -> (generation, computed_at, recommendations)
+        self._lock = threading.Lock()
+        self._marker_conn = None  # (pid, connection) used for LRU validity checks
+        self._marker_lock = threading.Lock()
+        self._refreshing = set()
+        self._refresher = ThreadPoolExecutor(max_workers=1, thread_name_prefix='recommendation-refresh')
+        self._schema_checked = False
+        self.stats = {'lru_hits': 0, 'db_hits': 0, 'stale_hits': 0, 'misses': 0,
+                      'refreshes': 0, 'materialized': 0}
+
+    def _connect(self, **kwargs):
+        conn = sqlite3.connect(self.db_path, timeout=10, **kwargs)
+        if not self._schema_checked:
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS ml_recommendations (
+                    child_id INTEGER NOT NULL,
+                    recommendation_type TEXT NOT NULL,
+                    generation_id TEXT NOT NULL,
+                    stale INTEGER DEFAULT 0,
+                    recommendations_json TEXT NOT NULL,
+                    computed_at TIMESTAMP,
+                    PRIMARY KEY (child_id, recommendation_type)
+                )
+            """)
+            conn.commit()
+            self._schema_checked = True
+        return conn
+
+    # ==================== MATERIALIZATION ====================
+
+    def materialize(self, recommender, chunk_size=MATERIALIZE_CHUNK):
+        """
+        Compute and store top-N recommendations for every child
+
+        Runs after each training run; rows of older generations are removed
+        once the new generation is complete.
+
+        Returns:
+            Number of children materialized
+        """
+        generation = recommender.trained_at
+        if generation is None or recommender.child_profiles is None:
+            return 0
+
+        child_ids = [int(child_id) for child_id in recommender.child_profiles.index]
+        written = 0
+        conn = self._connect()
+        try:
+            for start in range(0, len(child_ids), chunk_size):
+                batch = recommender.get_hybrid_recommendations_batch(
+                    child_ids[start:start + chunk_size], top_n=self.top_n)
+                computed_at = datetime.now().isoformat()
+                conn.executemany("""
+                    INSERT OR REPLACE INTO ml_recommendations
+                    (child_id, recommendation_type, generation_id, stale, recommendations_json, computed_at)
+                    VALUES (?, ?, ?, 0, ?, ?)
+                """, [(child_id, MATERIALIZED_TYPE, generation,
+                       json.dumps(recommender.format_recommendations(recommendations)), computed_at)
+                      for child_id, recommendations in batch.items()])
+                conn.commit()
+                written += len(batch)
+
+            conn.execute("""
+                DELETE FROM ml_recommendations
+                WHERE recommendation_type = ? AND generation_id != ?
+            """, (MATERIALIZED_TYPE, generation))
+            conn.commit()
+        finally:
+            conn.close()
+
+        self.clear()
+        with self._lock:
+            self.stats['materialized'] = written
+        return written
+
+    # ==================== READS ====================
+
+    def get(self, recommender, child_id, recommendation_type=MATERIALIZED_TYPE, top_n=10):
+        """Recommendations for a child, from the LRU / table when materialized"""
+        if (recommendation_type != MATERIALIZED_TYPE or top_n > self.top_n
+                or not recommender.is_trained):
+            return recommender.get_recommendations(child_id, recommendation_type, top_n)
+
+        generation = recommender.trained_at
+        with self._lock:
+            entry = self._entries.get(child_id)
+        if entry is not None and entry[0] == generation:
+            # Another worker may have invalidated or refreshed the row
+            if self._marker(child_id) == (generation, 0, entry[1]):
+                with self._lock:
+                    if child_id in self._entries:
+                        self._entries.move_to_end(child_id)
+                    self.stats['lru_hits'] += 1
+                return entry[2][:top_n]
+            with self._lock:
+                if self._entries.get(child_id) is entry:
+                    del self._entries[child_id]
+
+        conn = self._connect()
+        try:
+            row = conn.execute("""
+                SELECT generation_id, stale, computed_at, recommendations_json
+                FROM ml_recommendations
+                WHERE child_id = ? AND recommendation_type = ?
+            """, (child_id, MATERIALIZED_TYPE)).fetchone()
+        finally:
+            conn.close()
+
+        recommendations = json.loads(row[3]) if row is not None else []
+        if recommendations:
+            row_generation, stale, computed_at, _ = row
+            if row_generation == generation and not stale:
+                self._remember(child_id, generation, computed_at, recommendations)
+                with self._lock:
+                    self.stats['db_hits'] += 1
+            else:
+                with self._lock:
+                    self.stats['stale_hits'] += 1
+                self.refresh_async(recommender, child_id)
+            return recommendations[:top_n]
+
+        with self._lock:
+            self.stats['misses'] += 1
+        return self.refresh(recommender, child_id)[:top_n]
+
+    def refresh(self, recommender, child_id):
+        """Recompute and store one child's recommendations"""
+        generation = recommender.trained_at
+        recommendations = recommender.get_recommendations(child_id, MATERIALIZED_TYPE, self.top_n)
+        computed_at = datetime.now().isoformat()
+        conn = self._connect()
+        try:
+            conn.execute("""
+                INSERT OR REPLACE INTO ml_recommendations
+                (child_id, recommendation_type, generation_id, stale, recommendations_json, computed_at)
+                VALUES (?, ?, ?, 0, ?, ?)
+            """, (child_id, MATERIALIZED_TYPE, generation, json.dumps(recommendations), computed_at))
+            conn.commit()
+        finally:
+            conn.close()
+        self._remember(child_id, generation, computed_at, recommendations)
+        with self._lock:
+            self.stats['refreshes'] += 1
+        return recommendations
+
+    def refresh_async(self, recommender, child_id):
+        """Queue a refresh unless one is already pending for this child"""
+        with self._lock:
+            if child_id in self._refreshing:
+                return False
+            self._refreshing.add(child_id)
+
+        def run():
+            try:
+                self.refresh(recommender, child_id)
+            except Exception as e:
+                print(f"[WARNING] Recommendation refresh for child {child_id} failed: {e}")
+            finally:
+                with self._lock:
+                    self._refreshing.discard(child_id)
+
+        self._refresher.submit(run)
+        return True
+
+    def _remember(self, child_id, generation, computed_at, recommendations):
+        if not recommendations:
+            return
+        with self._lock:
+            self._entries[child_id] = (generation, computed_at, recommendations)
+            self._entries.move_to_end(child_id)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def _marker(self, child_id):
+        """(generation_id, stale, computed_at) of a child's row, or None"""
+        with self._marker_lock:
+            # Connections do not survive gunicorn's fork
+            if self._marker_conn is None or self._marker_conn[0] != os.getpid():
+                self._marker_conn = (os.getpid(), self._connect(check_same_thread=False))
+            row = self._marker_conn[1].execute("""
+                SELECT generation_id, stale, computed_at
+                FROM ml_recommendations
+                WHERE child_id = ? AND recommendation_type = ?
+            """, (child_id, MATERIALIZED_TYPE)).fetchone()
+        return tuple(row) if row is not None else None
+
+    # ==================== INVALIDATION ====================
+
+    def invalidate(self, child_id):
+        """Mark a child's stored recommendations stale (served until refreshed)"""
+        with self._lock:
+            self._entries.pop(child_id, None)
+        conn = self._connect()
+        try:
+            conn.execute("UPDATE ml_recommendations SET stale = 1 WHERE child_id = ?", (child_id,))
+            conn.commit()
+        finally:
+            conn.close()
+
+    def clear(self):
+        """Empty the in-process tier"""
+        with self._lock:
+            self._entries.clear()
+
+    def get_stats(self):
+        with self._lock:
+            return dict(self.stats, lru_entries=len(self._entries), refreshing=len(self._refreshing))
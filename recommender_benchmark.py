@@ -0,0 +1,323 @@
+"""
+Recommender Benchmark
+Offline evaluation and latency benchmark for the meal recommender.
+
+Generates a synthetic database (children, growth histories, meal plans with
+per-child ingredients, feedback ratings) at a configurable scale, holds out
+each child's most recent rated plans, trains MealRecommendationSystem on
+the rest and reports:
+    - latency percentiles (p50/p95/p99) of train_all_models,
+      get_hybrid_recommendations and find_similar_children
+    - precision@k / recall@k per recommendation type against the held-out
+      plans the child rated well
+
+Children belong to taste groups that prefer a subset of ingredients, so a
+recommender that learns from plans and feedback should beat chance.
+
+Usage: python recommender_benchmark.py [--children N] [--output report.json]
+"""
+
+import argparse
+import contextlib
+import json
+import os
+import platform
+import sqlite3
+import sys
+import tempfile
+import time
+from datetime import date, datetime, timedelta
+
+import numpy as np
+
+from ml_recommender import MealRecommendationSystem
+
+
+CATEGORIES = ['Grains', 'Pulses', 'Vegetables', 'Fruits', 'Dairy', 'Protein']
+VILLAGES = ['Anandpur', 'Belgaum', 'Chandpur', 'Dharwad', 'Erode', 'Gokak']
+
+# A held-out plan counts as relevant when rated at least this
+RELEVANT_RATING = 4
+
+RECOMMENDATION_TYPES = ('hybrid', 'collaborative', 'content', 'svd')
+
+SCHEMA = """
+    CREATE TABLE children (
+        id INTEGER PRIMARY KEY AUTOINCREMENT, name TEXT NOT NULL, date_of_birth DATE NOT NULL,
+        gender TEXT, parent_name TEXT, phone_number TEXT, address TEXT, village TEXT,
+        health_notes TEXT, created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    );
+    CREATE TABLE growth_tracking (
+        id INTEGER PRIMARY KEY AUTOINCREMENT, child_id INTEGER NOT NULL,
+        measurement_date DATE NOT NULL, weight_kg REAL, height_cm REAL, bmi REAL
+    );
+    CREATE INDEX idx_growth_child_date ON growth_tracking (child_id, measurement_date);
+    CREATE TABLE ingredients (
+        id INTEGER PRIMARY KEY AUTOINCREMENT, name TEXT NOT NULL UNIQUE, category TEXT NOT NULL,
+        cost_per_kg REAL NOT NULL, protein_per_100g REAL, carbs_per_100g REAL, fat_per_100g REAL,
+        calories_per_100g REAL, fiber_per_100g REAL, iron_per_100g REAL, calcium_per_100g REAL
+    );
+    CREATE TABLE meal_plans (
+        id INTEGER PRIMARY KEY AUTOINCREMENT, plan_name TEXT, budget REAL, num_children INTEGER,
+        age_group TEXT, total_cost REAL, nutrition_score REAL, plan_data TEXT,
+        child_id INTEGER, ingredients TEXT, created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    );
+    CREATE TABLE meal_feedback (
+        id INTEGER PRIMARY KEY AUTOINCREMENT, plan_id INTEGER, rating INTEGER, comments TEXT,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    );
+"""
+
+
+# ==================== SYNTHETIC DATA ====================
+
+def generate_dataset(db_path, n_children=1000, plans_per_child=8, measurements_per_child=6,
+                     n_ingredients=80, n_groups=6, holdout_plans=2, seed=42):
+    """
+    Write a synthetic recommender database
+
+    Each child's last `holdout_plans` plans are not written; they are
+    returned as ground truth instead.
+
+    Returns:
+        (stats dict, {child_id: set of relevant held-out ingredient names})
+    """
+    rng = np.random.RandomState(seed)
+    conn = sqlite3.connect(db_path)
+    conn.executescript(SCHEMA)
+
+    names = [f"ingredient_{i:03d}" for i in range(n_ingredients)]
+    nutrients = rng.uniform(0, 1, size=(n_ingredients, 8)) * [400, 30, 70, 20, 400, 10, 8, 300]
+    conn.executemany("""
+        INSERT INTO ingredients (name, category, cost_per_kg, protein_per_100g, carbs_per_100g,
+                                 fat_per_100g, calories_per_100g, fiber_per_100g,
+                                 iron_per_100g, calcium_per_100g)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+    """, [(name, CATEGORIES[i % len(CATEGORIES)], *map(float, nutrients[i]))
+          for i, name in enumerate(names)])
+
+    # Taste groups: each prefers a random third of the ingredients
+    preferred = [rng.choice(n_ingredients, size=max(4, n_ingredients // 3), replace=False)
+                 for _ in range(n_groups)]
+
+    today = date.today()
+    children, measurements = [], []
+    groups = rng.randint(0, n_groups, size=n_children)
+    for child_id in range(1, n_children + 1):
+        age_days = int(rng.uniform(0.5, 6) * 365)
+        dob = today - timedelta(days=age_days)
+        children.append((child_id, f"Child {child_id}", dob.isoformat(), rng.choice(['M', 'F']),
+                         VILLAGES[groups[child_id - 1] % len(VILLAGES)],
+                         'anemia' if rng.rand() < 0.15 else None))
+        weight, height = 3.5 + age_days / 365 * 2.2, 50 + age_days / 365 * 9
+        for m in range(measurements_per_child):
+            when = today - timedelta(days=30 * (measurements_per_child - m))
+            w = float(weight * rng.uniform(0.85, 1.05))
+            h = float(height * rng.uniform(0.95, 1.02))
+            measurements.append((child_id, when.isoformat(), w, h, w / (h / 100) ** 2))
+    conn.executemany("INSERT INTO children (id, name, date_of_birth, gender, village, health_notes) "
+                     "VALUES (?, ?, ?, ?, ?, ?)", children)
+    conn.executemany("INSERT INTO growth_tracking (child_id, measurement_date, weight_kg, height_cm, bmi) "
+                     "VALUES (?, ?, ?, ?, ?)", measurements)
+
+    holdout = {}
+    plan_id = 0
+    plans, feedback = [], []
+    for child_id in range(1, n_children + 1):
+        liked = set(preferred[groups[child_id - 1]].tolist())
+        for p in range(plans_per_child):
+            # Mostly preferred ingredients, some exploration
+            pool = list(liked) if rng.rand() < 0.8 else list(range(n_ingredients))
+            chosen = rng.choice(pool, size=min(5, len(pool)), replace=False)
+            share = np.mean([c in liked for c in chosen])
+            rating = int(np.clip(round(1 + 4 * share + rng.normal(0, 0.5)), 1, 5))
+            ingredient_names = [names[c] for c in chosen]
+
+            if p >= plans_per_child - holdout_plans:
+                if rating >= RELEVANT_RATING:
+                    holdout.setdefault(child_id, set()).update(ingredient_names)
+                continue
+
+            plan_id += 1
+            created = datetime.now() - timedelta(days=plans_per_child - p, minutes=child_id)
+            plans.append((plan_id, f"Plan {plan_id}", child_id,
+                          json.dumps({name: 100 for name in ingredient_names}),
+                          float(rng.uniform(30, 60)), float(40 + 12 * rating + rng.normal(0, 4)),
+                          created.isoformat(sep=' ')))
+            if rng.rand() < 0.7:
+                feedback.append((plan_id, rating))
+    conn.executemany("""
+        INSERT INTO meal_plans (id, plan_name, child_id, ingredients, total_cost, nutrition_score, created_at)
+        VALUES (?, ?, ?, ?, ?, ?, ?)
+    """, plans)
+    conn.executemany("INSERT INTO meal_feedback (plan_id, rating) VALUES (?, ?)", feedback)
+    conn.commit()
+    conn.close()
+
+    stats = {
+        'children': n_children,
+        'ingredients': n_ingredients,
+        'growth_measurements': len(measurements),
+        'meal_plans': len(plans),
+        'feedback': len(feedback),
+        'children_with_holdout': len(holdout),
+    }
+    return stats, holdout
+
+
+# ==================== MEASUREMENT ====================
+
+def latency_summary(samples_ms):
+    """p50/p95/p99/mean/max of a list of millisecond timings"""
+    samples = np.asarray(samples_ms, dtype=float)
+    if not len(samples):
+        return {'runs': 0}
+    return {
+        'runs': int(len(samples)),
+        'p50_ms': round(float(np.percentile(samples, 50)), 3),
+        'p95_ms': round(float(np.percentile(samples, 95)), 3),
+        'p99_ms': round(float(np.percentile(samples, 99)), 3),
+        'mean_ms': round(float(samples.mean()), 3),
+        'max_ms': round(float(samples.max()), 3),
+    }
+
+
+def time_calls(func, args_list):
+    """Call func(*args) for each args tuple and return per-call milliseconds"""
+    timings = []
+    for args in args_list:
+        start = time.perf_counter()
+        func(*args)
+        timings.append((time.perf_counter() - start) * 1000)
+    return timings
+
+
+def precision_recall_at_k(recommended, relevant, k):
+    """precision@k and recall@k of one ranked list"""
+    top = list(recommended)[:k]
+    hits = len(set(top) & relevant)
+    return hits / k, hits / len(relevant)
+
+
+def evaluate(recommender, holdout, k=10, types=RECOMMENDATION_TYPES, max_children=None):
+    """Mean precision@k / recall@k per recommendation type over held-out children"""
+    child_ids = sorted(holdout)[:max_children]
+    methods = {
+        'hybrid': lambda child_id: [r[0] for r in recommender.get_hybrid_recommendations(child_id, top_n=k)],
+        'collaborative': lambda child_id: [r[0] for r in recommender.get_collaborative_recommendations(child_id, top_n=k)],
+        'content': lambda child_id: [r[0] for r in recommender.get_content_based_recommendations(child_id, top_n=k)],
+        'svd': lambda child_id: [r[0] for r in recommender.get_svd_recommendations(child_id, top_n=k)],
+    }
+
+    results = {}
+    for name in types:
+        precisions, recalls = [], []
+        for child_id in child_ids:
+            precision, recall = precision_recall_at_k(methods[name](child_id), holdout[child_id], k)
+            precisions.append(precision)
+            recalls.append(recall)
+        results[name] = {
+            f'precision@{k}': round(float(np.mean(precisions)), 4) if precisions else None,
+            f'recall@{k}': round(float(np.mean(recalls)), 4) if recalls else None,
+            'children': len(child_ids),
+        }
+    return results
+
+
+# ==================== REPORT ====================
+
+def run_benchmark(n_children=1000, plans_per_child=8, n_ingredients=80, samples=200,
+                  train_runs=1, k=10, seed=42, db_path=None):
+    """
+    Generate data, train, time and evaluate the recommender
+
+    Returns:
+        JSON-serializable report dict
+    """
+    own_db = db_path is None
+    if own_db:
+        fd, db_path = tempfile.mkstemp(suffix='.db', prefix='recommender-bench-')
+        os.close(fd)
+        os.remove(db_path)
+
+    try:
+        start = time.perf_counter()
+        stats, holdout = generate_dataset(db_path, n_children=n_children, plans_per_child=plans_per_child,
+                                          n_ingredients=n_ingredients, seed=seed)
+        generate_ms = (time.perf_counter() - start) * 1000
+
+        recommender = None
+        train_ms = []
+        for _ in range(train_runs):
+            recommender = MealRecommendationSystem(db_path=db_path)
+            start = time.perf_counter()
+            recommender.train_all_models()
+            train_ms.append((time.perf_counter() - start) * 1000)
+
+        rng = np.random.RandomState(seed)
+        sample_ids = [(int(child_id),) for child_id in
+                      rng.choice(np.arange(1, n_children + 1), size=min(samples, n_children), replace=False)]
+
+        report = {
+            'generated_at': datetime.now().isoformat(),
+            'config': {
+                'children': n_children,
+                'plans_per_child': plans_per_child,
+                'ingredients': n_ingredients,
+                'samples': len(sample_ids),
+                'train_runs': train_runs,
+                'k': k,
+                'seed': seed,
+            },
+            'environment': {
+                'python': platform.python_version(),
+                'numpy': np.__version__,
+                'cpu_count': os.cpu_count(),
+            },
+            'dataset': dict(stats, generate_ms=round(generate_ms, 1)),
+            'latency': {
+                'train_all_models': latency_summary(train_ms),
+                'get_hybrid_recommendations': latency_summary(
+                    time_calls(lambda child_id: recommender.get_hybrid_recommendations(child_id, top_n=k),
+                               sample_ids)),
+                'find_similar_children': latency_summary(
+                    time_calls(lambda child_id: recommender.find_similar_children(child_id, top_n=5),
+                               sample_ids)),
+            },
+            'quality': evaluate(recommender, holdout, k=k, max_children=samples),
+        }
+        return report
+    finally:
+        if own_db and os.path.exists(db_path):
+            os.remove(db_path)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark and evaluate the meal recommender')
+    parser.add_argument('--children', type=int, default=1000)
+    parser.add_argument('--plans-per-child', type=int, default=8)
+    parser.add_argument('--ingredients', type=int, default=80)
+    parser.add_argument('--samples', type=int, default=200, help='children timed and evaluated')
+    parser.add_argument('--train-runs', type=int, default=1)
+    parser.add_argument('-k', type=int, default=10)
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--db', help='keep the generated database at this path')
+    parser.add_argument('--output', help='write the JSON report here (default: stdout)')
+    args = parser.parse_args()
+
+    # Training progress goes to stderr so stdout is only the report
+    with contextlib.redirect_stdout(sys.stderr):
+        report = run_benchmark(n_children=args.children, plans_per_child=args.plans_per_child,
+                               n_ingredients=args.ingredients, samples=args.samples,
+                               train_runs=args.train_runs, k=args.k, seed=args.seed, db_path=args.db)
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(output)
+        print(f"Report written to {args.output}")
+    else:
+        print(output)
+
+
+if __name__ == '__main__':
+    main()
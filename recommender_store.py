@@ -0,0 +1,392 @@
+"""
+Recommender Artifact Store
+Persists trained MealRecommendationSystem state (scalers, similarity index,
+content model, feature matrices) together with the training timestamp and the data
+watermark it was trained on.
+
+The RecommenderService loads the artifacts at startup and serves them to
+requests; retraining only ever happens in a background thread, when the
+watermark of the live database moves past the one stored with the artifacts
+(or when explicitly requested via /api/ml/train).
+
+New growth measurements are applied incrementally: only the affected
+children's feature rows are recomputed, and the neighbor index is rebuilt
+in batches. Saved per-child meal plans are added to the ingredient index.
+
+After each training run the top-N recommendations of every child are
+materialized (see recommendation_cache) and requests read them from there.
+
+Layout (under models/recommender/):
+    artifacts.pkl    pickled dict from MealRecommendationSystem.export_artifacts()
+    metadata.json    trained_at, watermark, row counts
+"""
+
+import json
+import os
+import pickle
+import sqlite3
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+try:
+    import fcntl
+except ImportError:  # Windows - single process dev server
+    fcntl = None
+
+import database as db
+from ml_recommender import MealRecommendationSystem
+from recommendation_cache import RecommendationCache
+
+
+ARTIFACT_DIR = os.path.join('models', 'recommender')
+ARTIFACT_FILE = 'artifacts.pkl'
+METADATA_FILE = 'metadata.json'
+
+# Seconds between watermark checks in each worker
+CHECK_INTERVAL = int(os.environ.get('RECOMMENDER_CHECK_INTERVAL', 300))
+
+# Dirty rows after which the neighbor index is rebuilt right away
+# (otherwise it is rebuilt on the next watcher check)
+INDEX_REBUILD_THRESHOLD = int(os.environ.get('RECOMMENDER_INDEX_REBUILD', 100))
+
+# Tables whose changes make the trained artifacts stale
+WATERMARK_TABLES = ('children', 'growth_tracking', 'meal_plans', 'ingredients')
+
+
+def data_watermark(db_path):
+    """
+    Cheap fingerprint of the training data: row count and max id per table
+
+    Inserts and deletes move it; it is compared for equality only.
+    """
+    conn = sqlite3.connect(db_path)
+    try:
+        watermark = {}
+        for table in WATERMARK_TABLES:
+            try:
+                count, max_id = conn.execute(f"SELECT COUNT(*), MAX(id) FROM {table}").fetchone()
+            except sqlite3.OperationalError:
+                count, max_id = 0, None
+            watermark[table] = [count, max_id]
+        return watermark
+    finally:
+        conn.close()
+
+
+class RecommenderArtifactStore:
+    """Filesystem store for trained recommender artifacts"""
+
+    def __init__(self, root=ARTIFACT_DIR):
+        self.root = root
+        self.artifact_file = os.path.join(root, ARTIFACT_FILE)
+        self.metadata_file = os.path.join(root, METADATA_FILE)
+
+    def exists(self):
+        return os.path.exists(self.artifact_file) and os.path.exists(self.metadata_file)
+
+    def metadata(self):
+        """Metadata of the stored artifacts, or None"""
+        try:
+            with open(self.metadata_file) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def mtime(self):
+        try:
+            return os.path.getmtime(self.metadata_file)
+        except OSError:
+            return 0
+
+    def save(self, recommender):
+        """Write artifacts then metadata, each via temp file + os.replace"""
+        os.makedirs(self.root, exist_ok=True)
+        artifacts = recommender.export_artifacts()
+
+        tmp_file = f"{self.artifact_file}.tmp-{os.getpid()}"
+        with open(tmp_file, 'wb') as f:
+            pickle.dump(artifacts, f)
+        os.replace(tmp_file, self.artifact_file)
+
+        metadata = {
+            'trained_at': recommender.trained_at,
+            'watermark': recommender.watermark,
+            'children': 0 if recommender.child_profiles is None else len(recommender.child_profiles),
+            'ingredients': 0 if recommender.ingredient_features is None else len(recommender.ingredient_features),
+        }
+        tmp_file = f"{self.metadata_file}.tmp-{os.getpid()}"
+        with open(tmp_file, 'w') as f:
+            json.dump(metadata, f, indent=2)
+        os.replace(tmp_file, self.metadata_file)
+        return metadata
+
+    def load(self, db_path):
+        """MealRecommendationSystem restored from the artifacts"""
+        with open(self.artifact_file, 'rb') as f:
+            artifacts = pickle.load(f)
+        return MealRecommendationSystem(db_path=db_path).load_artifacts(artifacts)
+
+    def training_lock(self):
+        """Exclusive non-blocking lock so only one worker retrains; None if held elsewhere"""
+        os.makedirs(self.root, exist_ok=True)
+        lock_file = open(os.path.join(self.root, '.train.lock'), 'w')
+        if fcntl is None:
+            return lock_file
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            lock_file.close()
+            return None
+        return lock_file
+
+
+class RecommenderService:
+    """Process-wide owner of the trained recommender"""
+
+    def __init__(self, db_path='nutrition_advisor.db', store=None, check_interval=CHECK_INTERVAL, watch=True):
+        self.db_path = db_path
+        self.store = store or RecommenderArtifactStore()
+        self.check_interval = check_interval
+        # watch=False: no background watcher; callers drive check() / retrain() themselves
+        self.watch = watch
+        self._recommender = MealRecommendationSystem(db_path=db_path)
+        self._loaded_mtime = None
+        self._lock = threading.Lock()
+        self._training = False
+        self._last_error = None
+        self._watcher_pid = None
+        # Incremental updates run one at a time, off the request thread
+        self._updates = ThreadPoolExecutor(max_workers=1, thread_name_prefix='recommender-update')
+        self.recommendations = RecommendationCache(db_path)
+
+    # ==================== SERVING ====================
+
+    def get(self):
+        """
+        Current recommender - trained if artifacts exist, otherwise an untrained
+        instance whose methods fall back to rule-based recommendations
+        """
+        self._ensure_watcher()
+        return self._recommender
+
+    def recommend(self, child_id, recommendation_type='hybrid', top_n=10):
+        """Recommendations for a child, served from the materialized table when possible"""
+        return self.recommendations.get(self.get(), child_id, recommendation_type, top_n)
+
+    def load(self):
+        """Load stored artifacts if they are newer than the ones in memory"""
+        mtime = self.store.mtime()
+        if not mtime or mtime == self._loaded_mtime:
+            return False
+        try:
+            recommender = self.store.load(self.db_path)
+        except Exception as e:
+            self._last_error = f"load failed: {e}"
+            print(f"[WARNING] Could not load recommender artifacts: {e}")
+            return False
+        with self._lock:
+            self._recommender = recommender
+            self._loaded_mtime = mtime
+        print(f"[OK] Recommender artifacts loaded (trained {recommender.trained_at})")
+        return True
+
+    # ==================== TRAINING ====================
+
+    def is_stale(self):
+        """True when the live data watermark differs from the trained one"""
+        return data_watermark(self.db_path) != self._recommender.watermark
+
+    def retrain(self):
+        """Train, persist and swap in a new recommender (runs in the background thread)"""
+        lock = self.store.training_lock()
+        if lock is None:
+            # Another worker is training; its artifacts are picked up by load()
+            return False
+        try:
+            watermark = data_watermark(self.db_path)
+            recommender = MealRecommendationSystem(db_path=self.db_path)
+            recommender.train_all_models(watermark=watermark)
+            self.store.save(recommender)
+            with self._lock:
+                self._recommender = recommender
+                self._loaded_mtime = self.store.mtime()
+            self._last_error = None
+        except Exception as e:
+            self._last_error = f"training failed: {e}"
+            print(f"[ERROR] Recommender training failed: {e}")
+            return False
+        finally:
+            lock.close()
+
+        try:
+            self.recommendations.materialize(recommender)
+        except Exception as e:
+            self._last_error = f"materialization failed: {e}"
+            print(f"[WARNING] Recommendation materialization failed: {e}")
+        return True
+
+    def retrain_async(self):
+        """Start a background retrain unless one is already running in this process"""
+        with self._lock:
+            if self._training:
+                return False
+            self._training = True
+
+        def run():
+            try:
+                self.retrain()
+            finally:
+                with self._lock:
+                    self._training = False
+
+        threading.Thread(target=run, name='recommender-retrain', daemon=True).start()
+        return True
+
+    # ==================== INCREMENTAL UPDATES ====================
+
+    def on_growth_measurement(self, child_id):
+        """Growth listener: queue an update of just this child's feature row"""
+        if self._recommender.is_trained:
+            self._updates.submit(self._update_children, [child_id])
+            self.recommendations.invalidate(child_id)
+
+    def on_meal_plan_saved(self, plan_id, child_id, ingredients, nutrition_score):
+        """Meal plan listener: add a per-child plan to the ingredient index"""
+        if child_id is not None and self._recommender.is_trained:
+            self._updates.submit(self._recommender.add_meal_plan, plan_id, child_id,
+                                 ingredients, nutrition_score)
+
+    def _publish(self, update):
+        """
+        Run update on a clone of the live recommender and swap it in
+
+        Request threads keep reading the old instance until the swap; the
+        result is dropped if retrain() / load() replaced it meanwhile.
+        """
+        current = self._recommender
+        recommender = current.clone()
+        update(recommender)
+        with self._lock:
+            if self._recommender is not current:
+                return False
+            self._recommender = recommender
+        return True
+
+    def _update_children(self, child_ids, watermark=None):
+        def update(recommender):
+            recommender.update_child_features(child_ids)
+            if recommender.index_dirty >= INDEX_REBUILD_THRESHOLD:
+                recommender.refresh_index()
+            if watermark is not None:
+                recommender.watermark = watermark
+
+        try:
+            self._publish(update)
+        except Exception as e:
+            self._last_error = f"incremental update failed: {e}"
+            print(f"[WARNING] Recommender update for children {child_ids} failed: {e}")
+
+    def _refresh_index(self):
+        self._publish(lambda recommender: recommender.refresh_index())
+
+    def _catch_up(self, watermark):
+        """
+        Apply growth_tracking inserts made since the trained watermark
+
+        Covers writes handled by other workers (whose listeners ran there).
+        Returns False when something other than new measurements changed,
+        which needs a full retrain.
+        """
+        trained = self._recommender.watermark
+        if not trained or set(watermark) != set(trained):
+            return False
+        changed = [table for table in watermark if watermark[table] != trained[table]]
+        if changed != ['growth_tracking']:
+            return False
+
+        old_count, old_max = trained['growth_tracking']
+        new_count, _ = watermark['growth_tracking']
+        conn = sqlite3.connect(self.db_path)
+        try:
+            rows = conn.execute(
+                "SELECT child_id FROM growth_tracking WHERE id > ?", (old_max or 0,)
+            ).fetchall()
+        finally:
+            conn.close()
+        # Deletes or updates in place cannot be replayed from ids alone
+        if new_count - old_count != len(rows):
+            return False
+
+        child_ids = sorted({row[0] for row in rows})
+        self._updates.submit(self._update_children, child_ids, watermark).result()
+        return True
+
+    def check(self):
+        """Pick up artifacts from other workers, catch up or retrain if the data moved"""
+        self.load()
+        watermark = data_watermark(self.db_path)
+        if watermark != self._recommender.watermark and not self._catch_up(watermark):
+            self.retrain_async()
+            return
+        # Batched rebuild of the neighbor index for rows updated since the last check
+        if self._recommender.index_dirty:
+            self._updates.submit(self._refresh_index).result()
+
+    # ==================== WATCHER ====================
+
+    def _ensure_watcher(self):
+        # Threads do not survive gunicorn's fork, so each worker starts its own
+        if not self.watch or self._watcher_pid == os.getpid():
+            return
+        with self._lock:
+            if self._watcher_pid == os.getpid():
+                return
+            self._watcher_pid = os.getpid()
+        threading.Thread(target=self._watch, name='recommender-watcher', daemon=True).start()
+
+    def _watch(self):
+        while True:
+            try:
+                self.check()
+            except Exception as e:
+                self._last_error = f"watch failed: {e}"
+            time.sleep(self.check_interval)
+
+    def status(self):
+        recommender = self._recommender
+        return {
+            'trained': recommender.is_trained,
+            'index_dirty': recommender.index_dirty,
+            'trained_at': recommender.trained_at,
+            'watermark': recommender.watermark,
+            'training': self._training,
+            'last_error': self._last_error,
+            'stored': self.store.metadata(),
+            'recommendations': self.recommendations.get_stats(),
+            'checked_at': datetime.now().isoformat(),
+        }
+
+
+_service = None
+_service_lock = threading.Lock()
+
+
+def get_recommender_service():
+    """Shared RecommenderService; loads stored artifacts on first use"""
+    global _service
+    if _service is None:
+        with _service_lock:
+            if _service is None:
+                service = RecommenderService()
+                service.load()
+                db.add_growth_listener(service.on_growth_measurement)
+                db.add_meal_plan_listener(service.on_meal_plan_saved)
+                _service = service
+    return _service
+
+
+def get_recommender():
+    """Trained MealRecommendationSystem for request handlers (never trains)"""
+    return get_recommender_service().get()
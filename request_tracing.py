@@ -0,0 +1,142 @@
+"""
+Request Tracing
+Levelled, sampled diagnostic output and per-phase timings for hot endpoints.
+
+Replaces unconditional print() calls on the request path: messages below
+TRACE_LEVEL are skipped without formatting, and DEBUG/TRACE messages are
+only written for a sampled fraction of requests.
+
+Environment:
+    TRACE_LEVEL         ERROR | WARNING | INFO | DEBUG | TRACE (default INFO)
+    TRACE_SAMPLE_RATE   fraction of requests whose DEBUG/TRACE output is kept (default 1.0)
+    TRACE_HEADERS       1 to add Server-Timing / X-Phase-* headers (also on when app.debug)
+"""
+
+import os
+import random
+import sys
+import threading
+import time
+from contextlib import contextmanager
+
+
+LEVELS = {'ERROR': 40, 'WARNING': 30, 'INFO': 20, 'DEBUG': 10, 'TRACE': 5}
+
+
+def _env_level():
+    return LEVELS.get(os.environ.get('TRACE_LEVEL', 'INFO').upper(), LEVELS['INFO'])
+
+
+def _env_sample_rate():
+    try:
+        return min(max(float(os.environ.get('TRACE_SAMPLE_RATE', 1.0)), 0.0), 1.0)
+    except ValueError:
+        return 1.0
+
+
+class RequestTrace:
+    """Sampling decision and phase timings of one request"""
+
+    def __init__(self, sampled):
+        self.sampled = sampled
+        self.phases = {}
+        self.start = time.perf_counter()
+
+    @contextmanager
+    def phase(self, name):
+        """Time a block; repeated phases of the same name accumulate"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.phases[name] = self.phases.get(name, 0.0) + (time.perf_counter() - start) * 1000
+
+    def total_ms(self):
+        return (time.perf_counter() - self.start) * 1000
+
+    def headers(self):
+        """Server-Timing plus one X-Phase-<name>-Ms header per phase"""
+        timings = dict(self.phases, total=self.total_ms())
+        headers = {
+            'Server-Timing': ', '.join(f"{name};dur={ms:.2f}" for name, ms in timings.items())
+        }
+        for name, ms in timings.items():
+            headers[f"X-Phase-{name.capitalize()}-Ms"] = f"{ms:.2f}"
+        return headers
+
+
+class Tracer:
+    """Named, levelled tracer; one per module or endpoint"""
+
+    def __init__(self, name, level=None, sample_rate=None):
+        self.name = name
+        self.level = _env_level() if level is None else LEVELS.get(str(level).upper(), level)
+        self.sample_rate = _env_sample_rate() if sample_rate is None else sample_rate
+        self._local = threading.local()
+
+    # ==================== REQUEST SCOPE ====================
+
+    def start(self):
+        """Begin a request: decide sampling once and reset phase timings"""
+        sampled = self.sample_rate >= 1.0 or random.random() < self.sample_rate
+        trace = RequestTrace(sampled)
+        self._local.trace = trace
+        return trace
+
+    @property
+    def current(self):
+        return getattr(self._local, 'trace', None)
+
+    # ==================== OUTPUT ====================
+
+    def enabled(self, level):
+        """True if a message at `level` would be written for the current request"""
+        level_no = LEVELS[level]
+        if level_no < self.level:
+            return False
+        if level_no < LEVELS['INFO']:
+            trace = self.current
+            return trace is None or trace.sampled
+        return True
+
+    def _log(self, level, message, args):
+        if not self.enabled(level):
+            return
+        if args:
+            message = message % args
+        stream = sys.stderr if LEVELS[level] >= LEVELS['WARNING'] else sys.stdout
+        print(f"[{level}] {self.name}: {message}", file=stream)
+
+    def error(self, message, *args):
+        self._log('ERROR', message, args)
+
+    def warning(self, message, *args):
+        self._log('WARNING', message, args)
+
+    def info(self, message, *args):
+        self._log('INFO', message, args)
+
+    def debug(self, message, *args):
+        self._log('DEBUG', message, args)
+
+    def trace(self, message, *args):
+        self._log('TRACE', message, args)
+
+
+def timing_headers_enabled(app=None):
+    """Per-phase response headers are only sent when debugging"""
+    if os.environ.get('TRACE_HEADERS', '').lower() in ('1', 'true', 'yes'):
+        return True
+    return bool(app is not None and app.debug)
+
+
+_tracers = {}
+_tracers_lock = threading.Lock()
+
+
+def get_tracer(name):
+    """Process-wide Tracer for a name"""
+    with _tracers_lock:
+        if name not in _tracers:
+            _tracers[name] = Tracer(name)
+        return _tracers[name]
@@ -0,0 +1,72 @@
+"""ChildSimilarityIndex: blocked cosine top-k and village pre-filter"""
+
+import numpy as np
+import pandas as pd
+from sklearn.metrics.pairwise import cosine_similarity
+
+from child_similarity import ChildSimilarityIndex
+from ml_recommender import MealRecommendationSystem
+from test_ml_recommender import _make_db
+
+
+def _profiles(n=500, seed=0):
+    rng = np.random.RandomState(seed)
+    profiles = pd.DataFrame(rng.normal(size=(n, 9)), index=np.arange(1000, 1000 + n))
+    villages = pd.Series(rng.choice(['A', 'B', 'C', None], size=n), index=profiles.index)
+    return profiles, villages
+
+
+def test_query_matches_brute_force_across_blocks():
+    profiles, villages = _profiles()
+    index = ChildSimilarityIndex(block_size=64).build(profiles, villages)
+    expected = cosine_similarity(profiles.values)
+
+    for pos in (0, 17, 499):
+        child_id = profiles.index[pos]
+        result = index.query(profiles.iloc[pos].values, k=5, exclude=child_id)
+        scores = expected[pos].copy()
+        scores[pos] = -np.inf
+        top = np.argsort(-scores)[:5]
+        assert [cid for cid, _ in result] == list(profiles.index[top])
+        np.testing.assert_allclose([s for _, s in result], scores[top], atol=1e-5)
+
+
+def test_query_many_matches_single_queries():
+    profiles, villages = _profiles()
+    index = ChildSimilarityIndex(block_size=100).build(profiles, villages)
+    ids = list(profiles.index[:4])
+    batch = index.query_many(profiles.loc[ids].values, k=3, exclude=ids)
+    for child_id, result in zip(ids, batch):
+        single = index.query(profiles.loc[child_id].values, k=3, exclude=child_id)
+        assert [cid for cid, _ in result] == [cid for cid, _ in single]
+        np.testing.assert_allclose([s for _, s in result], [s for _, s in single], atol=1e-5)
+
+
+def test_village_prefilter():
+    profiles, villages = _profiles()
+    index = ChildSimilarityIndex(block_size=32).build(profiles, villages)
+    child_id = profiles.index[3]
+
+    result = index.query(profiles.loc[child_id].values, k=10, village='B', exclude=child_id)
+    assert len(result) == 10
+    assert all(villages[cid] == 'B' for cid, _ in result)
+    assert index.village_of(child_id) == villages[child_id]
+    assert index.query(profiles.loc[child_id].values, k=5, village='nowhere') == []
+
+
+def test_find_similar_children_has_no_duplicates(tmp_path):
+    db_path = str(tmp_path / 'rec.db')
+    _make_db(db_path)
+    recommender = MealRecommendationSystem(db_path=db_path)
+    recommender.build_child_feature_matrix()
+    assert recommender.train_collaborative_model()
+
+    similar = recommender.find_similar_children(1, top_n=8)
+    ids = [child['child_id'] for child in similar]
+    assert len(ids) == 8 and len(set(ids)) == 8 and 1 not in ids
+    scores = [child['similarity_score'] for child in similar]
+    assert scores == sorted(scores, reverse=True)
+
+    village = recommender.similarity_index.village_of(1)
+    same = recommender.find_similar_children(1, top_n=30, same_village=True)
+    assert same and all(child['village'] == (village or 'Unknown') for child in same)
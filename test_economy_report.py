@@ -0,0 +1,90 @@
+"""All-villages economy report: matches the per-village queries, JSON / CSV streams"""
+
+import csv
+import io
+import json
+import sqlite3
+
+import pytest
+from flask import Flask
+
+import economy_report
+import village_economy as ve
+from test_village_economy import create_ingredients
+
+
+@pytest.fixture
+def db_path(tmp_path, monkeypatch):
+    path = str(tmp_path / 'economy.db')
+    monkeypatch.setattr(ve, 'DB_PATH', path)
+    create_ingredients(path)
+    ve.initialize_economy_tables()
+
+    analyzer = ve.VillageEconomyAnalyzer()
+    for row in ({'ingredient_name': 'Rice', 'village': 'Hubballi', 'price_per_kg': 40},
+                {'ingredient_name': 'Milk', 'village': 'Hubballi', 'price_per_kg': 60},
+                {'ingredient_name': 'Rice', 'village': 'Dharwad', 'price_per_kg': 30},
+                {'ingredient_name': 'Rice', 'village': 'Gadag', 'price_per_kg': 35},
+                {'ingredient_name': 'Milk', 'price_per_kg': 50}):
+        analyzer.add_price_update(row)
+
+    conn = sqlite3.connect(path)
+    now = ve.datetime.now()
+    ve._add_other_sample_data(conn.cursor(), now.strftime('%B'), now.year)
+    conn.commit()
+    conn.close()
+    return path
+
+
+def test_reports_match_per_village_queries(db_path):
+    reports = list(economy_report.iter_village_reports())
+    assert [r['village'] for r in reports] == ['Dharwad', 'Gadag', 'Hubballi']
+
+    for report in reports:
+        village = report['village']
+        foods = ve.get_cheapest_foods_this_month(village)
+        assert [f['ingredient_name'] for f in report['cheapest_foods']] == list(foods['ingredient_name'].head(5))
+        assert [f['avg_price'] for f in report['cheapest_foods']] == foods['avg_price'].head(5).tolist()
+
+        crops = ve.get_best_local_crops(village)
+        assert [c['crop_name'] for c in report['local_crops']] == list(crops['crop_name'].head(3))
+
+        expected = ve.get_cost_effective_recommendations(village)
+        assert [(r['type'], r['food']) for r in report['recommendations']] == \
+            [(r['type'], r['food']) for r in expected]
+
+        score = ve.calculate_nutrition_economy_score(village)
+        if score is None:
+            assert report['economy_score'] is None
+        else:
+            assert report['economy_score']['score'] == score['score']
+            assert report['economy_score']['total_families_tracked'] == score['total_families_tracked']
+            assert len(report['spending_trend']) == len(ve.get_junk_food_spending(village))
+
+
+def test_streams_parse(db_path):
+    reports = list(economy_report.iter_village_reports())
+
+    body = ''.join(economy_report.stream_json(iter(reports)))
+    assert [r['village'] for r in json.loads(body)] == ['Dharwad', 'Gadag', 'Hubballi']
+
+    rows = list(csv.DictReader(io.StringIO(''.join(economy_report.stream_csv(iter(reports))))))
+    assert [r['village'] for r in rows] == ['Dharwad', 'Gadag', 'Hubballi']
+    assert rows[0]['cheapest_foods'] == 'Rice (30.00/kg)'
+    assert rows[1]['economy_score'] == ''
+
+
+def test_report_route(db_path):
+    app = Flask(__name__)
+    economy_report.register_economy_report_routes(app)
+    client = app.test_client()
+
+    response = client.get('/api/village-economy/report')
+    assert response.status_code == 200
+    assert len(response.get_json()) == 3
+
+    response = client.get('/api/village-economy/report?format=csv')
+    assert response.mimetype == 'text/csv'
+    assert response.get_data(as_text=True).startswith(','.join(economy_report.CSV_COLUMNS))
+
+    assert client.get('/api/village-economy/report?format=xml').status_code == 400
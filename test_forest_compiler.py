@@ -0,0 +1,115 @@
+"""Parity tests: compiled forest vs sklearn RandomForestClassifier probabilities"""
+
+import os
+import pickle
+import warnings
+
+import numpy as np
+import pytest
+from sklearn.ensemble import RandomForestClassifier
+
+from forest_compiler import (CompiledForest, compile_forest, compiled_path_for,
+                             load_or_compile)
+
+
+def _train_forest(n_classes=3, seed=0):
+    rng = np.random.RandomState(seed)
+    X = rng.normal(size=(600, 5)) * [20, 4, 15, 2, 3] + [30, 12, 90, 14, 15]
+    y = (X[:, 1] + rng.normal(size=600)).argsort().argsort() * n_classes // 600
+    model = RandomForestClassifier(n_estimators=40, max_depth=15, min_samples_leaf=4,
+                                   random_state=seed, class_weight='balanced')
+    model.fit(X, y)
+    return model, X
+
+
+def test_probabilities_match_sklearn():
+    model, X = _train_forest()
+    compiled = compile_forest(model)
+
+    np.testing.assert_allclose(compiled.predict_proba(X), model.predict_proba(X), atol=1e-12)
+    np.testing.assert_array_equal(compiled.predict(X), model.predict(X))
+
+
+def test_single_row_matches_sklearn():
+    model, X = _train_forest(n_classes=2, seed=7)
+    compiled = compile_forest(model)
+
+    for row in X[:25]:
+        np.testing.assert_allclose(compiled.predict_proba(row.reshape(1, -1)),
+                                   model.predict_proba(row.reshape(1, -1)), atol=1e-12)
+
+
+def test_save_and_load_roundtrip(tmp_path):
+    model, X = _train_forest()
+    model_file = tmp_path / 'trained_model.pkl'
+    with open(model_file, 'wb') as f:
+        pickle.dump(model, f)
+
+    compiled, sklearn_model = load_or_compile(str(model_file))
+    assert sklearn_model is not None
+    assert os.path.exists(compiled_path_for(str(model_file)))
+
+    reloaded, sklearn_model = load_or_compile(str(model_file))
+    assert sklearn_model is None
+    np.testing.assert_allclose(reloaded.predict_proba(X), compiled.predict_proba(X))
+
+
+def test_resave_swaps_versions_atomically(tmp_path):
+    model, X = _train_forest()
+    path = str(tmp_path / 'trained_model.forest')
+    compiled = compile_forest(model)
+
+    # A directory left by an older, non-versioned save is replaced
+    os.makedirs(path)
+    compiled.save(path)
+    mapped = CompiledForest.load(path)
+    for _ in range(3):
+        compiled.save(path)
+
+    assert os.path.islink(path)
+    versions = [entry for entry in os.listdir(tmp_path) if entry.startswith('trained_model.forest.v')]
+    assert len(versions) == 2 and os.path.basename(os.path.realpath(path)) in versions
+    np.testing.assert_allclose(CompiledForest.load(path).predict_proba(X), model.predict_proba(X))
+    # A forest mapped before the swaps stays readable
+    np.testing.assert_allclose(mapped.predict_proba(X), model.predict_proba(X))
+
+
+def test_rejects_wrong_feature_count():
+    model, X = _train_forest()
+    compiled = compile_forest(model)
+    with pytest.raises(ValueError):
+        compiled.predict_proba(X[:, :3])
+
+
+@pytest.mark.parametrize('name', ['stunting_model', 'underweight_model', 'wasting_model'])
+def test_shipped_condition_models(name):
+    model_file = os.path.join('models', 'malnutrition', f'{name}.pkl')
+    if not os.path.exists(model_file):
+        pytest.skip(f"{model_file} not available")
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore')
+        with open(model_file, 'rb') as f:
+            model = pickle.load(f)
+
+    X = np.random.RandomState(1).normal(size=(200, model.n_features_in_)) * 10
+    compiled = compile_forest(model)
+    assert isinstance(compiled, CompiledForest)
+    np.testing.assert_allclose(compiled.predict_proba(X), model.predict_proba(X), atol=1e-12)
+
+
+def test_lazy_forest_maps_on_first_use(tmp_path):
+    from model_loader import get_lazy_forest
+
+    model, X = _train_forest()
+    model_file = tmp_path / 'trained_model.pkl'
+    with open(model_file, 'wb') as f:
+        pickle.dump(model, f)
+
+    lazy = get_lazy_forest(str(model_file))
+    assert get_lazy_forest(str(model_file)) is lazy
+    assert not lazy.is_loaded
+
+    forest = lazy.get()
+    assert isinstance(forest.value, np.memmap)
+    assert lazy.stats()['loaded'] and lazy.stats()['mapped_bytes'] == forest.nbytes
+    np.testing.assert_allclose(forest.predict_proba(X), model.predict_proba(X), atol=1e-12)
@@ -0,0 +1,82 @@
+"""Shared HTTP client: retries with backoff, rate limiting, concurrent fan-out"""
+
+import threading
+import time
+
+import pytest
+import requests
+
+from http_client import HTTPClient, RateLimiter
+
+
+class FakeResponse:
+    def __init__(self, status_code, headers=None):
+        self.status_code = status_code
+        self.headers = headers or {}
+
+
+@pytest.fixture
+def client():
+    return HTTPClient(rate=0, backoff=0, max_retries=3)
+
+
+def test_retries_on_429_and_5xx(client, monkeypatch):
+    statuses = iter([429, 503, 200])
+    monkeypatch.setattr(client.session, 'get', lambda url, **kwargs: FakeResponse(next(statuses)))
+
+    assert client.get('https://api.example/resource').status_code == 200
+    assert client.get_stats() == {'requests': 3, 'retries': 2, 'failures': 0}
+
+
+def test_gives_up_after_max_retries(client, monkeypatch):
+    monkeypatch.setattr(client.session, 'get', lambda url, **kwargs: FakeResponse(500))
+    assert client.get('https://api.example/resource').status_code == 500
+    assert client.get_stats()['failures'] == 1
+
+    def offline(url, **kwargs):
+        raise requests.exceptions.ConnectionError('offline')
+
+    monkeypatch.setattr(client.session, 'get', offline)
+    with pytest.raises(requests.exceptions.ConnectionError):
+        client.get('https://api.example/resource')
+
+
+def test_client_errors_are_not_retried(client, monkeypatch):
+    monkeypatch.setattr(client.session, 'get', lambda url, **kwargs: FakeResponse(404))
+    assert client.get('https://api.example/resource').status_code == 404
+    assert client.get_stats()['requests'] == 1
+
+
+def test_zero_retries_still_makes_one_attempt(monkeypatch):
+    client = HTTPClient(rate=0, backoff=0, max_retries=0)
+    monkeypatch.setattr(client.session, 'get', lambda url, **kwargs: FakeResponse(503))
+    assert client.get('https://api.example/resource').status_code == 503
+    assert client.get_stats() == {'requests': 1, 'retries': 0, 'failures': 1}
+
+
+def test_rate_limiter_spaces_requests_per_host():
+    limiter = RateLimiter(rate=50)
+    start = time.monotonic()
+    for _ in range(5):
+        limiter.wait('a.example')
+    limiter.wait('b.example')  # other hosts have their own slots
+    assert time.monotonic() - start >= 4 / 50 - 0.005
+
+
+def test_map_runs_fetches_concurrently(client):
+    active, peak = [0], [0]
+    lock = threading.Lock()
+
+    def slow(item):
+        with lock:
+            active[0] += 1
+            peak[0] = max(peak[0], active[0])
+        time.sleep(0.05)
+        with lock:
+            active[0] -= 1
+        return item * 2
+
+    start = time.monotonic()
+    assert client.map(slow, range(8)) == [i * 2 for i in range(8)]
+    assert time.monotonic() - start < 0.3
+    assert peak[0] > 1
@@ -0,0 +1,110 @@
+"""IngredientPlanIndex: inverted ingredient -> meal plan index and acceptance"""
+
+import json
+import sqlite3
+
+import numpy as np
+import pytest
+
+from ingredient_index import IngredientPlanIndex, plan_ingredient_names
+
+NAMES = ['rice', 'dal', 'egg', 'milk', 'spinach', 'banana', 'ragi']
+
+
+def _plans(n=300, seed=0):
+    rng = np.random.RandomState(seed)
+    plans = []
+    for plan_id in range(1, n + 1):
+        names = list(rng.choice(NAMES, size=rng.randint(0, 5), replace=False))
+        ingredients = {name: float(rng.randint(50, 300)) for name in names}
+        plans.append((plan_id, int(rng.randint(1, 40)), json.dumps(ingredients),
+                      float(rng.uniform(30, 100))))
+    return plans
+
+
+def _make_db(path, plans):
+    conn = sqlite3.connect(path)
+    conn.execute("""CREATE TABLE meal_plans (id INTEGER PRIMARY KEY, child_id INTEGER,
+                    ingredients TEXT, nutrition_score REAL)""")
+    conn.executemany("INSERT INTO meal_plans VALUES (?, ?, ?, ?)", plans)
+    conn.commit()
+    return conn
+
+
+def _reference(plans, neighbors, ingredient):
+    """Per-plan loop of the original predict_ingredient_acceptance"""
+    accepted = total = 0
+    for child_id, similarity in neighbors:
+        for _, plan_child, ingredients, score in plans:
+            if plan_child != child_id or score < 60 or not ingredients:
+                continue
+            total += 1
+            if ingredient in json.loads(ingredients):
+                accepted += similarity
+    return 0.5 if total == 0 else min(1.0, max(0.0, accepted / total))
+
+
+@pytest.fixture
+def plans():
+    return _plans()
+
+
+def test_acceptance_matches_per_plan_loop(tmp_path, plans):
+    index = IngredientPlanIndex().build(_make_db(str(tmp_path / 'p.db'), plans))
+    neighbors = [(3, 0.9), (7, 0.8), (12, 0.4), (99, 0.7)]
+    ingredients = NAMES + ['unknown']
+
+    result = index.acceptance(neighbors, ingredients)
+    expected = [_reference(plans, neighbors, name) for name in ingredients]
+    np.testing.assert_allclose(result, expected)
+    assert list(index.acceptance([], ingredients)) == [0.5] * len(ingredients)
+
+
+def test_added_plans_are_visible_before_and_after_merge(tmp_path, plans):
+    base, extra = plans[:200], plans[200:]
+    index = IngredientPlanIndex(merge_threshold=40).build(_make_db(str(tmp_path / 'p.db'), base))
+    neighbors = [(5, 1.0), (9, 0.6), (21, 0.3)]
+
+    for i, plan in enumerate(extra):
+        index.add_plan(*plan)
+        if i in (10, 39, 99):
+            result = index.acceptance(neighbors, NAMES)
+            expected = [_reference(base + extra[:i + 1], neighbors, name) for name in NAMES]
+            np.testing.assert_allclose(result, expected)
+    assert len(index) == len(plans)
+
+
+def test_new_ingredient_and_postings(tmp_path, plans):
+    index = IngredientPlanIndex().build(_make_db(str(tmp_path / 'p.db'), plans))
+    index.add_plan(1000, 3, ['moringa'], 80)
+    assert index.acceptance([(3, 1.0)], ['moringa'])[0] > 0
+    assert index.plans_with('moringa') == [(3, 1000, 80.0)]
+
+    egg_plans = {plan_id for plan_id, _, ingredients, _ in plans if 'egg' in json.loads(ingredients)}
+    assert {plan_id for _, plan_id, _ in index.plans_with('egg')} == egg_plans
+
+
+def test_plan_ingredient_names():
+    assert plan_ingredient_names('{"rice": 100, "dal": 50}') == ['rice', 'dal']
+    assert plan_ingredient_names('["rice", "egg"]') == ['rice', 'egg']
+    assert plan_ingredient_names('not json') == []
+    assert plan_ingredient_names(None) == []
+
+
+def test_child_ingredient_matrix(tmp_path, plans):
+    import pandas as pd
+
+    index = IngredientPlanIndex().build(_make_db(str(tmp_path / 'p.db'), plans[:250]))
+    for plan in plans[250:]:
+        index.add_plan(*plan)
+    rated = pd.Series({plans[0][0]: 0.2, plans[1][0]: 1.0})
+    child_ids, matrix, names = index.child_ingredient_matrix(rated)
+
+    expected = np.zeros((len(child_ids), len(names)))
+    rows = {child_id: row for row, child_id in enumerate(child_ids)}
+    for plan_id, child_id, ingredients, score in plans:
+        weight = rated.get(plan_id, score / 100)
+        for name in json.loads(ingredients):
+            expected[rows[child_id], names.index(name)] += weight
+    np.testing.assert_allclose(matrix.toarray(), expected)
+    assert len(index._pending) == 0
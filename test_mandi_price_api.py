@@ -0,0 +1,187 @@
+"""Mandi price sync: paged state fetch, commodity index and bulk ingredient update"""
+
+import sqlite3
+
+import pytest
+
+import mandi_price_api
+from http_client import HTTPClient
+from price_cache import PriceCache
+from price_series import PriceSeriesStore
+from mandi_price_api import MandiPriceAPI, build_commodity_index
+
+
+def record(commodity, market, modal, arrival_date='01/10/2026'):
+    return {'commodity': commodity, 'state': 'Karnataka', 'district': 'Dharwad',
+            'market': market, 'variety': 'Other', 'min_price': modal - 100,
+            'max_price': modal + 100, 'modal_price': modal, 'arrival_date': arrival_date}
+
+
+RECORDS = [
+    record('Rice', 'Hubli (Amaragol)', 3500),
+    record('Rice', 'Dharwad', 3400),
+    record('Onion', 'Bangalore', 1800),
+    record('onion', 'Bangalore', 2000, '05/10/2026'),
+    record('Tomato', 'Mysore', 2500),
+]
+
+
+class FakeResponse:
+    status_code = 200
+    text = ''
+
+    def __init__(self, payload):
+        self.payload = payload
+
+    def json(self):
+        return self.payload
+
+
+@pytest.fixture
+def api(tmp_path):
+    api = MandiPriceAPI.__new__(MandiPriceAPI)
+    api.api_key = 'test-key'
+    api.db_path = str(tmp_path / 'prices.db')
+    api.http = HTTPClient(rate=0, backoff=0)
+    api.cache = PriceCache(api.db_path)
+    api.series = PriceSeriesStore(api.db_path)
+    api._ensure_price_table()
+    conn = sqlite3.connect(api.db_path)
+    conn.execute("CREATE TABLE ingredients (id INTEGER PRIMARY KEY, name TEXT, cost_per_kg REAL)")
+    conn.executemany("INSERT INTO ingredients (name, cost_per_kg) VALUES (?, ?)",
+                     [('Rice', 10.0), ('Onion', 10.0), ('Wheat', 10.0)])
+    conn.commit()
+    conn.close()
+    return api
+
+
+@pytest.fixture
+def paged(api, monkeypatch):
+    calls = []
+
+    def fake_get(url, params=None, timeout=None):
+        calls.append(params)
+        offset, limit = params['offset'], params['limit']
+        return FakeResponse({'total': len(RECORDS), 'records': RECORDS[offset:offset + limit]})
+
+    monkeypatch.setattr(api.http.session, 'get', fake_get)
+    return calls
+
+
+def test_build_commodity_index_keeps_latest_record():
+    index = build_commodity_index(RECORDS)
+    assert set(index) == {'rice', 'onion', 'tomato'}
+    assert set(index['rice']) == {'hubli (amaragol)', 'dharwad'}
+    assert index['onion']['bangalore']['modal_price'] == 2000
+
+
+def test_fetch_state_prices_pages_until_total(api, paged):
+    records = api.fetch_state_prices(page_size=2)
+    assert records == RECORDS
+    assert [params['offset'] for params in paged] == [0, 2, 4]
+    assert all(params['filters[state]'] == 'Karnataka' for params in paged)
+
+    conn = sqlite3.connect(api.db_path)
+    assert conn.execute("SELECT COUNT(*) FROM mandi_prices").fetchone()[0] == len(RECORDS)
+    conn.close()
+
+
+def test_update_all_ingredient_prices_one_fetch(api, paged, monkeypatch):
+    monkeypatch.setattr(MandiPriceAPI, 'INGREDIENT_TO_COMMODITY',
+                        {'Rice': 'Rice', 'Onion': 'Onion', 'Wheat': 'Wheat'})
+
+    summary = api.update_all_ingredient_prices(market='Hubli')
+    assert len(paged) == 1
+    assert summary['updated_count'] == 2
+    assert summary['failed_ingredients'] == ['Wheat']
+
+    prices = {item['ingredient']: item for item in summary['updated_ingredients']}
+    # Market substring match, else the only / latest record
+    assert prices['Rice']['market'] == 'Hubli (Amaragol)'
+    assert prices['Rice']['new_price'] == 35.0
+    assert prices['Onion']['new_price'] == 20.0
+
+    conn = sqlite3.connect(api.db_path)
+    costs = dict(conn.execute("SELECT name, cost_per_kg FROM ingredients").fetchall())
+    history = conn.execute("SELECT COUNT(*) FROM ingredient_price_history").fetchone()[0]
+    conn.close()
+    assert costs == {'Rice': 35.0, 'Onion': 20.0, 'Wheat': 10.0}
+    assert history == 2
+
+    trends = api.get_price_trends('Onion', days=3650)
+    assert [(t['market'], t['date'], t['price_per_kg']) for t in trends] == [
+        ('Bangalore', '2026-10-05', 20.0)]
+
+
+def test_update_without_api_key_writes_nothing(api, monkeypatch):
+    monkeypatch.setattr(MandiPriceAPI, 'INGREDIENT_TO_COMMODITY', {'Rice': 'Rice', 'Onion': 'Onion'})
+    api.api_key = None
+
+    summary = api.update_all_ingredient_prices(market='Hubli')
+    assert summary['source'] == 'sample'
+    assert summary['updated_count'] == 0
+
+    conn = sqlite3.connect(api.db_path)
+    costs = dict(conn.execute("SELECT name, cost_per_kg FROM ingredients").fetchall())
+    history = conn.execute("SELECT COUNT(*) FROM ingredient_price_history").fetchone()[0]
+    conn.close()
+    assert costs == {'Rice': 10.0, 'Onion': 10.0, 'Wheat': 10.0}
+    assert history == 0
+
+
+def test_fetch_state_prices_falls_back_to_cache(api, paged, monkeypatch):
+    api.fetch_state_prices()
+
+    def failing_get(url, params=None, timeout=None):
+        raise mandi_price_api.requests.exceptions.ConnectionError('offline')
+
+    monkeypatch.setattr(api.http.session, 'get', failing_get)
+    cached = api.fetch_state_prices()
+    assert len(cached) == len(RECORDS)
+
+
+def test_compare_prices_fetches_each_commodity_once(api, monkeypatch):
+    calls = []
+
+    def fake_get(url, params=None, timeout=None):
+        calls.append(params['filters[commodity]'])
+        return FakeResponse({'records': [r for r in RECORDS
+                                         if r['commodity'] == params['filters[commodity]']]})
+
+    monkeypatch.setattr(api.http.session, 'get', fake_get)
+    monkeypatch.setattr(MandiPriceAPI, 'INGREDIENT_TO_COMMODITY',
+                        {'Rice': 'Rice', 'Basmati Rice': 'Rice', 'Tomato': 'Tomato'})
+
+    comparison = api.compare_prices_across_markets(['Rice', 'Basmati Rice', 'Tomato', 'Unknown'])
+    assert sorted(calls) == ['Rice', 'Tomato']
+    assert set(comparison) == {'Rice', 'Basmati Rice', 'Tomato'}
+    assert comparison['Rice']['cheapest_market']['market'] == 'Dharwad'
+    assert comparison['Rice']['price_range'] == {'min': 34.0, 'max': 35.0}
+
+
+def test_state_sync_warms_price_cache(api, paged, monkeypatch):
+    api.fetch_state_prices()
+    fetches = len(paged)
+
+    onion = api.fetch_mandi_prices(commodity='Onion', limit=10)
+    assert len(paged) == fetches
+    assert {r['modal_price'] for r in onion} == {1800, 2000}
+    assert api.cache.get_stats()['lru_hits'] == 1
+
+
+def test_partial_state_sync_does_not_warm_price_cache(api, monkeypatch):
+    def failing_second_page(url, params=None, timeout=None):
+        if params['offset']:
+            raise mandi_price_api.requests.exceptions.ConnectionError('dropped')
+        return FakeResponse({'total': len(RECORDS), 'records': RECORDS[:2]})
+
+    monkeypatch.setattr(api.http.session, 'get', failing_second_page)
+    assert len(api.fetch_state_prices(page_size=2)) == 2
+    assert api.cache.get_stats()['lru_entries'] == 0
+
+    # Hitting MAX_PAGES is not a complete list either
+    monkeypatch.setattr(api.http.session, 'get', lambda url, params=None, timeout=None: FakeResponse(
+        {'total': len(RECORDS), 'records': RECORDS[params['offset']:params['offset'] + params['limit']]}))
+    monkeypatch.setattr(mandi_price_api, 'MAX_PAGES', 1)
+    api.fetch_state_prices(page_size=2)
+    assert api.cache.get_stats()['lru_entries'] == 0
@@ -0,0 +1,311 @@
+"""MealRecommendationSystem: set-based child features vs per-child profiles"""
+
+import json
+import sqlite3
+
+import numpy as np
+import pytest
+
+from ml_recommender import CHILD_FEATURE_COLUMNS, MealRecommendationSystem
+
+
+def _make_db(path, n_children=30, seed=0):
+    rng = np.random.RandomState(seed)
+    conn = sqlite3.connect(path)
+    conn.executescript("""
+        CREATE TABLE children (id INTEGER PRIMARY KEY, name TEXT, date_of_birth DATE,
+                               gender TEXT, village TEXT, health_notes TEXT);
+        CREATE TABLE growth_tracking (id INTEGER PRIMARY KEY, child_id INTEGER,
+                                      measurement_date DATE, weight_kg REAL, height_cm REAL, bmi REAL);
+        CREATE TABLE meal_plans (id INTEGER PRIMARY KEY, child_id INTEGER, ingredients TEXT,
+                                 total_cost REAL, nutrition_score REAL, created_at TIMESTAMP);
+        CREATE TABLE ingredients (id INTEGER PRIMARY KEY, name TEXT, category TEXT,
+                                  cost_per_kg REAL, protein_per_100g REAL, carbs_per_100g REAL,
+                                  fat_per_100g REAL, calories_per_100g REAL, fiber_per_100g REAL,
+                                  iron_per_100g REAL, calcium_per_100g REAL);
+    """)
+    for child_id in range(1, n_children + 1):
+        conn.execute("INSERT INTO children VALUES (?, ?, ?, ?, ?, ?)", (
+            child_id, f"child{child_id}", f"20{rng.randint(19, 24)}-0{rng.randint(1, 9)}-1{rng.randint(0, 9)}",
+            rng.choice(['M', 'F']), rng.choice(['A', 'B', None]),
+            rng.choice([None, '', 'anemia'])))
+        for m in range(rng.randint(0, 8)):
+            conn.execute("INSERT INTO growth_tracking (child_id, measurement_date, weight_kg, height_cm) "
+                         "VALUES (?, ?, ?, ?)",
+                         (child_id, f"2024-{m % 12 + 1:02d}-{rng.randint(10, 28)}",
+                          float(rng.uniform(6, 20)), float(rng.uniform(60, 110))))
+    for plan_id in range(25):
+        conn.execute("INSERT INTO meal_plans (child_id, total_cost, nutrition_score, created_at) "
+                     "VALUES (?, ?, ?, ?)",
+                     (rng.randint(1, n_children + 1), float(rng.uniform(20, 80)),
+                      float(rng.uniform(40, 95)), f"2024-05-{plan_id + 1:02d}"))
+    conn.commit()
+    conn.close()
+
+
+@pytest.fixture
+def recommender(tmp_path):
+    db_path = str(tmp_path / 'rec.db')
+    _make_db(db_path)
+    return MealRecommendationSystem(db_path=db_path)
+
+
+def test_bulk_features_match_per_child_profiles(recommender):
+    features = recommender.load_child_features()
+    assert list(features.columns) == CHILD_FEATURE_COLUMNS
+    assert len(features) == 30
+
+    for child_id in features.index:
+        profile = recommender.prepare_child_profile(int(child_id))
+        expected = [profile['age_years'], profile['weight_kg'], profile['height_cm'],
+                    profile['gender'], profile['has_health_conditions'], profile['avg_meal_cost'],
+                    profile['avg_nutrition_score'], profile['weight_trend'], profile['height_trend']]
+        np.testing.assert_allclose(features.loc[child_id].values, expected, rtol=1e-9, atol=1e-9)
+
+
+def test_build_child_feature_matrix_is_scaled(recommender):
+    profiles = recommender.build_child_feature_matrix()
+    assert profiles.shape == (30, len(CHILD_FEATURE_COLUMNS))
+    np.testing.assert_allclose(profiles[['age', 'weight', 'height']].mean().values, 0, atol=1e-9)
+
+
+def test_artifacts_roundtrip_and_watermark(recommender, tmp_path):
+    from recommender_store import RecommenderArtifactStore, RecommenderService
+
+    store = RecommenderArtifactStore(str(tmp_path / 'artifacts'))
+    service = RecommenderService(db_path=recommender.db_path, store=store, watch=False)
+    assert not service.get().is_trained and service.is_stale()
+
+    assert service.retrain()
+    trained = service.get()
+    assert trained.is_trained and not service.is_stale()
+    # Scalers are per matrix: the child scaler still has the child feature width
+    assert trained.child_scaler.n_features_in_ == len(CHILD_FEATURE_COLUMNS)
+    assert trained.ingredient_scaler is not trained.child_scaler
+
+    # A fresh process loads the stored artifacts instead of training
+    restarted = RecommenderService(db_path=recommender.db_path, store=store, watch=False)
+    assert restarted.load()
+    np.testing.assert_allclose(restarted.get().child_profiles.values, trained.child_profiles.values)
+    assert restarted.get().watermark == trained.watermark
+
+    conn = sqlite3.connect(recommender.db_path)
+    conn.execute("INSERT INTO growth_tracking (child_id, measurement_date, weight_kg, height_cm) "
+                 "VALUES (1, '2025-01-01', 12.0, 88.0)")
+    conn.commit()
+    conn.close()
+    assert restarted.is_stale()
+
+
+def test_incremental_update_matches_full_rebuild(recommender):
+    recommender.train_all_models()
+    conn = sqlite3.connect(recommender.db_path)
+    conn.execute("INSERT INTO growth_tracking (child_id, measurement_date, weight_kg, height_cm) "
+                 "VALUES (3, '2025-02-01', 14.0, 95.0)")
+    conn.commit()
+    conn.close()
+
+    assert recommender.update_child_features([3]) == 1
+    assert recommender.index_dirty == 1
+
+    fresh = MealRecommendationSystem(db_path=recommender.db_path)
+    fresh.build_child_feature_matrix()
+    np.testing.assert_allclose(recommender.child_features.loc[3].values,
+                               fresh.child_features.loc[3].values)
+    np.testing.assert_allclose(recommender.child_scaler.mean_, fresh.child_scaler.mean_)
+    np.testing.assert_allclose(recommender.child_scaler.scale_, fresh.child_scaler.scale_, rtol=1e-6)
+
+    recommender.refresh_index()
+    assert recommender.index_dirty == 0
+    np.testing.assert_allclose(recommender.child_profiles.values, fresh.child_profiles.values, atol=1e-6)
+
+
+def test_service_catches_up_without_retraining(recommender, tmp_path):
+    from recommender_store import RecommenderArtifactStore, RecommenderService
+
+    service = RecommenderService(db_path=recommender.db_path,
+                                 store=RecommenderArtifactStore(str(tmp_path / 'artifacts')), watch=False)
+    assert service.retrain()
+    trained_at = service.get().trained_at
+
+    conn = sqlite3.connect(recommender.db_path)
+    conn.execute("INSERT INTO growth_tracking (child_id, measurement_date, weight_kg, height_cm) "
+                 "VALUES (5, '2025-03-01', 13.0, 90.0)")
+    conn.commit()
+    conn.close()
+
+    service.check()
+    assert service.get().trained_at == trained_at
+    assert not service.is_stale()
+    assert service.get().index_dirty == 0
+
+
+def test_incremental_update_publishes_a_copy(recommender, tmp_path):
+    from recommender_store import RecommenderArtifactStore, RecommenderService
+
+    service = RecommenderService(db_path=recommender.db_path,
+                                 store=RecommenderArtifactStore(str(tmp_path / 'artifacts')), watch=False)
+    assert service.retrain()
+    live = service.get()
+    features, profiles = live.child_features.copy(), live.child_profiles.copy()
+    scaler_mean = live.child_scaler.mean_.copy()
+
+    conn = sqlite3.connect(recommender.db_path)
+    conn.execute("INSERT INTO growth_tracking (child_id, measurement_date, weight_kg, height_cm) "
+                 "VALUES (7, '2025-04-01', 30.0, 120.0)")
+    conn.commit()
+    conn.close()
+    service._update_children([7])
+
+    # Readers holding the old instance never see a half-applied update
+    assert service.get() is not live
+    assert service.get().child_features.loc[7, 'weight'] == 30.0
+    assert live.child_features.equals(features) and live.child_profiles.equals(profiles)
+    np.testing.assert_array_equal(live.child_scaler.mean_, scaler_mean)
+
+    # A retrain that lands during the update wins over it
+    retrained = service.get().clone()
+
+    def update(clone):
+        clone.update_child_features([7])
+        service._recommender = retrained
+
+    assert not service._publish(update)
+    assert service.get() is retrained
+
+
+def _add_ingredients(db_path, n=40, seed=1):
+    rng = np.random.RandomState(seed)
+    conn = sqlite3.connect(db_path)
+    for i in range(n):
+        conn.execute("INSERT INTO ingredients (name, category, cost_per_kg, protein_per_100g, "
+                     "carbs_per_100g, fat_per_100g, calories_per_100g, fiber_per_100g, "
+                     "iron_per_100g, calcium_per_100g) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                     (f"ing{i}", rng.choice(['grain', 'pulse', 'veg']), *rng.uniform(0, 100, size=8)))
+    conn.commit()
+    conn.close()
+
+
+def _loop_content_scores(recommender, priorities):
+    """Per-ingredient scoring loop the matrix product replaces"""
+    scores = []
+    for _, ing in recommender.ingredient_features.iterrows():
+        score = 0
+        if priorities['protein'] == 'high':
+            score += ing['protein_per_100g'] * 2
+        if priorities['iron'] == 'high':
+            score += ing['iron_per_100g'] * 3
+        if priorities['calcium'] == 'high':
+            score += ing['calcium_per_100g'] * 2
+        if priorities['calories'] == 'high':
+            score += ing['calories_per_100g'] * 0.1
+        elif priorities['calories'] == 'low':
+            score -= ing['calories_per_100g'] * 0.05
+        score -= ing['cost_per_kg'] * 0.1
+        scores.append((ing['name'], score))
+    return sorted(scores, key=lambda x: x[1], reverse=True)
+
+
+def test_vectorized_content_scores_match_loop(recommender):
+    _add_ingredients(recommender.db_path)
+    recommender.train_all_models()
+
+    batch = recommender.get_content_based_recommendations_batch(recommender.child_features.index, top_n=7)
+    assert len(batch) == 30
+    for child_id in (1, 2, 11, 30):
+        profile = recommender.prepare_child_profile(child_id)
+        expected = _loop_content_scores(recommender, recommender._determine_nutritional_priorities(profile))[:7]
+        result = recommender.get_content_based_recommendations(child_id, top_n=7)
+        assert [name for name, _ in result] == [name for name, _ in expected]
+        np.testing.assert_allclose([s for _, s in result], [s for _, s in expected])
+        assert [name for name, _ in batch[child_id]] == [name for name, _ in expected]
+
+
+def test_priority_levels_rules():
+    from ml_recommender import priority_levels
+    import pandas as pd
+
+    features = pd.DataFrame({
+        'age': [1.0, 3.0, 6.0, 6.0, 6.0],
+        'weight': [9.0, 14.0, 15.0, 30.0, 30.0],
+        'height': [75.0, 95.0, 110.0, 110.0, 110.0],
+        'weight_trend': [0.0, 0.0, 0.0, -1.0, 0.0],
+        'health_conditions': [0, 0, 0, 0, 1],
+    })
+    levels = priority_levels(features)
+    assert levels.loc[0].to_dict() == {'protein': 'high', 'iron': 'medium', 'calcium': 'high', 'calories': 'high'}
+    assert levels.loc[1].to_dict() == {'protein': 'high', 'iron': 'high', 'calcium': 'high', 'calories': 'medium'}
+    assert levels.loc[2, 'calories'] == 'high'  # BMI 12.4, underweight
+    assert levels.loc[3, 'calories'] == 'low'  # overweight overrides the weight-loss rule
+    assert levels.loc[4, 'iron'] == 'high' and levels.loc[4, 'calories'] == 'low'
+
+
+def test_svd_recommendations_from_interactions(recommender):
+    _add_ingredients(recommender.db_path, n=12)
+    rng = np.random.RandomState(3)
+    conn = sqlite3.connect(recommender.db_path)
+    conn.execute("CREATE TABLE meal_feedback (id INTEGER PRIMARY KEY, plan_id INTEGER, rating INTEGER)")
+    # Two taste groups: odd children eat ing0-ing5, even children ing6-ing11
+    for child_id in range(1, 31):
+        group = [f"ing{i}" for i in (range(6) if child_id % 2 else range(6, 12))]
+        for _ in range(4):
+            names = list(rng.choice(group, size=3, replace=False))
+            cursor = conn.execute("INSERT INTO meal_plans (child_id, ingredients, total_cost, nutrition_score, "
+                                  "created_at) VALUES (?, ?, 40, 80, '2024-06-01')",
+                                  (child_id, json.dumps({name: 100 for name in names})))
+            conn.execute("INSERT INTO meal_feedback (plan_id, rating) VALUES (?, 5)", (cursor.lastrowid,))
+    conn.commit()
+    conn.close()
+
+    recommender.train_all_models()
+    assert recommender.child_factors.shape[0] == 30
+    for child_id, group in ((1, range(6)), (2, range(6, 12))):
+        top = [name for name, _ in recommender.get_svd_recommendations(child_id, top_n=3)]
+        assert set(top) <= {f"ing{i}" for i in group}
+    assert recommender.get_svd_recommendations(999) == []
+
+
+def _loop_fallback(db_path, top_n):
+    """SQL pre-selection and per-ingredient loop of the original fallback"""
+    conn = sqlite3.connect(db_path)
+    rows = conn.execute("""
+        SELECT name, protein_per_100g, iron_per_100g, calcium_per_100g, calories_per_100g, cost_per_kg
+        FROM ingredients
+        WHERE protein_per_100g > 0 AND iron_per_100g > 0
+        ORDER BY (protein_per_100g + iron_per_100g + calcium_per_100g) DESC
+        LIMIT ?
+    """, (top_n * 2,)).fetchall()
+    conn.close()
+    scored = [(name, (protein * 2 + iron * 3 + calcium * 0.5 + calories * 0.1) / cost)
+              for name, protein, iron, calcium, calories, cost in rows]
+    return sorted(scored, key=lambda item: item[1], reverse=True)[:top_n]
+
+
+def test_fallback_ranking_matches_loop(recommender):
+    _add_ingredients(recommender.db_path)
+    # Zero calcium is a value, not a missing one: it still competes in the pre-selection
+    conn = sqlite3.connect(recommender.db_path)
+    conn.execute("INSERT INTO ingredients (name, category, cost_per_kg, protein_per_100g, calories_per_100g, "
+                 "fiber_per_100g, iron_per_100g, calcium_per_100g) VALUES ('zero-calcium', 'veg', 1, 300, 50, "
+                 "1, 300, 0)")
+    conn.commit()
+    conn.close()
+    recommendations = recommender._get_fallback_recommendations(1, top_n=8)
+    expected = _loop_fallback(recommender.db_path, 8)
+
+    assert [r['ingredient_name'] for r in recommendations] == [name for name, _ in expected]
+    assert [r['score'] for r in recommendations] == [round(score, 2) for _, score in expected]
+    assert 'zero-calcium' in [r['ingredient_name'] for r in recommendations]
+    assert {r['source'] for r in recommendations} == {'nutrition-density'}
+
+
+def test_service_without_watcher_starts_no_threads(recommender, tmp_path):
+    import threading
+    from recommender_store import RecommenderArtifactStore, RecommenderService
+
+    service = RecommenderService(db_path=recommender.db_path,
+                                 store=RecommenderArtifactStore(str(tmp_path / 'artifacts')), watch=False)
+    assert service.is_stale()
+    service.get()
+    assert not any(t.name in ('recommender-watcher', 'recommender-retrain') and t.is_alive()
+                   for t in threading.enumerate())
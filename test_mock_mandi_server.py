@@ -0,0 +1,82 @@
+"""Mock mandi server: resource endpoint semantics and MandiPriceAPI against it"""
+
+import pytest
+import requests
+
+from http_client import HTTPClient
+from mandi_price_api import MandiPriceAPI
+from mock_mandi_server import API_KEY, MockMandiServer, generate_records
+from price_cache import PriceCache
+from price_series import PriceSeriesStore
+
+
+@pytest.fixture
+def server():
+    with MockMandiServer(records=generate_records(days=2)) as server:
+        yield server
+
+
+@pytest.fixture
+def api(server, tmp_path):
+    api = MandiPriceAPI.__new__(MandiPriceAPI)
+    api.api_key = API_KEY
+    api.BASE_URL = server.url
+    api.db_path = str(tmp_path / 'prices.db')
+    api.http = HTTPClient(rate=0, backoff=0)
+    api.cache = PriceCache(api.db_path)
+    api.series = PriceSeriesStore(api.db_path)
+    api._ensure_price_table()
+    return api
+
+
+def get(server, **params):
+    params.setdefault('api-key', API_KEY)
+    return requests.get(f"{server.url}/{server.resource_id}", params=params, timeout=5)
+
+
+def test_generates_every_mandi_and_commodity():
+    records = generate_records(days=3)
+    commodities = set(MandiPriceAPI.INGREDIENT_TO_COMMODITY.values())
+    assert {r['market'] for r in records} == set(MandiPriceAPI.KARNATAKA_MANDIS)
+    assert {r['commodity'] for r in records} == commodities
+    assert len(records) == 3 * len(MandiPriceAPI.KARNATAKA_MANDIS) * len(commodities)
+    assert all(int(r['min_price']) <= int(r['modal_price']) <= int(r['max_price']) for r in records)
+
+
+def test_pagination_and_filters(server):
+    body = get(server, limit=5, offset=0, **{'filters[commodity]': 'Rice'}).json()
+    assert body['total'] == 2 * len(MandiPriceAPI.KARNATAKA_MANDIS)
+    assert body['count'] == 5
+    assert {r['commodity'] for r in body['records']} == {'Rice'}
+
+    last = get(server, limit=5, offset=body['total'] - 2, **{'filters[commodity]': 'Rice'}).json()
+    assert last['count'] == 2
+
+    hubli = get(server, limit=100, **{'filters[market]': 'hubli', 'filters[commodity]': 'Rice'}).json()
+    assert {r['market'] for r in hubli['records']} == {'Hubli'}
+
+
+def test_failure_modes(server):
+    assert get(server, **{'api-key': 'wrong'}).status_code == 403
+    server.fail_next(1, 429)
+    response = get(server)
+    assert response.status_code == 429 and response.headers['Retry-After'] == '1'
+    server.fail_next(1, 500)
+    assert get(server).status_code == 500
+    assert get(server).status_code == 200
+    assert server.get_stats()['throttled'] == 1
+
+
+def test_mandi_price_api_against_mock(api, server):
+    records = api.fetch_state_prices(page_size=100)
+    assert len(records) == len(server.records)
+
+    server.fail_next(2, 503)
+    tomato = api.fetch_mandi_prices(commodity='Tomato', limit=50)
+    assert {r['commodity'] for r in tomato} == {'Tomato'}
+    assert api.http.get_stats()['retries'] == 0  # served from the warmed cache
+
+    api.cache.clear()
+    prices = api._fetch_remote_prices('Tomato', 'Karnataka', 50)
+    assert len(prices) == 2 * len(MandiPriceAPI.KARNATAKA_MANDIS)
+    assert api.http.get_stats()['retries'] == 2
@@ -0,0 +1,147 @@
+"""Model registry: versioning, checksum verification, hot swap and shadow scoring"""
+
+import os
+import time
+
+import numpy as np
+import pytest
+from sklearn.ensemble import RandomForestClassifier
+from sklearn.preprocessing import LabelEncoder
+
+import malnutrition_predictor as mp
+import model_registry
+from model_registry import ModelRegistry, MODEL_FILE
+
+
+FEATURES = ['age_months', 'weight_kg', 'height_cm', 'muac_cm', 'bmi']
+
+
+def _train(seed=0):
+    rng = np.random.RandomState(seed)
+    X = rng.normal(size=(300, 5)) * [15, 3, 12, 1.5, 2] + [30, 12, 88, 14, 15]
+    labels = np.array(['normal', 'mild', 'moderate', 'severe'])[(X[:, 1] < 12).astype(int) +
+                                                              (X[:, 2] < 85).astype(int) * 2]
+    encoder = LabelEncoder()
+    y = encoder.fit_transform(labels)
+    model = RandomForestClassifier(n_estimators=10, max_depth=6, random_state=seed).fit(X, y)
+    return model, encoder
+
+
+@pytest.fixture
+def registry(tmp_path, monkeypatch):
+    registry = ModelRegistry(str(tmp_path / 'registry'))
+    monkeypatch.setattr(model_registry, '_registry', registry)
+    monkeypatch.setattr(mp, '_predictor_instance', None)
+    return registry
+
+
+def test_register_and_promote(registry):
+    model, encoder = _train()
+    version = registry.register(model, encoder, FEATURES, 0.91)
+
+    assert registry.get_current_version() == version
+    metadata = registry.get_metadata(version)
+    assert metadata['feature_columns'] == FEATURES
+    assert metadata['accuracy'] == pytest.approx(0.91)
+    assert metadata['compiled']
+    assert registry.verify(version)
+
+    second = registry.register(model, encoder, FEATURES, 0.5, promote=False)
+    assert second != version
+    assert registry.get_current_version() == version
+    assert [v['version'] for v in registry.list_versions()] == [version, second]
+
+
+def test_set_current_rejects_bad_versions(registry):
+    model, encoder = _train()
+    version = registry.register(model, encoder, FEATURES, 0.9, promote=False)
+
+    with pytest.raises(ValueError):
+        registry.set_current('v-missing')
+
+    with open(os.path.join(registry.version_dir(version), MODEL_FILE), 'ab') as f:
+        f.write(b'tampered')
+    with pytest.raises(ValueError):
+        registry.set_current(version)
+    assert registry.get_current_version() is None
+
+
+def test_uncompiled_versions_are_not_activated(registry):
+    model, encoder = _train()
+    current = registry.register(model, encoder, FEATURES, 0.9)
+
+    # Stand-in for a cuML forest: no sklearn tree arrays to compile
+    del model.estimators_
+    version = registry.register(model, encoder, FEATURES, 0.95)
+    assert not registry.get_metadata(version)['compiled']
+    assert registry.get_current_version() == current
+    with pytest.raises(ValueError, match='compiled forest'):
+        registry.set_current(version)
+
+
+def test_hot_swap_and_shadow(registry):
+    model, encoder = _train(seed=0)
+    v1 = registry.register(model, encoder, FEATURES, 0.9)
+    v2 = registry.register(*_train(seed=1), FEATURES, 0.92, promote=False)
+
+    predictor = mp.get_predictor()
+    assert predictor.model_version == v1 and not predictor.use_fallback
+
+    mp.set_shadow_version(v2)
+    child = {'age_months': 30, 'weight_kg': 10.0, 'height_cm': 84.0, 'gender': 'female'}
+    for _ in range(50):
+        if mp.get_shadow_stats()['status'] == 'active':
+            break
+        time.sleep(0.05)
+    mp.shadow_score(predictor.predict_from_child_data(child), child)
+    mp._shadow_executor.submit(lambda: None).result()
+    stats = mp.get_shadow_stats()
+    assert stats['version'] == v2 and stats['requests'] == 1
+    assert stats['agreement_rate'] in (0.0, 1.0)
+    mp.set_shadow_version(None)
+
+    registry.set_current(v2)
+    assert mp.swap_predictor(v2, wait=True)
+    assert mp.get_predictor(lazy=True).model_version == v2
+    assert mp.get_swap_status()['status'] == 'idle'
+
+
+def test_failed_swap_is_retried_with_backoff(registry, monkeypatch):
+    v1 = registry.register(*_train(seed=0), FEATURES, 0.9)
+    assert mp.get_predictor().model_version == v1
+    v2 = registry.register(*_train(seed=1), FEATURES, 0.92)
+
+    monkeypatch.setattr(mp, '_swap_state', dict(mp._swap_state, status='idle', target_version=None,
+                                                failures=0, next_retry=None))
+    monkeypatch.setattr(mp, '_swap_retry_at', None)
+    monkeypatch.setattr(mp, '_last_pointer_mtime', None)
+    monkeypatch.setattr(mp, 'POINTER_CHECK_INTERVAL', 0)
+    monkeypatch.setattr(mp, 'SWAP_RETRY_BASE', 0)
+    load_version = mp._load_version
+    attempts = []
+
+    def flaky_load(version):
+        attempts.append(version)
+        if len(attempts) == 1:
+            raise RuntimeError('disk busy')
+        return load_version(version)
+
+    monkeypatch.setattr(mp, '_load_version', flaky_load)
+
+    def wait_for_swap():
+        for _ in range(100):
+            if mp.get_swap_status()['status'] != 'loading':
+                break
+            time.sleep(0.02)
+        return mp.get_swap_status()
+
+    mp.get_active_predictor()
+    status = wait_for_swap()
+    assert status['status'] == 'failed' and status['failures'] == 1 and status['next_retry']
+    assert mp.get_predictor(lazy=True).model_version == v1
+
+    mp.get_active_predictor()
+    status = wait_for_swap()
+    assert attempts == [v2, v2]
+    assert status['status'] == 'idle' and status['failures'] == 0
+    assert mp.get_predictor(lazy=True).model_version == v2
@@ -0,0 +1,160 @@
+"""NutrientDensityIndex: nutrition-per-rupee rankings, filters and change-triggered rebuilds"""
+
+import sqlite3
+
+import numpy as np
+import pytest
+
+import village_economy as ve
+from nutrient_density import CATALOG, POOLED, NutrientDensityIndex, install_change_tracking
+
+INGREDIENTS = [
+    # name, category, cost_per_kg, protein, fiber, iron, calcium, calories
+    ('Rice', 'Grains', 40, 7, 1, 1, 10, 360),
+    ('Ragi', 'Grains', 45, 7, 11, 4, 344, 328),
+    ('Moong Dal', 'Pulses', 110, 24, 16, 4, 75, 347),
+    ('Milk', 'Dairy', 56, 3, 0, 0.2, 120, 67),
+    ('Spinach', 'Vegetables', 30, 2, 2, 3, 99, 23),
+    ('Egg', 'Protein', 0, 13, 0, 2, 50, 155),
+]
+
+
+@pytest.fixture
+def db_path(tmp_path, monkeypatch):
+    path = str(tmp_path / 'density.db')
+    monkeypatch.setattr(ve, 'DB_PATH', path)
+    conn = sqlite3.connect(path)
+    conn.execute("""CREATE TABLE ingredients (id INTEGER PRIMARY KEY, name TEXT UNIQUE, category TEXT,
+                    cost_per_kg REAL, protein_per_100g REAL, fiber_per_100g REAL, iron_per_100g REAL,
+                    calcium_per_100g REAL, calories_per_100g REAL)""")
+    conn.executemany("""INSERT INTO ingredients (name, category, cost_per_kg, protein_per_100g, fiber_per_100g,
+                        iron_per_100g, calcium_per_100g, calories_per_100g) VALUES (?, ?, ?, ?, ?, ?, ?, ?)""",
+                     INGREDIENTS)
+    conn.commit()
+    conn.close()
+
+    analyzer = ve.VillageEconomyAnalyzer()
+    for name, village, price in (('Rice', 'Hubli', 38), ('Ragi', 'Hubli', 50), ('Moong Dal', 'Hubli', 100),
+                                 ('Rice', 'Gadag', 42), ('Spinach', 'Gadag', 25), ('Saffron', 'Gadag', 900)):
+        analyzer.add_price_update({'ingredient_name': name, 'village': village, 'price_per_kg': price})
+    return path
+
+
+def reference_economy(db_path, village=None):
+    """nutrition_per_rupee query get_cheapest_foods_this_month used to run"""
+    conn = sqlite3.connect(db_path)
+    query = """
+        SELECT a.ingredient_name,
+               (i.protein_per_100g * 2 + i.fiber_per_100g + i.iron_per_100g)
+                   / (SUM(a.price_sum) / SUM(a.price_count)) as nutrition_per_rupee
+        FROM food_price_monthly a
+        LEFT JOIN ingredients i ON a.ingredient_name = i.name
+        WHERE a.year = ? AND a.month_num = ?
+    """
+    now = ve.datetime.now()
+    params = [now.year, now.month]
+    if village:
+        query += " AND a.village = ?"
+        params.append(village)
+    query += " GROUP BY a.ingredient_name ORDER BY nutrition_per_rupee DESC"
+    rows = conn.execute(query, params).fetchall()
+    conn.close()
+    return rows
+
+
+@pytest.mark.parametrize('village', [None, 'Hubli', 'Gadag'])
+def test_economy_ranking_matches_sql(db_path, village):
+    index = NutrientDensityIndex(db_path)
+    foods = index.top_k(20, market=village or POOLED, profile='economy')
+    expected = reference_economy(db_path, village)
+
+    assert [f['ingredient_name'] for f in foods] == [name for name, _ in expected]
+    np.testing.assert_allclose([np.nan if f['score'] is None else f['score'] for f in foods],
+                               [np.nan if score is None else score for _, score in expected])
+    assert ve.get_cheapest_foods_this_month(village)['ingredient_name'].tolist() == [n for n, _ in expected]
+
+
+def test_filters_and_alternatives(db_path):
+    index = NutrientDensityIndex(db_path)
+    grains = index.top_k(10, market=CATALOG, category='Grains')
+    assert {f['ingredient_name'] for f in grains} == {'Rice', 'Ragi'}
+    assert all(f['price'] <= 45 for f in index.top_k(10, market=CATALOG, max_price=45))
+    # Zero catalog price has no score
+    assert 'Egg' not in {f['ingredient_name'] for f in index.top_k(None, market=CATALOG)}
+    assert 'Milk' not in {f['ingredient_name']
+                          for f in index.top_k(None, market=CATALOG, require=('fiber_per_100g',))}
+
+    assert [f['ingredient_name'] for f in index.alternatives('Rice')] == ['Ragi']
+    assert index.alternatives('Rice', cheaper=True) == []
+    assert index.alternatives('Saffron') == []
+
+
+def test_cheaper_alternatives_exclude_equal_prices(db_path):
+    conn = sqlite3.connect(db_path)
+    conn.execute("UPDATE ingredients SET cost_per_kg = 45 WHERE name = 'Rice'")
+    conn.commit()
+    conn.close()
+
+    index = NutrientDensityIndex(db_path)
+    assert [f['ingredient_name'] for f in index.alternatives('Ragi')] == ['Rice']
+    assert index.alternatives('Ragi', cheaper=True) == []
+    assert [f['ingredient_name'] for f in index.top_k(10, market=CATALOG, category='Grains', max_price=45)] \
+        == ['Ragi', 'Rice']
+
+
+def test_recommender_profile(db_path):
+    index = NutrientDensityIndex(db_path)
+    foods = index.top_k(3, market=CATALOG, profile='recommender')
+    expected = sorted(((p * 2 + i * 3 + ca * 0.5 + cal * 0.1) / cost, name)
+                      for name, _, cost, p, _, i, ca, cal in INGREDIENTS if cost > 0)[::-1][:3]
+    assert [(f['score'], f['ingredient_name']) for f in foods] == pytest.approx(expected)
+
+
+def test_rebuilds_only_on_change(db_path):
+    index = NutrientDensityIndex(db_path)
+    index.top_k(5)
+    index.top_k(5, market='Hubli')
+    index.alternatives('Rice')
+    assert index.builds == 1
+
+    ve.VillageEconomyAnalyzer().add_price_update(
+        {'ingredient_name': 'Moong Dal', 'village': 'Gadag', 'price_per_kg': 20})
+    assert index.top_k(1, market='Gadag')[0]['ingredient_name'] == 'Moong Dal'
+    assert index.builds == 2
+
+    conn = sqlite3.connect(db_path)
+    conn.execute("UPDATE ingredients SET cost_per_kg = 1 WHERE name = 'Milk'")
+    conn.commit()
+    conn.close()
+    assert index.top_k(1, market=CATALOG, profile='recommender')[0]['ingredient_name'] == 'Milk'
+    assert index.builds == 3
+
+
+def test_queries_run_no_ddl_and_reuse_one_connection(tmp_path):
+    path = str(tmp_path / 'untracked.db')
+    conn = sqlite3.connect(path)
+    conn.execute("CREATE TABLE ingredients (name TEXT, category TEXT, cost_per_kg REAL, protein_per_100g REAL)")
+    conn.execute("INSERT INTO ingredients VALUES ('Rice', 'Grains', 40, 7)")
+    conn.commit()
+
+    index = NutrientDensityIndex(path)
+    index.top_k(5, market=CATALOG)
+    connection = index._connection()
+    index.top_k(5, market=CATALOG)
+    assert index._connection() is connection
+    assert conn.execute("SELECT COUNT(*) FROM sqlite_master WHERE name LIKE 'nutrient_density%'").fetchone()[0] == 0
+    # Untracked databases are rebuilt on every query rather than served stale
+    assert index.builds == 2
+
+    install_change_tracking(conn)
+    conn.close()
+    index.top_k(5, market=CATALOG)
+    index.top_k(5, market=CATALOG)
+    assert index.builds == 3
+
+
+def test_filtered_cheapest_foods_do_not_fall_back_to_samples(db_path):
+    analyzer = ve.VillageEconomyAnalyzer()
+    assert analyzer.get_cheapest_nutritious_foods(max_price=5) == []
+    assert analyzer.get_cheapest_nutritious_foods('Hubli', category='Dairy') == []
+    assert [f['ingredient_name'] for f in analyzer.get_cheapest_nutritious_foods('Gadag', max_price=30)] == ['Spinach']
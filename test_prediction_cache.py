@@ -0,0 +1,69 @@
+"""Prediction cache: LRU / child_nutrition_snapshot tiers and invalidation"""
+
+import sqlite3
+
+import pytest
+
+import database as db
+from prediction_cache import PredictionCache
+
+
+RESULT = {'nutrition_status': 'normal', 'confidence': 0.9, 'probabilities': {'normal': 0.9}}
+
+
+@pytest.fixture
+def conn(tmp_path, monkeypatch):
+    db_file = str(tmp_path / 'cache.db')
+    monkeypatch.setattr(db, 'DB_TYPE', 'sqlite')
+    monkeypatch.setattr(db, 'get_connection', lambda: sqlite3.connect(db_file))
+    conn = sqlite3.connect(db_file)
+    # Pre-existing table without the prediction columns (older databases)
+    conn.execute("""
+        CREATE TABLE child_nutrition_snapshot (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            child_id INTEGER NOT NULL UNIQUE,
+            nutrition_status TEXT,
+            last_updated TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+    yield conn
+    conn.close()
+
+
+def test_put_then_hit_lru_and_db(conn):
+    cache = PredictionCache()
+    assert cache.get(conn, 1, 10, 'v1', 24) is None
+
+    cache.put(conn, 1, 10, 'v1', 24, RESULT)
+    assert cache.get(conn, 1, 10, 'v1', 24) == RESULT
+    assert cache.get_stats()['lru_hits'] == 1
+
+    # A fresh process (empty LRU) is served from the snapshot table
+    other_worker = PredictionCache()
+    assert other_worker.get(conn, 1, 10, 'v1', 24) == RESULT
+    assert other_worker.get_stats()['db_hits'] == 1
+
+
+@pytest.mark.parametrize('key', [(11, 'v1', 24), (10, 'v2', 24), (10, 'v1', 25)])
+def test_key_change_is_a_miss(conn, key):
+    cache = PredictionCache()
+    cache.put(conn, 1, 10, 'v1', 24, RESULT)
+    assert cache.get(conn, 1, *key) is None
+
+
+def test_invalidate_clears_both_tiers(conn):
+    cache = PredictionCache()
+    cache.put(conn, 1, 10, 'v1', 24, RESULT)
+    cache.invalidate(1)
+
+    assert cache.get(conn, 1, 10, 'v1', 24) is None
+    row = conn.execute("SELECT prediction_json, nutrition_status FROM child_nutrition_snapshot "
+                       "WHERE child_id = 1").fetchone()
+    assert row == (None, 'normal')
+
+
+def test_lru_is_bounded(conn):
+    cache = PredictionCache(max_entries=2)
+    for child_id in (1, 2, 3):
+        cache.put(conn, child_id, child_id, 'v1', 24, RESULT)
+    assert cache.get_stats()['lru_entries'] == 2
@@ -0,0 +1,87 @@
+"""Mandi price cache: TTL, stale-while-revalidate, LRU / table tiers"""
+
+import threading
+
+import pytest
+
+from price_cache import PriceCache
+
+
+RECORDS = [{'commodity': 'Rice', 'market': 'Hubli', 'modal_price': 3500},
+           {'commodity': 'Rice', 'market': 'Dharwad', 'modal_price': 3400}]
+
+
+class Fetcher:
+    def __init__(self, records=RECORDS):
+        self.records = records
+        self.calls = []
+        self.done = threading.Event()
+
+    def __call__(self, limit):
+        self.calls.append(limit)
+        self.done.set()
+        return None if self.records is None else self.records[:limit]
+
+
+@pytest.fixture
+def db_path(tmp_path):
+    return str(tmp_path / 'prices.db')
+
+
+def test_fresh_entries_are_served_without_fetching(db_path):
+    cache = PriceCache(db_path, ttl=3600)
+    fetch = Fetcher()
+    assert cache.get('Karnataka', 'Rice', 50, fetch) == RECORDS
+    assert cache.get('karnataka', 'rice ', 50, fetch) == RECORDS
+    assert cache.get('Karnataka', 'Rice', 1, fetch) == RECORDS[:1]
+    assert fetch.calls == [50]
+    stats = cache.get_stats()
+    assert stats['misses'] == 1 and stats['lru_hits'] == 2
+
+
+def test_table_tier_is_shared_between_instances(db_path):
+    PriceCache(db_path).get('Karnataka', 'Rice', 50, Fetcher())
+    other = PriceCache(db_path)
+    fetch = Fetcher()
+    assert other.get('Karnataka', 'Rice', 50, fetch) == RECORDS
+    assert fetch.calls == []
+    assert other.get_stats()['db_hits'] == 1
+
+
+def test_larger_limit_refetches_unless_list_is_complete(db_path):
+    cache = PriceCache(db_path)
+    fetch = Fetcher()
+    cache.get('Karnataka', 'Rice', 1, fetch)
+    cache.get('Karnataka', 'Rice', 50, fetch)
+    # Two records came back for limit 50, so that list is complete
+    cache.get('Karnataka', 'Rice', 100, fetch)
+    assert fetch.calls == [1, 50]
+
+
+def test_stale_entries_are_served_while_refreshing(db_path):
+    cache = PriceCache(db_path, ttl=0, max_stale=3600)
+    cache.get('Karnataka', 'Rice', 50, Fetcher())
+
+    refresh = Fetcher([{'commodity': 'Rice', 'market': 'Hubli', 'modal_price': 3600}])
+    assert cache.get('Karnataka', 'Rice', 50, refresh) == RECORDS
+    assert refresh.done.wait(5)
+    cache._refresher.shutdown(wait=True)
+    assert cache.get_stats()['stale_hits'] == 1
+    assert cache.get_stats()['refreshes'] == 2
+
+
+def test_failed_fetch_falls_back_to_expired_entry(db_path):
+    cache = PriceCache(db_path, ttl=0, max_stale=0)
+    cache.get('Karnataka', 'Rice', 50, Fetcher())
+    assert cache.get('Karnataka', 'Rice', 50, Fetcher(None)) == RECORDS
+    assert cache.get('Karnataka', 'Wheat', 50, Fetcher(None)) is None
+    assert cache.get_stats()['refresh_failures'] == 2
+
+
+def test_put_many_stores_complete_lists(db_path):
+    cache = PriceCache(db_path)
+    cache.put_many('Karnataka', {'Rice': RECORDS, 'rice': [], 'Onion': []})
+    fetch = Fetcher()
+    assert cache.get('Karnataka', 'Rice', 500, fetch) == RECORDS
+    assert cache.get('Karnataka', 'Onion', 10, fetch) == []
+    assert fetch.calls == []
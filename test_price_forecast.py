@@ -0,0 +1,87 @@
+"""Price forecasting: dense cube loading, vectorized Holt-Winters, daily cache"""
+
+import time
+from datetime import date, timedelta
+
+import numpy as np
+import pytest
+
+from price_forecast import PriceForecaster, fit_holt_winters, forward_fill, load_price_cube
+from price_series import PriceSeriesStore
+
+
+AS_OF = date(2026, 6, 30)
+
+
+def seasonal_price(day_index, base):
+    return base + 0.05 * day_index + 3 * np.sin(2 * np.pi * day_index / 7)
+
+
+@pytest.fixture
+def store(tmp_path):
+    store = PriceSeriesStore(str(tmp_path / 'series.db'))
+    start = AS_OF - timedelta(days=89)
+    rows = []
+    for market, base in (('Hubli', 40), ('Gadag', 50)):
+        for i in range(90):
+            rows.append(('Rice', market, start + timedelta(days=i), seasonal_price(i, base),
+                         None, None, 'test'))
+    rows.append(('Ragi', 'Hubli', AS_OF - timedelta(days=3), 60, None, None, 'test'))
+    store.record_many(rows)
+    return store
+
+
+def test_forward_fill():
+    values = np.array([[np.nan, 1, np.nan, 3, np.nan], [2, np.nan, np.nan, np.nan, 5]])
+    assert np.array_equal(forward_fill(values), [[1, 1, 1, 3, 3], [2, 2, 2, 2, 5]])
+
+
+def test_load_price_cube(store):
+    ingredients, markets, days, cube = load_price_cube(store, AS_OF - timedelta(days=9), AS_OF)
+    assert list(ingredients) == ['Ragi', 'Rice']
+    assert list(markets) == ['Gadag', 'Hubli']
+    assert cube.shape == (2, 2, 10)
+    assert np.isnan(cube[0, 0]).all()  # no Ragi in Gadag
+    assert cube[0, 1, 6] == 60
+
+
+def test_holt_winters_recovers_trend_and_season():
+    rng = np.random.default_rng(0)
+    t = np.arange(120)
+    y = seasonal_price(t, 50) + rng.normal(0, 0.2, (200, 120))
+    forecast, sigma = fit_holt_winters(y, np.ones_like(y, dtype=bool))
+    expected = seasonal_price(np.arange(120, 127), 50)
+    assert forecast.shape == (200, 7)
+    assert np.abs(forecast - expected).mean() < 1.0
+    assert (sigma < 1.0).all()
+
+
+def test_fits_thousands_of_series_in_seconds():
+    rng = np.random.default_rng(1)
+    y = 50 + rng.normal(0, 1, (3000, 180))
+    start = time.perf_counter()
+    fit_holt_winters(y, rng.random(y.shape) > 0.2)
+    assert time.perf_counter() - start < 5
+
+
+def test_forecaster_per_market_and_daily_cache(store):
+    forecaster = PriceForecaster(store)
+    rice = forecaster.get('Rice', as_of=AS_OF)
+    assert [f['market'] for f in rice] == ['Gadag', 'Hubli']
+    hubli = rice[1]
+    assert hubli['method'] == 'holt_winters'
+    assert hubli['dates'][0] == '2026-07-01' and len(hubli['dates']) == 7
+    expected = seasonal_price(np.arange(90, 97), 40)
+    assert np.abs(np.array(hubli['price_per_kg']) - expected).max() < 1.0
+    assert all(lo <= p <= hi for lo, p, hi in zip(hubli['lower'], hubli['price_per_kg'], hubli['upper']))
+
+    ragi = forecaster.get('Ragi', market='hub', as_of=AS_OF)
+    assert ragi[0]['method'] == 'last_price'
+    assert ragi[0]['price_per_kg'] == [60.0] * 7
+    assert ragi[0]['last_observed'] == '2026-06-27'
+    assert forecaster.get('Unknown', as_of=AS_OF) == []
+
+    # Same day: served from the fitted arrays; a new price shows up the next day
+    store.record_many([('Ragi', 'Hubli', AS_OF, 70, None, None, 'test')])
+    assert forecaster.get('Ragi', as_of=AS_OF)[0]['price_per_kg'][0] == 60.0
+    assert forecaster.get('Ragi', as_of=AS_OF + timedelta(days=1))[0]['price_per_kg'][0] == 70.0
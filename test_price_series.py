@@ -0,0 +1,83 @@
+"""Price time series: observation upserts, incremental rollups, trend arrays"""
+
+import sqlite3
+from datetime import date
+
+import numpy as np
+import pytest
+
+from price_series import PriceSeriesStore, parse_price_date, period_bounds
+
+
+@pytest.fixture
+def store(tmp_path):
+    return PriceSeriesStore(str(tmp_path / 'series.db'))
+
+
+def obs(ingredient, market, price_date, price, source='test'):
+    return (ingredient, market, price_date, price, None, None, source)
+
+
+def test_period_bounds():
+    day = date(2026, 2, 18)  # a Wednesday
+    assert period_bounds(day, 'day') == (day, day)
+    assert period_bounds(day, 'week') == (date(2026, 2, 16), date(2026, 2, 22))
+    assert period_bounds(day, 'month') == (date(2026, 2, 1), date(2026, 2, 28))
+    assert parse_price_date('18/02/2026') == day
+    assert parse_price_date('2026-02-18 10:30:00') == day
+    assert parse_price_date('soon') is None
+
+
+def test_monthly_rollups_and_upserts(store):
+    store.record_many([
+        obs('Rice', 'Hubli', '2026-01-05', 30),
+        obs('Rice', 'Hubli', '20/01/2026', 40),
+        obs('Rice', 'Dharwad', '2026-01-07', 35),
+        obs('Rice', 'Hubli', '2026-02-03', 50),
+        obs('Wheat', 'Hubli', '2026-01-05', 25),
+    ])
+    series = store.trend('Rice', 'month')
+    assert series['period'].dtype == np.dtype('datetime64[D]')
+    assert list(series['period'].astype(str)) == ['2026-01-01', '2026-01-01', '2026-02-01']
+    assert list(series['market']) == ['Dharwad', 'Hubli', 'Hubli']
+    assert list(series['avg']) == [35.0, 35.0, 50.0]
+    assert list(series['observations']) == [1, 2, 1]
+
+    # Replacing an observation recomputes only its buckets, min/max included
+    store.record_many([obs('Rice', 'Hubli', '2026-01-20', 20)])
+    january = store.trend('Rice', 'month', end='2026-01-31', markets=['Hubli'])
+    assert list(january['avg']) == [25.0]
+    assert list(january['min']) == [20.0] and list(january['max']) == [30.0]
+
+
+def test_trend_range_and_matrix(store):
+    store.record_many([obs('Ragi', market, f'2026-03-{day:02d}', price)
+                       for market, price in (('Hubli', 60), ('Gadag', 55))
+                       for day in (2, 9, 16)])
+    weekly = store.trend('Ragi', 'week', start='2026-03-05')
+    assert sorted(set(weekly['period'].astype(str))) == ['2026-03-02', '2026-03-09', '2026-03-16']
+
+    periods, markets, matrix = store.trend_matrix('Ragi', 'day', start='2026-03-09')
+    assert list(markets) == ['Gadag', 'Hubli']
+    assert matrix.shape == (2, 2)
+    assert np.array_equal(matrix[:, 1], [60.0, 60.0])
+    assert store.trend('Unknown', 'day')['avg'].shape == (0,)
+    with pytest.raises(ValueError):
+        store.trend('Ragi', 'year')
+
+
+def test_backfills_existing_price_tables(tmp_path):
+    db_path = str(tmp_path / 'existing.db')
+    conn = sqlite3.connect(db_path)
+    conn.execute("""CREATE TABLE ingredient_price_history (ingredient_name TEXT, price_per_kg REAL,
+                    source TEXT, market TEXT, state TEXT, recorded_date TEXT, fetched_at TEXT)""")
+    conn.execute("INSERT INTO ingredient_price_history VALUES ('Rice', 35, 'mandi', 'Hubli', 'KA', '03/10/2026', '')")
+    conn.execute("""CREATE TABLE food_prices (ingredient_name TEXT, village TEXT, price_per_kg REAL,
+                    source TEXT, recorded_date DATE, created_at TIMESTAMP)""")
+    conn.execute("INSERT INTO food_prices VALUES ('Rice', 'Dharwad', 45, 'survey', '2026-10-04', '2026-10-09')")
+    conn.commit()
+    conn.close()
+
+    series = PriceSeriesStore(db_path).trend('Rice', 'day')
+    assert list(zip(series['period'].astype(str), series['market'], series['avg'])) == [
+        ('2026-10-03', 'Hubli', 35.0), ('2026-10-04', 'Dharwad', 45.0)]
@@ -0,0 +1,116 @@
+"""Materialized recommendations: batch job, generations, stale-while-revalidate"""
+
+import json
+import sqlite3
+
+import numpy as np
+import pytest
+
+from ml_recommender import MealRecommendationSystem
+from recommendation_cache import RecommendationCache
+from test_ml_recommender import _add_ingredients, _make_db
+
+
+@pytest.fixture
+def trained(tmp_path):
+    db_path = str(tmp_path / 'rec.db')
+    _make_db(db_path)
+    _add_ingredients(db_path, n=25)
+    rng = np.random.RandomState(7)
+    conn = sqlite3.connect(db_path)
+    for child_id in range(1, 31):
+        for _ in range(3):
+            names = list(rng.choice([f"ing{i}" for i in range(25)], size=4, replace=False))
+            conn.execute("INSERT INTO meal_plans (child_id, ingredients, total_cost, nutrition_score, "
+                         "created_at) VALUES (?, ?, 40, ?, '2024-07-01')",
+                         (child_id, json.dumps({name: 100 for name in names}), float(rng.uniform(50, 100))))
+    conn.commit()
+    conn.close()
+
+    recommender = MealRecommendationSystem(db_path=db_path)
+    recommender.train_all_models()
+    return recommender
+
+
+def test_get_recommendations_uses_trained_models(trained):
+    recommendations = trained.get_recommendations(4, 'hybrid', top_n=8)
+    assert len(recommendations) == 8
+    assert {rec['source'] for rec in recommendations} <= {'hybrid', 'collaborative', 'content-based'}
+    assert all(rec['category'] in ('grain', 'pulse', 'veg') for rec in recommendations)
+    assert trained.get_recommendations(4, 'svd', top_n=3)[0]['source'] == 'matrix-factorization'
+
+
+def test_batch_matches_single_child(trained):
+    batch = trained.get_hybrid_recommendations_batch([1, 2, 17], top_n=10)
+    for child_id in (1, 2, 17):
+        single = trained.get_hybrid_recommendations(child_id, top_n=10)
+        assert [name for name, _, _ in batch[child_id]] == [name for name, _, _ in single]
+        np.testing.assert_allclose([s for _, s, _ in batch[child_id]], [s for _, s, _ in single], rtol=1e-5)
+
+
+def test_materialized_reads_and_stale_refresh(trained):
+    cache = RecommendationCache(trained.db_path, top_n=12)
+    assert cache.materialize(trained) == 30
+
+    first = cache.get(trained, 5, top_n=6)
+    assert first == trained.get_recommendations(5, 'hybrid', top_n=12)[:6]
+    assert cache.get_stats()['db_hits'] == 1
+    assert cache.get(trained, 5, top_n=6) == first
+    assert cache.get_stats()['lru_hits'] == 1
+
+    # Stale rows are still served, then refreshed in the background
+    cache.invalidate(5)
+    assert cache.get(trained, 5, top_n=6) == first
+    cache._refresher.submit(lambda: None).result()
+    stats = cache.get_stats()
+    assert stats['stale_hits'] == 1 and stats['refreshes'] == 1
+
+    # A new training run is a new generation
+    trained.trained_at = 'next-generation'
+    cache.get(trained, 6)
+    cache._refresher.submit(lambda: None).result()
+    conn = sqlite3.connect(trained.db_path)
+    generation = conn.execute("SELECT generation_id FROM ml_recommendations WHERE child_id = 6").fetchone()[0]
+    conn.close()
+    assert generation == 'next-generation'
+
+    # Larger lists and other types are computed live
+    assert len(cache.get(trained, 5, top_n=20)) == 20
+    assert cache.get(trained, 5, 'content', top_n=3)[0]['source'] == 'content-based'
+
+
+def test_invalidation_reaches_other_workers(trained):
+    worker_a = RecommendationCache(trained.db_path, top_n=12)
+    worker_b = RecommendationCache(trained.db_path, top_n=12)
+    worker_a.materialize(trained)
+    first = worker_a.get(trained, 9)
+    assert worker_a.get(trained, 9) == first
+    assert worker_a.get_stats()['lru_hits'] == 1
+
+    # Invalidated in another worker: the LRU entry is no longer served as fresh
+    worker_b.invalidate(9)
+    assert worker_a.get(trained, 9) == first
+    worker_a._refresher.submit(lambda: None).result()
+    stats = worker_a.get_stats()
+    assert stats['lru_hits'] == 1 and stats['stale_hits'] == 1 and stats['refreshes'] == 1
+
+
+def test_empty_rows_are_misses(trained):
+    cache = RecommendationCache(trained.db_path, top_n=12)
+    cache.materialize(trained)
+    conn = sqlite3.connect(trained.db_path)
+    conn.execute("UPDATE ml_recommendations SET recommendations_json = '[]' WHERE child_id = 11")
+    conn.commit()
+    conn.close()
+
+    assert cache.get(trained, 11) == trained.get_recommendations(11, 'hybrid', top_n=12)[:10]
+    assert cache.get_stats()['misses'] == 1
+
+
+def test_collaborative_index_path_matches_sql(trained):
+    for child_id in (3, 8, 21):
+        from_index = trained.get_collaborative_recommendations(child_id, top_n=15)
+        plan_index, trained.plan_index = trained.plan_index, None
+        from_sql = trained.get_collaborative_recommendations(child_id, top_n=15)
+        trained.plan_index = plan_index
+        assert dict(from_index) == pytest.approx(dict(from_sql))
@@ -0,0 +1,40 @@
+"""Recommender benchmark: synthetic data, metrics and the JSON report"""
+
+import json
+import sqlite3
+
+import pytest
+
+from recommender_benchmark import (generate_dataset, latency_summary, precision_recall_at_k,
+                                   run_benchmark)
+
+
+def test_generate_dataset_holds_out_plans(tmp_path):
+    db_path = str(tmp_path / 'bench.db')
+    stats, holdout = generate_dataset(db_path, n_children=50, plans_per_child=5, n_ingredients=20,
+                                      holdout_plans=2)
+    conn = sqlite3.connect(db_path)
+    assert conn.execute("SELECT COUNT(*) FROM children").fetchone()[0] == 50
+    assert conn.execute("SELECT COUNT(*) FROM meal_plans").fetchone()[0] == stats['meal_plans'] == 150
+    assert conn.execute("SELECT MAX(cnt) FROM (SELECT COUNT(*) cnt FROM meal_plans GROUP BY child_id)").fetchone()[0] == 3
+    conn.close()
+    assert holdout and all(isinstance(names, set) and names for names in holdout.values())
+
+
+def test_metrics():
+    assert precision_recall_at_k(['a', 'b', 'c', 'd'], {'b', 'd', 'x'}, 4) == (0.5, pytest.approx(2 / 3))
+    summary = latency_summary(list(range(1, 101)))
+    assert summary['runs'] == 100 and summary['p50_ms'] == pytest.approx(50.5)
+    assert summary['p99_ms'] == pytest.approx(99.01)
+    assert latency_summary([]) == {'runs': 0}
+
+
+def test_report_is_json_and_learns(tmp_path):
+    report = run_benchmark(n_children=150, plans_per_child=6, n_ingredients=30, samples=40, k=5)
+    json.dumps(report)
+    assert set(report['latency']) == {'train_all_models', 'get_hybrid_recommendations', 'find_similar_children'}
+    assert report['latency']['get_hybrid_recommendations']['runs'] == 40
+    quality = report['quality']
+    assert set(quality) == {'hybrid', 'collaborative', 'content', 'svd'}
+    # Taste groups prefer a third of the ingredients; learning from plans beats that base rate
+    assert quality['svd']['precision@5'] > 1 / 3
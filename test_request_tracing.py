@@ -0,0 +1,47 @@
+"""Request tracing: level gating, sampling and phase timing headers"""
+
+from request_tracing import Tracer, timing_headers_enabled
+
+
+def test_level_gating_skips_formatting(capsys):
+    tracer = Tracer('t', level='INFO', sample_rate=1.0)
+
+    class Exploding:
+        def __str__(self):
+            raise AssertionError("formatted a suppressed message")
+
+    tracer.debug("row: %s", Exploding())
+    tracer.info("hello %s", 'world')
+    assert capsys.readouterr().out == "[INFO] t: hello world\n"
+
+
+def test_sampling_only_affects_debug(capsys):
+    tracer = Tracer('t', level='TRACE', sample_rate=0.0)
+    tracer.start()
+    tracer.debug("dropped")
+    tracer.trace("dropped")
+    tracer.error("kept")
+    captured = capsys.readouterr()
+    assert captured.out == ""
+    assert "[ERROR] t: kept" in captured.err
+
+
+def test_phase_headers():
+    trace = Tracer('t', sample_rate=1.0).start()
+    with trace.phase('db'):
+        pass
+    with trace.phase('db'):
+        pass
+    with trace.phase('predict'):
+        pass
+
+    headers = trace.headers()
+    assert headers['Server-Timing'].startswith('db;dur=')
+    assert {'X-Phase-Db-Ms', 'X-Phase-Predict-Ms', 'X-Phase-Total-Ms'} <= set(headers)
+
+
+def test_timing_headers_off_by_default(monkeypatch):
+    monkeypatch.delenv('TRACE_HEADERS', raising=False)
+    assert not timing_headers_enabled()
+    monkeypatch.setenv('TRACE_HEADERS', '1')
+    assert timing_headers_enabled()
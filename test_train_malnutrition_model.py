@@ -0,0 +1,55 @@
+"""Training pipeline: chunked CSV loading and parallel cross-validation"""
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import train_malnutrition_model as tm
+
+
+def _write_csv(path, n=240, seed=0):
+    rng = np.random.RandomState(seed)
+    df = pd.DataFrame({
+        'age_months': rng.uniform(6, 60, n),
+        'weight_kg': rng.uniform(5, 20, n),
+        'height_cm': rng.uniform(60, 115, n),
+        'muac_cm': rng.uniform(10, 17, n),
+        'bmi': 10.0,
+        'nutrition_status': rng.choice(['normal', 'moderate', 'severe'], n, p=[0.6, 0.3, 0.1]),
+    })
+    df.to_csv(path, index=False)
+    return df
+
+
+@pytest.fixture
+def training_data(tmp_path):
+    csv_path = tmp_path / 'data.csv'
+    _write_csv(csv_path)
+    return tm.load_and_preprocess_data(str(csv_path))
+
+
+def test_chunked_load_matches_full_read(tmp_path):
+    csv_path = tmp_path / 'data.csv'
+    df = _write_csv(csv_path)
+
+    X, y, encoder, feature_columns = tm.load_and_preprocess_data(str(csv_path), chunk_size=50)
+
+    assert feature_columns == tm.FEATURE_COLUMNS
+    assert X.shape == (len(df), 5) and X.dtype == np.float32
+    expected_bmi = df['weight_kg'] / (df['height_cm'] / 100.0) ** 2
+    np.testing.assert_allclose(X[:, 4], expected_bmi, rtol=1e-5)
+    assert list(encoder.inverse_transform(y)) == list(df['nutrition_status'])
+
+
+def test_parallel_cross_validation(training_data):
+    X, y = training_data[:2]
+    grid = {'n_estimators': [5], 'max_depth': [3, 6], 'min_samples_leaf': [2]}
+
+    results = tm.run_cross_validation(X, {'status': y}, {'status': grid}, n_folds=3, workers=2)
+
+    result = results['status']
+    assert len(result['candidates']) == 2
+    assert len(result['folds']) == 6
+    assert all(fold['fit_seconds'] >= 0 and fold['val_rows'] > 0 for fold in result['folds'])
+    assert result['best_params'] in [c['params'] for c in result['candidates']]
+    assert result['best_accuracy'] == pytest.approx(max(c['mean_accuracy'] for c in result['candidates']))
@@ -0,0 +1,139 @@
+"""Village economy: food_prices unique key, dedup migration and idempotent mandi sync"""
+
+import sqlite3
+
+import pytest
+
+import village_economy as ve
+
+
+RECORDS = [
+    {'commodity': 'Rice', 'market': 'Hubli', 'modal_price': '3500', 'arrival_date': '01/10/2026'},
+    {'commodity': 'Rice', 'market': 'Hubli', 'modal_price': '3600', 'arrival_date': '02/10/2026'},
+    {'commodity': 'Tomato', 'market': 'Gadag', 'modal_price': '2500', 'arrival_date': '02/10/2026'},
+    {'commodity': 'Saffron', 'market': 'Gadag', 'modal_price': '900000', 'arrival_date': '02/10/2026'},
+]
+
+
+class FakeMandiAPI:
+    def fetch_mandi_prices(self, state='Karnataka', limit=200):
+        return RECORDS
+
+
+@pytest.fixture
+def db_path(tmp_path, monkeypatch):
+    path = str(tmp_path / 'economy.db')
+    monkeypatch.setattr(ve, 'DB_PATH', path)
+    monkeypatch.setattr(ve, 'MANDI_API_AVAILABLE', True)
+    monkeypatch.setattr(ve, 'MandiPriceAPI', FakeMandiAPI, raising=False)
+    return path
+
+
+def food_prices(db_path):
+    conn = sqlite3.connect(db_path)
+    try:
+        return conn.execute("""
+            SELECT ingredient_name, village, price_per_kg, source FROM food_prices
+            ORDER BY ingredient_name, village, source
+        """).fetchall()
+    finally:
+        conn.close()
+
+
+def create_ingredients(db_path):
+    conn = sqlite3.connect(db_path)
+    conn.execute("""CREATE TABLE ingredients (id INTEGER PRIMARY KEY, name TEXT UNIQUE, category TEXT,
+                    calories_per_100g REAL, protein_per_100g REAL, fiber_per_100g REAL,
+                    iron_per_100g REAL, calcium_per_100g REAL)""")
+    conn.executemany("INSERT INTO ingredients (name, category, calories_per_100g, protein_per_100g, "
+                     "fiber_per_100g, iron_per_100g) VALUES (?, ?, 100, ?, 1, 1)",
+                     [('Rice', 'Grains', 7), ('Milk', 'Dairy', 3)])
+    conn.commit()
+    conn.close()
+
+
+def test_repeated_syncs_do_not_grow_food_prices(db_path):
+    ve.initialize_economy_tables()
+    for _ in range(3):
+        result = ve.sync_mandi_prices_to_economy()
+        assert result['success']
+    assert food_prices(db_path) == [('Rice', 'Hubli', 36.0, 'data.gov.in'),
+                                    ('Tomato', 'Gadag', 25.0, 'data.gov.in')]
+
+
+def test_migration_keeps_newest_duplicate(db_path):
+    conn = sqlite3.connect(db_path)
+    conn.execute("""
+        CREATE TABLE food_prices (
+            id INTEGER PRIMARY KEY AUTOINCREMENT, ingredient_name TEXT NOT NULL, village TEXT,
+            price_per_kg REAL NOT NULL, month TEXT NOT NULL, year INTEGER NOT NULL, source TEXT,
+            recorded_date DATE DEFAULT CURRENT_DATE, created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+    conn.executemany("""
+        INSERT INTO food_prices (ingredient_name, village, price_per_kg, month, year, source)
+        VALUES (?, ?, ?, 'October', 2026, ?)
+    """, [('Rice', 'Hubli', 30, 'data.gov.in'), ('Rice', 'Hubli', 31, 'data.gov.in'),
+          ('Rice', 'Hubli', 40, 'Market Survey'), ('Ragi', None, 55, None), ('Ragi', None, 56, None)])
+    conn.commit()
+    conn.close()
+
+    ve.initialize_economy_tables()
+    assert food_prices(db_path) == [('Ragi', None, 56.0, None),
+                                    ('Rice', 'Hubli', 40.0, 'Market Survey'),
+                                    ('Rice', 'Hubli', 31.0, 'data.gov.in')]
+
+
+def test_manual_price_update_replaces_this_months_entry(db_path):
+    analyzer = ve.VillageEconomyAnalyzer()
+    for price in (40, 42):
+        assert analyzer.add_price_update({'ingredient_name': 'Milk', 'price_per_kg': price})['success']
+    assert food_prices(db_path) == [('Milk', None, 42.0, 'Manual Entry')]
+
+
+def test_dashboard_queries_read_incremental_aggregates(db_path):
+    create_ingredients(db_path)
+    analyzer = ve.VillageEconomyAnalyzer()
+    for row in ({'ingredient_name': 'Rice', 'village': 'Hubli', 'price_per_kg': 40},
+                {'ingredient_name': 'Rice', 'village': 'Hubli', 'price_per_kg': 50, 'source': 'Survey'},
+                {'ingredient_name': 'Rice', 'village': 'Gadag', 'price_per_kg': 30},
+                {'ingredient_name': 'Milk', 'village': 'Hubli', 'price_per_kg': 60}):
+        analyzer.add_price_update(row)
+
+    cheapest = ve.get_cheapest_foods_this_month()
+    assert list(cheapest['ingredient_name']) == ['Rice', 'Milk']
+    assert cheapest['avg_price'].tolist() == [40.0, 60.0]
+    hubli = ve.get_cheapest_foods_this_month('Hubli')
+    assert hubli.set_index('ingredient_name')['avg_price'].to_dict() == {'Rice': 45.0, 'Milk': 60.0}
+
+    # A later update of the same key only moves its bucket
+    analyzer.add_price_update({'ingredient_name': 'Rice', 'village': 'Gadag', 'price_per_kg': 60})
+    assert ve.get_cheapest_foods_this_month('Gadag')['avg_price'].tolist() == [60.0]
+
+
+def test_spending_and_crop_month_lookups(db_path):
+    create_ingredients(db_path)
+    ve.initialize_economy_tables()
+    month, year = ve.datetime.now().strftime('%B'), ve.datetime.now().year
+    conn = sqlite3.connect(db_path)
+    cursor = conn.cursor()
+    ve._add_other_sample_data(cursor, month, year)
+    cursor.execute("""INSERT INTO local_crops (crop_name, village, availability_months)
+                      VALUES ('Mango', 'Hubballi', ?)""", ('April, May',))
+    ve._index_crop_months(cursor)
+    conn.commit()
+    conn.close()
+
+    spending = ve.get_junk_food_spending('Hubballi')
+    assert spending[['total_junk', 'total_spend', 'families']].values.tolist() == [[2000, 9500, 2]]
+    assert spending['junk_percentage'].tolist() == [round((1200 / 4700 + 800 / 4800) * 50, 2)]
+    assert ve.calculate_nutrition_economy_score()['total_families_tracked'] == 4
+
+    crops = ve.get_best_local_crops('Hubballi')
+    assert 'Tomato' in set(crops['crop_name'])
+    conn = sqlite3.connect(db_path)
+    mango_months = [m for (m,) in conn.execute(
+        "SELECT month FROM crop_availability ca JOIN local_crops lc ON lc.id = ca.crop_id "
+        "WHERE lc.crop_name = 'Mango' ORDER BY month")]
+    conn.close()
+    assert mango_months == ['April', 'May']
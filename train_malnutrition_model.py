@@ -1,17 +1,49 @@
 """
 Train Random Forest Model for Malnutrition Prediction using Real CSV Data
 Uses CUDA acceleration when available for faster training
+
+On CPU the CSV is streamed in chunks, and stratified k-fold CV over a
+hyperparameter grid runs in a process pool.
+
+Usage: python train_malnutrition_model.py [csv_path]
 """
 
 import pandas as pd
 import numpy as np
 import pickle
 import os
+import sys
+import time
+import itertools
+from concurrent.futures import ProcessPoolExecutor
 from datetime import datetime
 from sklearn.ensemble import RandomForestClassifier
-from sklearn.model_selection import train_test_split
+from sklearn.model_selection import train_test_split, StratifiedKFold
 from sklearn.metrics import classification_report, confusion_matrix, accuracy_score
 from sklearn.preprocessing import LabelEncoder
+from model_registry import ModelRegistry, MODEL_FILE, METADATA_FILE
+
+DEFAULT_CSV = 'malnutrition_data _ad.csv'
+FEATURE_COLUMNS = ['age_months', 'weight_kg', 'height_cm', 'muac_cm', 'bmi']
+
+# Rows per CSV chunk while streaming
+CHUNK_SIZE = int(os.environ.get('TRAIN_CHUNK_SIZE', 100_000))
+CV_FOLDS = int(os.environ.get('TRAIN_CV_FOLDS', 5))
+TRAIN_WORKERS = int(os.environ.get('TRAIN_WORKERS', os.cpu_count() or 1))
+
+# Fixed forest settings; the grids below are searched on top of these
+BASE_PARAMS = {
+    'min_samples_split': 10,
+    'max_features': 'sqrt',
+    'random_state': 42,
+    'class_weight': 'balanced',
+}
+DEFAULT_PARAMS = {'n_estimators': 200, 'max_depth': 15, 'min_samples_leaf': 4}
+PARAM_GRID = {
+    'n_estimators': [100, 200],
+    'max_depth': [10, 15],
+    'min_samples_leaf': [2, 4],
+}
 
 # Try to use CUDA-accelerated cuML if available
 USE_CUDA = False
@@ -24,51 +56,163 @@ except ImportError:
     print("⚠️  cuML not available - using CPU with optimized sklearn")
     print("   To enable GPU: pip install cuml-cu11 (requires NVIDIA GPU)")
 
-def load_and_preprocess_data(csv_path):
-    """Load CSV data and prepare for training"""
-    print(f"\n📂 Loading data from: {csv_path}")
+def read_csv_chunks(csv_path, chunk_size=CHUNK_SIZE):
+    """
+    Stream the training CSV in chunks with BMI recalculated
+
+    Only the feature and label columns are read, as float32 / category, so
+    state survey files with millions of rows never exist as one DataFrame.
+    """
+    dtypes = {col: np.float32 for col in FEATURE_COLUMNS}
+    dtypes['nutrition_status'] = 'category'
     
-    df = pd.read_csv(csv_path)
-    print(f"✅ Loaded {len(df)} samples")
-    print(f"\nColumns: {list(df.columns)}")
-    print(f"\nNutrition status distribution:")
-    print(df['nutrition_status'].value_counts())
+    for chunk in pd.read_csv(csv_path, usecols=FEATURE_COLUMNS + ['nutrition_status'],
+                             dtype=dtypes, chunksize=chunk_size):
+        chunk = chunk.dropna()
+        # Fix bad data: Recalculate BMI if it looks wrong (e.g. all 10.0)
+        # BMI = weight(kg) / (height(m))^2
+        height_m = chunk['height_cm'] / 100.0
+        chunk['bmi'] = (chunk['weight_kg'] / (height_m ** 2)).astype(np.float32)
+        yield chunk
+
+def load_and_preprocess_data(csv_path, chunk_size=CHUNK_SIZE):
+    """Load CSV data in chunks and prepare for training"""
+    print(f"\n📂 Loading data from: {csv_path} (chunks of {chunk_size:,} rows)")
     
-    # Fix bad data: Recalculate BMI if it looks wrong (e.g. all 10.0)
-    # BMI = weight(kg) / (height(m))^2
-    print("\n🛠️  Recalculating BMI from weight and height to ensure accuracy...")
-    df['height_m'] = df['height_cm'] / 100.0
-    df['bmi'] = df['weight_kg'] / (df['height_m'] ** 2)
+    feature_chunks = []
+    label_chunks = []
+    start_time = time.perf_counter()
+    for chunk in read_csv_chunks(csv_path, chunk_size):
+        feature_chunks.append(chunk[FEATURE_COLUMNS].to_numpy(dtype=np.float32))
+        label_chunks.append(chunk['nutrition_status'].astype(str).to_numpy())
     
-    # Prepare features and target
-    feature_columns = ['age_months', 'weight_kg', 'height_cm', 'muac_cm', 'bmi']
-    X = df[feature_columns].values
+    X = np.concatenate(feature_chunks) if feature_chunks else np.empty((0, len(FEATURE_COLUMNS)), np.float32)
+    labels = np.concatenate(label_chunks) if label_chunks else np.empty(0, dtype=object)
+    print(f"✅ Loaded {len(X)} samples from {len(feature_chunks)} chunks "
+          f"in {time.perf_counter() - start_time:.2f} seconds")
+    print(f"\nNutrition status distribution:")
+    print(pd.Series(labels).value_counts())
     
     # Encode target labels
     le = LabelEncoder()
-    y = le.fit_transform(df['nutrition_status'])
+    y = le.fit_transform(labels)
     
     print(f"\nFeatures shape: {X.shape}")
     print(f"Target classes: {le.classes_}")
     
-    return X, y, le, feature_columns
+    return X, y, le, list(FEATURE_COLUMNS)
 
-def train_model_cpu(X_train, y_train, X_test, y_test):
+# ==================== PARALLEL CROSS-VALIDATION ====================
+
+# Set once per pool worker by the initializer so X/y are not re-pickled per task
+_worker_data = {}
+
+def _init_cv_worker(X, targets):
+    _worker_data['X'] = X
+    _worker_data['targets'] = targets
+
+def _fit_fold(task):
+    """Fit and score one (target, params, fold) combination inside a pool worker"""
+    X = _worker_data['X']
+    y = _worker_data['targets'][task['target']]
+    
+    # Folds are recomputed from the fixed seed instead of shipping index arrays
+    skf = StratifiedKFold(n_splits=task['n_folds'], shuffle=True, random_state=42)
+    train_idx, val_idx = next(
+        split for i, split in enumerate(skf.split(X, y)) if i == task['fold']
+    )
+    
+    model = RandomForestClassifier(**{**BASE_PARAMS, **task['params'], 'n_jobs': 1})
+    
+    start_time = time.perf_counter()
+    model.fit(X[train_idx], y[train_idx])
+    fit_seconds = time.perf_counter() - start_time
+    
+    start_time = time.perf_counter()
+    y_pred = model.predict(X[val_idx])
+    predict_seconds = time.perf_counter() - start_time
+    
+    return {
+        'target': task['target'],
+        'params': task['params'],
+        'fold': task['fold'],
+        'accuracy': float(accuracy_score(y[val_idx], y_pred)),
+        'fit_seconds': round(fit_seconds, 3),
+        'predict_seconds': round(predict_seconds, 3),
+        'train_rows': len(train_idx),
+        'val_rows': len(val_idx),
+    }
+
+def parameter_grid(grid):
+    """Expand {'param': [values]} into a list of param dicts"""
+    keys = sorted(grid)
+    return [dict(zip(keys, values)) for values in itertools.product(*(grid[k] for k in keys))]
+
+def run_cross_validation(X, targets, param_grids, n_folds=CV_FOLDS, workers=TRAIN_WORKERS):
+    """
+    Stratified k-fold CV of every parameter combination for every target, in a process pool
+
+    Args:
+        X: feature matrix
+        targets: {target_name: y}
+        param_grids: {target_name: {'param': [values]}}
+        n_folds: number of stratified folds
+        workers: pool size (each fit is single-threaded)
+
+    Returns:
+        {target_name: {'best_params', 'best_accuracy', 'candidates', 'folds'}}
+    """
+    tasks = [
+        {'target': target, 'params': params, 'fold': fold, 'n_folds': n_folds}
+        for target, grid in param_grids.items()
+        for params in parameter_grid(grid)
+        for fold in range(n_folds)
+    ]
+    print(f"\n🔀 Cross-validation: {len(tasks)} fits ({n_folds} folds) on {workers} worker(s)")
+    
+    fold_results = []
+    start_time = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_cv_worker,
+                             initargs=(X, targets)) as pool:
+        for result in pool.map(_fit_fold, tasks):
+            print(f"   [{result['target']}] fold {result['fold'] + 1}/{n_folds} {result['params']}: "
+                  f"acc={result['accuracy']:.4f} fit={result['fit_seconds']:.2f}s "
+                  f"predict={result['predict_seconds']:.2f}s")
+            fold_results.append(result)
+    print(f"✅ Cross-validation completed in {time.perf_counter() - start_time:.2f} seconds")
+    
+    summary = {}
+    for target in param_grids:
+        candidates = []
+        for params in parameter_grid(param_grids[target]):
+            folds = [r for r in fold_results if r['target'] == target and r['params'] == params]
+            accuracies = [r['accuracy'] for r in folds]
+            candidates.append({
+                'params': params,
+                'mean_accuracy': float(np.mean(accuracies)),
+                'std_accuracy': float(np.std(accuracies)),
+                'mean_fit_seconds': float(np.mean([r['fit_seconds'] for r in folds])),
+            })
+        best = max(candidates, key=lambda c: c['mean_accuracy'])
+        summary[target] = {
+            'best_params': best['params'],
+            'best_accuracy': best['mean_accuracy'],
+            'candidates': candidates,
+            'folds': [r for r in fold_results if r['target'] == target],
+        }
+        print(f"🏆 [{target}] best {best['params']}: "
+              f"{best['mean_accuracy']:.4f} ± {best['std_accuracy']:.4f}")
+    
+    return summary
+
+def train_model_cpu(X_train, y_train, X_test, y_test, params=None):
     """Train Random Forest on CPU with optimizations"""
     print("\n🔧 Training Random Forest on CPU...")
     print("   Using optimized sklearn with parallel processing")
     
-    model = RandomForestClassifier(
-        n_estimators=200,  # More trees for better accuracy
-        max_depth=15,
-        min_samples_split=10,
-        min_samples_leaf=4,
-        max_features='sqrt',
-        random_state=42,
-        n_jobs=-1,  # Use all CPU cores
-        verbose=1,
-        class_weight='balanced'
-    )
+    model = RandomForestClassifier(**{**BASE_PARAMS, **(params or DEFAULT_PARAMS)},
+                                   n_jobs=-1,  # Use all CPU cores
+                                   verbose=1)
     
     start_time = datetime.now()
     model.fit(X_train, y_train)
@@ -115,35 +259,32 @@ def train_model_gpu(X_train, y_train, X_test, y_test):
     
     return model, accuracy
 
-def save_model(model, label_encoder, feature_columns, accuracy, model_path='models/malnutrition'):
-    """Save trained model and metadata"""
-    os.makedirs(model_path, exist_ok=True)
-    
-    # Save main model
-    model_file = os.path.join(model_path, 'trained_model.pkl')
-    with open(model_file, 'wb') as f:
-        pickle.dump(model, f)
-    print(f"\n💾 Model saved: {model_file}")
-    
-    # Save label encoder
-    encoder_file = os.path.join(model_path, 'label_encoder.pkl')
-    with open(encoder_file, 'wb') as f:
-        pickle.dump(label_encoder, f)
-    print(f"💾 Label encoder saved: {encoder_file}")
-    
-    # Save metadata
-    metadata = {
-        'training_date': datetime.now().isoformat(),
-        'accuracy': accuracy,
-        'feature_columns': feature_columns,
-        'classes': label_encoder.classes_.tolist(),
-        'use_cuda': USE_CUDA
-    }
+def save_model(model, label_encoder, feature_columns, accuracy, model_path='models/malnutrition',
+               extra_metadata=None):
+    """
+    Register the trained model as a new version in the model registry
+
+    Earlier versions are kept; the new one becomes CURRENT (if it has a
+    compiled forest) and running servers hot-swap to it without a restart.
+    """
+    registry = ModelRegistry(os.path.join(model_path, 'registry'))
+    version = registry.register(
+        model, label_encoder, feature_columns, accuracy,
+        promote=True, extra_metadata={'use_cuda': USE_CUDA, **(extra_metadata or {})}
+    )
+    version_dir = registry.version_dir(version)
+    metadata = registry.get_metadata(version)
     
-    metadata_file = os.path.join(model_path, 'model_metadata.pkl')
-    with open(metadata_file, 'wb') as f:
-        pickle.dump(metadata, f)
-    print(f"💾 Metadata saved: {metadata_file}")
+    print(f"\n💾 Model saved: {os.path.join(version_dir, MODEL_FILE)}")
+    if metadata['compiled']:
+        print(f"💾 Compiled forest saved: {os.path.join(version_dir, 'trained_model.forest')}")
+    print(f"💾 Metadata saved: {os.path.join(version_dir, METADATA_FILE)}")
+    if registry.get_current_version() == version:
+        print(f"💾 Registered version {version} (checksum {metadata['checksum'][:12]}...) and set as CURRENT")
+    else:
+        print(f"💾 Registered version {version} (checksum {metadata['checksum'][:12]}...); "
+              f"not servable without a compiled forest, CURRENT unchanged")
+    return version
 
 def main():
     print("="*80)
@@ -151,7 +292,7 @@ def main():
     print("="*80)
     
     # Load data
-    csv_path = 'malnutrition_data _ad.csv'
+    csv_path = sys.argv[1] if len(sys.argv) > 1 else DEFAULT_CSV
     X, y, label_encoder, feature_columns = load_and_preprocess_data(csv_path)
     
     # Split data
@@ -163,10 +304,17 @@ def main():
     print(f"   Testing samples: {len(X_test)}")
     
     # Train model (GPU or CPU)
+    cv_results = None
     if USE_CUDA:
         model, accuracy = train_model_gpu(X_train, y_train, X_test, y_test)
     else:
-        model, accuracy = train_model_cpu(X_train, y_train, X_test, y_test)
+        # Search hyperparameters on the training split only; the test split stays held out
+        cv_results = run_cross_validation(
+            X_train, {'nutrition_status': y_train}, {'nutrition_status': PARAM_GRID}
+        )
+        model, accuracy = train_model_cpu(
+            X_train, y_train, X_test, y_test, params=cv_results['nutrition_status']['best_params']
+        )
     
     # Detailed evaluation
     print("\n" + "="*80)
@@ -190,7 +338,14 @@ def main():
             print(f"   {feat:20s}: {imp:.4f}")
     
     # Save model
-    save_model(model, label_encoder, feature_columns, accuracy)
+    extra_metadata = None
+    if cv_results:
+        extra_metadata = {
+            'cv_folds': CV_FOLDS,
+            'cv': {target: {key: result[key] for key in ('best_params', 'best_accuracy', 'candidates', 'folds')}
+                   for target, result in cv_results.items()},
+        }
+    save_model(model, label_encoder, feature_columns, accuracy, extra_metadata=extra_metadata)
     
     print("\n" + "="*80)
     print("   ✅ MODEL TRAINING COMPLETE!")
@@ -198,7 +353,7 @@ def main():
     print(f"\n📊 Final Accuracy: {accuracy*100:.2f}%")
     print(f"🎯 Ready for predictions!")
     print("\nNext steps:")
-    print("  1. Restart Flask server to load new model")
+    print("  1. Running servers hot-swap to the new CURRENT version within a few seconds")
     print("  2. Test predictions at /malnutrition-prediction")
     print("="*80)
 
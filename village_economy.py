@@ -11,6 +11,9 @@ from datetime import datetime, timedelta
 import json
 import os
 
+from nutrient_density import POOLED, get_nutrient_density_index, install_change_tracking
+from price_series import get_price_series
+
 # Import Mandi Price API for real-time government prices
 try:
     from mandi_price_api import MandiPriceAPI
@@ -19,9 +22,154 @@ except ImportError:
     MANDI_API_AVAILABLE = False
     print("Warning: Mandi Price API not available. Using local data only.")
 
+DB_PATH = 'nutrition_advisor.db'
+
 def get_connection():
     """Create database connection"""
-    return sqlite3.connect('nutrition_advisor.db')
+    return sqlite3.connect(DB_PATH)
+
+# One price per ingredient, village, month and source; NULL village/source count as ''
+FOOD_PRICE_KEY = "ingredient_name, IFNULL(village, ''), month, year, IFNULL(source, '')"
+
+FOOD_PRICE_UPSERT = f"""
+    INSERT INTO food_prices (ingredient_name, village, price_per_kg, month, year, source)
+    VALUES (?, ?, ?, ?, ?, ?)
+    ON CONFLICT({FOOD_PRICE_KEY}) DO UPDATE SET
+        price_per_kg = excluded.price_per_kg,
+        recorded_date = CURRENT_DATE,
+        created_at = CURRENT_TIMESTAMP
+"""
+
+def _ensure_food_prices_key(cursor):
+    """
+    Unique key on food_prices (migration)
+    
+    Older databases have duplicate rows from repeated syncs; the newest row
+    of each key is kept.
+    """
+    exists = cursor.execute(
+        "SELECT 1 FROM sqlite_master WHERE type = 'index' AND name = 'idx_food_prices_key'"
+    ).fetchone()
+    if exists:
+        return
+    cursor.execute(f"""
+        DELETE FROM food_prices
+        WHERE id NOT IN (SELECT MAX(id) FROM food_prices GROUP BY {FOOD_PRICE_KEY})
+    """)
+    cursor.execute(f"CREATE UNIQUE INDEX idx_food_prices_key ON food_prices({FOOD_PRICE_KEY})")
+
+def upsert_food_prices(cursor, rows):
+    """Insert or update (ingredient, village, price, month, year, source) rows in one executemany"""
+    rows = list(rows)
+    cursor.executemany(FOOD_PRICE_UPSERT, rows)
+    _refresh_price_aggregates(cursor, {(row[0], row[1] or '', row[3], row[4]) for row in rows})
+
+def _month_number(month):
+    try:
+        return datetime.strptime(month, '%B').month
+    except (TypeError, ValueError):
+        return 0
+
+# ==================== PRECOMPUTED AGGREGATES ====================
+# Dashboard queries read these instead of grouping the raw tables; every
+# write path refreshes only the (month, village, ...) buckets it touched.
+
+def _ensure_economy_aggregates(cursor):
+    """Create the aggregate tables and fill them from existing rows on first use"""
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS food_price_monthly (
+            year INTEGER NOT NULL,
+            month_num INTEGER NOT NULL,
+            month TEXT NOT NULL,
+            village TEXT NOT NULL,
+            ingredient_name TEXT NOT NULL,
+            price_sum REAL NOT NULL,
+            price_count INTEGER NOT NULL,
+            PRIMARY KEY (year, month_num, village, ingredient_name)
+        ) WITHOUT ROWID
+    """)
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS village_spending_monthly (
+            village TEXT NOT NULL,
+            year INTEGER NOT NULL,
+            month_num INTEGER NOT NULL,
+            month TEXT NOT NULL,
+            nutritious_sum REAL,
+            junk_sum REAL,
+            total_sum REAL,
+            families INTEGER,
+            junk_percentage REAL,
+            PRIMARY KEY (village, year, month_num)
+        ) WITHOUT ROWID
+    """)
+    # local_crops.availability_months split into one row per (month, crop)
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS crop_availability (
+            month TEXT NOT NULL,
+            crop_id INTEGER NOT NULL,
+            PRIMARY KEY (month, crop_id)
+        ) WITHOUT ROWID
+    """)
+    cursor.execute("""
+        CREATE INDEX IF NOT EXISTS idx_family_spending_village_month
+        ON family_spending(village, year, month)
+    """)
+
+    if cursor.execute("SELECT 1 FROM food_price_monthly LIMIT 1").fetchone() is None:
+        _refresh_price_aggregates(cursor, set(cursor.execute(
+            "SELECT DISTINCT ingredient_name, IFNULL(village, ''), month, year FROM food_prices"
+        ).fetchall()))
+    if cursor.execute("SELECT 1 FROM village_spending_monthly LIMIT 1").fetchone() is None:
+        _refresh_spending_aggregates(cursor, set(cursor.execute(
+            "SELECT DISTINCT village, month, year FROM family_spending"
+        ).fetchall()))
+    _index_crop_months(cursor)
+
+def _refresh_price_aggregates(cursor, keys):
+    """Recompute food_price_monthly for (ingredient, village, month, year) keys"""
+    cursor.executemany("""
+        INSERT OR REPLACE INTO food_price_monthly
+        (year, month_num, month, village, ingredient_name, price_sum, price_count)
+        SELECT year, ?, month, IFNULL(village, ''), ingredient_name, SUM(price_per_kg), COUNT(*)
+        FROM food_prices
+        WHERE ingredient_name = ? AND IFNULL(village, '') = ? AND month = ? AND year = ?
+        GROUP BY ingredient_name, IFNULL(village, ''), month, year
+    """, [(_month_number(month), ingredient, village, month, year)
+          for ingredient, village, month, year in keys])
+
+def _refresh_spending_aggregates(cursor, keys):
+    """Recompute village_spending_monthly for (village, month, year) keys"""
+    cursor.executemany("""
+        INSERT OR REPLACE INTO village_spending_monthly
+        (village, year, month_num, month, nutritious_sum, junk_sum, total_sum, families, junk_percentage)
+        SELECT village, year, ?, month,
+               SUM(nutritious_food_spend), SUM(junk_food_spend), SUM(total_food_spend),
+               COUNT(DISTINCT family_id),
+               ROUND(AVG(junk_food_spend * 100.0 / NULLIF(total_food_spend, 0)), 2)
+        FROM family_spending
+        WHERE village = ? AND month = ? AND year = ?
+        GROUP BY village, year, month
+    """, [(_month_number(month), village, month, year) for village, month, year in keys])
+
+def _index_crop_months(cursor):
+    """Add crop_availability rows for local_crops not indexed yet"""
+    crops = cursor.execute("""
+        SELECT id, availability_months FROM local_crops
+        WHERE id NOT IN (SELECT crop_id FROM crop_availability)
+    """).fetchall()
+    cursor.executemany(
+        "INSERT OR IGNORE INTO crop_availability (month, crop_id) VALUES (?, ?)",
+        [(month.strip(), crop_id) for crop_id, months in crops
+         for month in (months or '').split(',') if month.strip()]
+    )
+
+def _record_price_series(rows):
+    """Add food_prices rows (ingredient, village, price, month, year, source) to the price time series"""
+    today = datetime.now().date()
+    get_price_series(DB_PATH).record_many(
+        (ingredient, village, today, price, None, None, source)
+        for ingredient, village, price, _month, _year, source in rows
+    )
 
 def initialize_economy_tables():
     """Initialize tables for village nutrition economy tracking"""
@@ -42,6 +190,7 @@ def initialize_economy_tables():
             created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
         )
     """)
+    _ensure_food_prices_key(cursor)
     
     # Local crops and seasonal availability
     cursor.execute("""
@@ -103,7 +252,10 @@ def initialize_economy_tables():
         )
     """)
     
+    _ensure_economy_aggregates(cursor)
+    
     conn.commit()
+    install_change_tracking(conn)
     conn.close()
     print("✅ Village Nutrition Economy tables initialized!")
 
@@ -130,11 +282,11 @@ class VillageEconomyAnalyzer:
             'avg_monthly_spend': 4500
         }
     
-    def get_cheapest_nutritious_foods(self, village=None, limit=20):
+    def get_cheapest_nutritious_foods(self, village=None, limit=20, category=None, max_price=None):
         """Get cheapest nutritious foods this month"""
-        df = get_cheapest_foods_this_month(village if village else None)
-        if df.empty:
-            # Return sample data if no data available
+        df = get_cheapest_foods_this_month(village if village else None, limit, category, max_price)
+        if df.empty and category is None and max_price is None:
+            # Return sample data if no data available (a filter that matches nothing stays empty)
             return self._get_sample_cheapest_foods()
         return df.to_dict('records')
     
@@ -178,18 +330,17 @@ class VillageEconomyAnalyzer:
         conn = get_connection()
         cursor = conn.cursor()
         try:
-            cursor.execute("""
-                INSERT INTO food_prices (ingredient_name, village, price_per_kg, month, year, source)
-                VALUES (?, ?, ?, ?, ?, ?)
-            """, (
+            row = (
                 data.get('ingredient_name'),
                 data.get('village'),
                 data.get('price_per_kg'),
                 datetime.now().strftime('%B'),
                 datetime.now().year,
                 data.get('source', 'Manual Entry')
-            ))
+            )
+            upsert_food_prices(cursor, [row])
             conn.commit()
+            _record_price_series([row])
             return {'success': True, 'message': 'Price updated successfully'}
         except Exception as e:
             return {'success': False, 'error': str(e)}
@@ -235,40 +386,14 @@ class VillageEconomyAnalyzer:
         ]
 
 
-def get_cheapest_foods_this_month(village=None):
-    """Get cheapest nutritious foods for current month"""
-    conn = get_connection()
-    current_month = datetime.now().strftime('%B')
-    current_year = datetime.now().year
-    
-    query = """
-        SELECT 
-            fp.ingredient_name,
-            fp.village,
-            AVG(fp.price_per_kg) as avg_price,
-            i.calories_per_100g,
-            i.protein_per_100g,
-            i.category,
-            (i.protein_per_100g * 2 + i.fiber_per_100g + i.iron_per_100g) / AVG(fp.price_per_kg) as nutrition_per_rupee
-        FROM food_prices fp
-        LEFT JOIN ingredients i ON fp.ingredient_name = i.name
-        WHERE fp.month = ? AND fp.year = ?
-    """
-    params = [current_month, current_year]
-    
-    if village:
-        query += " AND fp.village = ?"
-        params.append(village)
-    
-    query += """
-        GROUP BY fp.ingredient_name
-        ORDER BY nutrition_per_rupee DESC
-        LIMIT 20
-    """
-    
-    df = pd.read_sql_query(query, conn, params=params)
-    conn.close()
-    return df
+def get_cheapest_foods_this_month(village=None, limit=20, category=None, max_price=None):
+    """Get cheapest nutritious foods for current month (best nutrition per rupee first)"""
+    foods = get_nutrient_density_index(DB_PATH).top_k(
+        limit, market=village or POOLED, profile='economy', category=category, max_price=max_price)
+    
+    df = pd.DataFrame(foods, columns=['ingredient_name', 'village', 'price', 'calories_per_100g',
+                                      'protein_per_100g', 'category', 'score'])
+    return df.rename(columns={'price': 'avg_price', 'score': 'nutrition_per_rupee'})
 
 def get_best_local_crops(village=None):
     """Get local crops offering best nutrition value"""
@@ -288,11 +413,12 @@ def get_best_local_crops(village=None):
             i.fiber_per_100g,
             i.iron_per_100g,
             i.calcium_per_100g
-        FROM local_crops lc
+        FROM crop_availability ca
+        JOIN local_crops lc ON lc.id = ca.crop_id
         LEFT JOIN ingredients i ON lc.crop_name = i.name
-        WHERE lc.availability_months LIKE ?
+        WHERE ca.month = ?
     """
-    params = [f'%{current_month}%']
+    params = [current_month]
     
     if village:
         query += " AND lc.village = ?"
@@ -305,31 +431,31 @@ def get_best_local_crops(village=None):
     return df
 
 def get_junk_food_spending(village=None, months=6):
-    """Analyze junk food vs nutritious food spending"""
+    """Analyze junk food vs nutritious food spending (last `months` spending months)"""
     conn = get_connection()
+    start = datetime.now().date().replace(day=1) - pd.DateOffset(months=months - 1)
     
     query = """
         SELECT 
             village,
             month,
             year,
-            SUM(nutritious_food_spend) as total_nutritious,
-            SUM(junk_food_spend) as total_junk,
-            SUM(total_food_spend) as total_spend,
-            COUNT(DISTINCT family_id) as families,
-            ROUND(AVG(junk_food_spend * 100.0 / NULLIF(total_food_spend, 0)), 2) as junk_percentage
-        FROM family_spending
-        WHERE created_at >= date('now', '-' || ? || ' months')
+            nutritious_sum as total_nutritious,
+            junk_sum as total_junk,
+            total_sum as total_spend,
+            families,
+            junk_percentage
+        FROM village_spending_monthly
+        WHERE year * 100 + month_num >= ?
     """
-    params = [months]
+    params = [start.year * 100 + start.month]
     
     if village:
         query += " AND village = ?"
         params.append(village)
     
     query += """
-        GROUP BY village, month, year
-        ORDER BY year DESC, month DESC
+        ORDER BY year DESC, month_num DESC
     """
     
     df = pd.read_sql_query(query, conn, params=params)
@@ -337,27 +463,22 @@ def get_junk_food_spending(village=None, months=6):
     return df
 
 def get_price_trends(ingredient_name, months=12):
-    """Get price trends for a specific ingredient"""
-    conn = get_connection()
-    
-    df = pd.read_sql_query("""
-        SELECT 
-            month,
-            year,
-            village,
-            AVG(price_per_kg) as avg_price,
-            MIN(price_per_kg) as min_price,
-            MAX(price_per_kg) as max_price,
-            COUNT(*) as records
-        FROM food_prices
-        WHERE ingredient_name = ?
-        AND created_at >= date('now', '-' || ? || ' months')
-        GROUP BY month, year, village
-        ORDER BY year DESC, month DESC
-    """, conn, params=[ingredient_name, months])
-    
-    conn.close()
-    return df
+    """Get monthly price trends for a specific ingredient (by price date, from the monthly rollups)"""
+    start = (datetime.now().date().replace(day=1) - pd.DateOffset(months=months - 1)).date()
+    series = get_price_series(DB_PATH).trend(ingredient_name, 'month', start=start)
+    
+    df = pd.DataFrame({
+        'period': series['period'],
+        'village': series['market'],
+        'avg_price': series['avg'],
+        'min_price': series['min'],
+        'max_price': series['max'],
+        'records': series['observations'],
+    })
+    df['month'] = pd.to_datetime(df['period']).dt.strftime('%B')
+    df['year'] = pd.to_datetime(df['period']).dt.year
+    df = df.sort_values(['period', 'village'], ascending=[False, True])
+    return df[['month', 'year', 'village', 'avg_price', 'min_price', 'max_price', 'records']].reset_index(drop=True)
 
 def calculate_nutrition_economy_score(village=None):
     """Calculate overall nutrition economy score for a village"""
@@ -386,7 +507,10 @@ def get_cost_effective_recommendations(village=None, budget=1000):
     """Get cost-effective nutrition recommendations"""
     cheapest_foods = get_cheapest_foods_this_month(village)
     local_crops = get_best_local_crops(village)
-    
+    return build_recommendations(cheapest_foods, local_crops)
+
+def build_recommendations(cheapest_foods, local_crops):
+    """Recommendations from cheapest-food and local-crop frames (best first)"""
     recommendations = []
     
     # Recommend cheapest nutritious foods
@@ -422,6 +546,7 @@ def add_sample_economy_data():
     
     current_month = datetime.now().strftime('%B')
     current_year = datetime.now().year
+    sample_rows = []
     
     # First, try to fetch real prices from Mandi API
     if MANDI_API_AVAILABLE:
@@ -433,38 +558,39 @@ def add_sample_economy_data():
             ingredients_to_fetch = ['Rice', 'Wheat', 'Potato', 'Tomato', 'Onion', 'Banana', 
                                    'Jowar', 'Ragi', 'Moong Dal', 'Spinach', 'Carrot']
             
+            fetched_rows = []
             for ingredient in ingredients_to_fetch:
                 price_info = mandi_api.get_ingredient_price(ingredient, "Hubli")
                 if price_info and price_info['price_per_kg'] > 0:
-                    cursor.execute("""
-                        INSERT OR REPLACE INTO food_prices 
-                        (ingredient_name, village, price_per_kg, month, year, source)
-                        VALUES (?, ?, ?, ?, ?, ?)
-                    """, (
+                    row = (
                         ingredient, 
                         'Hubballi', 
                         price_info['price_per_kg'],
                         current_month,
                         current_year,
                         f"data.gov.in - {price_info.get('market', 'Mandi')}"
-                    ))
+                    )
+                    fetched_rows.append(row)
                     print(f"  ✅ {ingredient}: ₹{price_info['price_per_kg']:.2f}/kg (from {price_info.get('market')})")
             
+            upsert_food_prices(cursor, fetched_rows)
             conn.commit()
+            _record_price_series(fetched_rows)
             print("✅ Real mandi prices fetched and saved!")
             
         except Exception as e:
             print(f"⚠️ Error fetching mandi prices: {e}")
             print("   Using sample data instead...")
-            _add_sample_prices(cursor, current_month, current_year)
+            sample_rows = _add_sample_prices(cursor, current_month, current_year)
     else:
-        _add_sample_prices(cursor, current_month, current_year)
+        sample_rows = _add_sample_prices(cursor, current_month, current_year)
     
     # Add other sample data (local crops, spending, etc.)
     _add_other_sample_data(cursor, current_month, current_year)
     
     conn.commit()
     conn.close()
+    _record_price_series(sample_rows)
     print("✅ Sample economy data added!")
 
 def _add_sample_prices(cursor, current_month, current_year):
@@ -482,10 +608,8 @@ def _add_sample_prices(cursor, current_month, current_year):
         ('Jowar (Sorghum)', 'Dharwad', 50, current_month, current_year, 'Local Farm'),
     ]
     
-    cursor.executemany("""
-        INSERT OR IGNORE INTO food_prices (ingredient_name, village, price_per_kg, month, year, source)
-        VALUES (?, ?, ?, ?, ?, ?)
-    """, sample_prices)
+    upsert_food_prices(cursor, sample_prices)
+    return sample_prices
 
 def _add_other_sample_data(cursor, current_month, current_year):
     """Add sample local crops, spending, education sessions data"""
@@ -502,6 +626,7 @@ def _add_other_sample_data(cursor, current_month, current_year):
         INSERT INTO local_crops (crop_name, village, season, avg_price_per_kg, nutrition_score, availability_months, is_locally_grown)
         VALUES (?, ?, ?, ?, ?, ?, ?)
     """, sample_crops)
+    _index_crop_months(cursor)
     
     # Sample family spending
     sample_spending = [
@@ -515,6 +640,7 @@ def _add_other_sample_data(cursor, current_month, current_year):
         INSERT INTO family_spending (family_id, village, month, year, nutritious_food_spend, junk_food_spend, total_food_spend, notes)
         VALUES (?, ?, ?, ?, ?, ?, ?, ?)
     """, sample_spending)
+    _refresh_spending_aggregates(cursor, {(row[1], row[2], row[3]) for row in sample_spending})
     
     # Sample education sessions
     sample_sessions = [
@@ -547,6 +673,7 @@ def sync_mandi_prices_to_economy():
         print("⚠️ Mandi Price API not available")
         return {'success': False, 'error': 'API not available'}
     
+    initialize_economy_tables()
     conn = get_connection()
     cursor = conn.cursor()
     
@@ -557,6 +684,8 @@ def sync_mandi_prices_to_economy():
         mandi_api = MandiPriceAPI()
         updated = []
         failed = []
+        price_rows = []
+        series_rows = []
         
         # Fetch all Karnataka mandi prices
         prices = mandi_api.fetch_mandi_prices(state="Karnataka", limit=200)
@@ -573,11 +702,7 @@ def sync_mandi_prices_to_economy():
                 # Map commodity to our ingredient name
                 ingredient_name = _map_commodity_to_ingredient(commodity)
                 if ingredient_name:
-                    cursor.execute("""
-                        INSERT OR REPLACE INTO food_prices 
-                        (ingredient_name, village, price_per_kg, month, year, source)
-                        VALUES (?, ?, ?, ?, ?, ?)
-                    """, (
+                    price_rows.append((
                         ingredient_name,
                         market,
                         price_per_kg,
@@ -585,9 +710,21 @@ def sync_mandi_prices_to_economy():
                         current_year,
                         'data.gov.in'
                     ))
+                    series_rows.append((
+                        ingredient_name,
+                        market,
+                        price.get('arrival_date'),
+                        price_per_kg,
+                        float(price.get('min_price', 0) or 0) / 100 or None,
+                        float(price.get('max_price', 0) or 0) / 100 or None,
+                        'data.gov.in'
+                    ))
                     updated.append({'ingredient': ingredient_name, 'price': price_per_kg, 'market': market})
         
+        # One transaction; repeated syncs update the month's rows in place
+        upsert_food_prices(cursor, price_rows)
         conn.commit()
+        get_price_series(DB_PATH).record_many(series_rows)
         print(f"✅ Synced {len(updated)} prices from mandi API")
         
         return {